@@ -0,0 +1,17 @@
+import json
+import os
+
+
+def atomic_write(path, write):
+    # write(f) fills a temp file that is then swapped in for path, so a crash leaves either the
+    # old file or the new one, never a half-written one
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def atomic_write_json(path, data, **kwargs):
+    atomic_write(path, lambda f: json.dump(data, f, **kwargs))
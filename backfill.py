@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+
+import discord
+
+from atomicfile import atomic_write_json
+from jobs import Job
+from ratelimit import RateLimiter, retry_after_from
+
+
+class HistoryBackfill(Job):
+    # Imports channel history older than what on_message captured. Channels are paged oldest
+    # first by a pool of workers and written to the store in large batches. After every batch the
+    # last imported message ID is checkpointed, so a rerun only fetches what is new since then.
+    def __init__(self, bot, channel_ids, checkpoint_file, concurrency=4, batch_size=1000, limiter=None, max_retries=5, on_progress=None):
+        super().__init__(on_progress)
+        self.bot = bot
+        self.channel_ids = list(dict.fromkeys(int(channel_id) for channel_id in channel_ids))
+        self.checkpoint_file = checkpoint_file
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.checkpoints = {}  # str(channel_id) -> last imported message ID
+        self.fetched = 0
+        self.imported = 0
+        self.channels_done = 0
+        self.channels_failed = 0
+        self.total = len(self.channel_ids)
+
+    def load_checkpoints(self):
+        try:
+            with open(self.checkpoint_file, "r") as f:
+                self.checkpoints = {channel_id: int(message_id) for channel_id, message_id in json.load(f).items()}
+        except FileNotFoundError:
+            self.checkpoints = {}
+        except (ValueError, AttributeError) as e:
+            self.bot.log_message(f"Ignoring unreadable backfill checkpoints: {e}")
+            self.checkpoints = {}
+
+    def save_checkpoints(self):
+        atomic_write_json(self.checkpoint_file, self.checkpoints)
+
+    def stats(self):
+        return {
+            "total": self.total,
+            "channels_done": self.channels_done,
+            "channels_failed": self.channels_failed,
+            "fetched": self.fetched,
+            "imported": self.imported,
+            "rate": self.rate(self.fetched),
+            "elapsed": self.elapsed(),
+            "running": self.running,
+        }
+
+    async def run(self):
+        self.start()
+        os.makedirs(os.path.dirname(self.checkpoint_file) or ".", exist_ok=True)
+        self.load_checkpoints()
+        self.bot.log_message(f"History backfill: {self.total} channels, {len(self.checkpoints)} with checkpoints")
+        self.report()
+        try:
+            await self.run_workers(self.channel_ids, self.backfill_one, self.concurrency)
+        finally:
+            self.finish()
+            self.report()
+
+        stats = self.stats()
+        state = "cancelled" if self.cancelled else "finished"
+        self.bot.log_message(f"History backfill {state}: {stats['imported']} messages imported from {stats['channels_done']} channels "
+                             f"({stats['channels_failed']} failed) in {stats['elapsed']:.0f}s, {stats['rate']:.0f} msg/s")
+        return stats
+
+    async def backfill_one(self, channel_id):
+        if await self.backfill_channel(channel_id):
+            self.channels_done += 1
+        else:
+            self.channels_failed += 1
+        self.report()
+
+    async def backfill_channel(self, channel_id):
+        for attempt in range(self.max_retries):
+            if self.cancelled:
+                return False
+            try:
+                await self.fetch_channel(channel_id)
+                return not self.cancelled
+            except discord.Forbidden:
+                self.bot.log_message(f"Backfill: no access to history of channel {channel_id}")
+                return False
+            except discord.NotFound:
+                self.bot.log_message(f"Backfill: channel {channel_id} not found")
+                return False
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    self.bot.log_message(f"Backfill: error in channel {channel_id}: {e}")
+                    return False
+                # Resumes from the last checkpoint, nothing already imported is fetched again
+                delay = retry_after_from(e, default=1.0) if e.status == 429 else 1.0
+                if e.status == 429:
+                    self.limiter.block(f"history:{channel_id}", delay)
+                await asyncio.sleep(max(delay, 2 ** attempt))
+            except Exception as e:
+                self.bot.log_message(f"Backfill: error in channel {channel_id}: {e}")
+                return False
+        return False
+
+    async def fetch_channel(self, channel_id):
+        channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+        after = self.checkpoints.get(str(channel_id))
+        route = f"history:{channel_id}"
+        batch = []
+        count = 0
+        async for message in channel.history(limit=None, after=discord.Object(after) if after else None, oldest_first=True):
+            if self.cancelled:
+                break
+            if count % 100 == 0:
+                await self.limiter.acquire(route)  # One token per page of 100 messages
+            count += 1
+            self.fetched += 1
+            batch.append({
+                "user_id": message.author.id,
+                "content": message.content,
+                "created_at": message.created_at.timestamp(),
+                "message_id": message.id,
+            })
+            if len(batch) >= self.batch_size:
+                await self.import_batch(channel_id, batch)
+                batch = []
+        if batch:
+            await self.import_batch(channel_id, batch)
+
+    async def import_batch(self, channel_id, batch):
+        added = await self.bot.import_messages(channel_id, batch)
+        self.imported += added  # Not "+= await": other workers update the count while this one waits
+        self.checkpoints[str(channel_id)] = batch[-1]["message_id"]
+        self.save_checkpoints()
+        self.report()
@@ -0,0 +1,496 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import discord
+
+from bot import FriendBot
+from export import MessageExport
+from rules import Rule, RuleSet
+from storage import open_message_store, ChannelHistoryCache
+
+WORDS = ["hello", "friend", "server", "channel", "message", "discord", "python", "bot", "yes", "no", "maybe",
+         "tomorrow", "games", "music", "update", "release", "patch", "bug", "fix", "thanks", "lol", "ok"]
+
+
+class FakeUser:
+    def __init__(self, user_id, name, bot=False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.created_at = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        self.dm_channel = None
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakePermissions:
+    read_messages = True
+
+
+class FakeChannel:
+    def __init__(self, channel_id, name, guild):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.sent = 0
+
+    @property
+    def members(self):
+        return self.guild.members
+
+    def permissions_for(self, member):
+        return FakePermissions
+
+    async def send(self, content=None, files=None):
+        self.sent += 1
+        return FakeMessage(next_id(), self.guild.me, self, content)
+
+
+class FakeGuild:
+    def __init__(self, guild_id, name, me):
+        self.id = guild_id
+        self.name = name
+        self.me = me
+        self.members = []
+        self.text_channels = []
+        self.filesize_limit = 25 * 1024 * 1024
+
+    async def chunk(self, cache=True):
+        return list(self.members)
+
+
+class FakeMessage:
+    def __init__(self, message_id, author, channel, content):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+
+
+_ids = iter(range(10 ** 17, 10 ** 18))
+
+
+def next_id():
+    return next(_ids)
+
+
+class FakeDiscord:
+    # Synthetic gateway state and REST stand-in: guilds, channels and members generated up front,
+    # so benchmarks measure FriendBot's own code rather than the network.
+    def __init__(self, guilds=10, channels_per_guild=20, members_per_guild=100, seed=1):
+        self.random = random.Random(seed)
+        self.me = FakeUser(next_id(), "BenchBot", bot=True)
+        self.guilds = {}
+        self.channels = {}
+        self.users = {}
+        for g in range(guilds):
+            self.add_guild(f"guild-{g}", channels_per_guild, members_per_guild)
+
+    def add_guild(self, name, channels, members):
+        guild = FakeGuild(next_id(), name, self.me)
+        for c in range(channels):
+            channel = FakeChannel(next_id(), f"channel-{c}", guild)
+            guild.text_channels.append(channel)
+            self.channels[channel.id] = channel
+        for m in range(members):
+            user = FakeUser(next_id(), f"user-{m}")
+            guild.members.append(user)
+            self.users[user.id] = user
+        self.guilds[guild.id] = guild
+        return guild
+
+    def text(self):
+        return " ".join(self.random.choice(WORDS) for _ in range(self.random.randint(3, 12)))
+
+    def message_storm(self, count, channels=None):
+        channels = channels or list(self.channels.values())
+        for _ in range(count):
+            channel = self.random.choice(channels)
+            yield FakeMessage(next_id(), self.random.choice(channel.guild.members), channel, self.text())
+
+
+class BenchUI:
+    # Sink with the BotView interface that keeps the latest lists and drops log lines
+    def __init__(self):
+        self.lists = {}
+        self.logs = 0
+
+    def log(self, message):
+        self.logs += 1
+
+    def set_list(self, name, items):
+        self.lists[name] = items
+
+    def update_list_item(self, name, item):
+        self.lists.setdefault(name, []).append(item)
+
+    def call_soon(self, callback):
+        callback()
+
+
+class OfflineFriendBot(FriendBot):
+    # FriendBot with the gateway cache and REST lookups answered from a FakeDiscord
+    def __init__(self, fake, ui, **kwargs):
+        super().__init__("offline", ui, **kwargs)
+        self.fake = fake
+
+    @property
+    def user(self):
+        return self.fake.me
+
+    @property
+    def guilds(self):
+        return list(self.fake.guilds.values())
+
+    def get_guild(self, guild_id):
+        return self.fake.guilds.get(guild_id)
+
+    def get_channel(self, channel_id):
+        return self.fake.channels.get(channel_id)
+
+    def get_user(self, user_id):
+        return self.fake.users.get(user_id)
+
+    async def fetch_user(self, user_id):
+        user = self.fake.users.get(user_id)
+        if user is None:
+            raise discord.NotFound(FakeResponse(404), "Unknown User")
+        return user
+
+    async def fetch_channel(self, channel_id):
+        return self.fake.channels[channel_id]
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+        self.reason = "Fake"
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+async def ready_bot(fake, profile="full", storage_backend="sqlite"):
+    shutil.rmtree("BotData", ignore_errors=True)  # Every benchmark starts from an empty data folder
+    bot = OfflineFriendBot(fake, BenchUI(), intents_profile=profile, storage_backend=storage_backend)
+    await bot.on_ready()
+    return bot
+
+
+async def bench_on_message(count, backend):
+    fake = FakeDiscord(guilds=5, channels_per_guild=20, members_per_guild=500)
+    bot = await ready_bot(fake, storage_backend=backend)
+    messages = list(fake.message_storm(count))
+    samples = []
+    started = time.perf_counter()
+    for message in messages:
+        t = time.perf_counter()
+        await bot.on_message(message)
+        samples.append(time.perf_counter() - t)
+    handled = time.perf_counter() - started
+    bot.save_data()  # Wait for the store and index to catch up
+    total = time.perf_counter() - started
+    await bot.close()
+    return {"messages": count, "handler_seconds": handled, "messages_per_sec": count / handled,
+            "durable_seconds": total, "durable_messages_per_sec": count / total, **percentiles(samples)}
+
+
+async def bench_save_and_load(count, backend, channels=100, chunk=100000):
+    fake = FakeDiscord(guilds=1, channels_per_guild=channels, members_per_guild=1000)
+    bot = await ready_bot(fake, storage_backend=backend)
+    channel_ids = [channel.id for channel in fake.channels.values()]
+    user_ids = [user.id for user in fake.users.values()]
+    texts = [fake.text() for _ in range(1000)]
+    rng = fake.random
+
+    # Flushed every chunk so the queues stay bounded and the rate is what the disk sustains
+    save_seconds = 0.0
+    started = time.perf_counter()
+    for start in range(0, count, chunk):
+        t = time.perf_counter()
+        for i in range(start, min(count, start + chunk)):
+            bot.save_message(rng.choice(channel_ids), rng.choice(user_ids), texts[i % 1000], message_id=i)
+        save_seconds += time.perf_counter() - t
+        bot.save_data()
+    durable = time.perf_counter() - started
+    await bot.close()
+
+    folder = bot.bot_data_folder
+    t = time.perf_counter()
+    store = open_message_store(folder, backend)
+    reopen = time.perf_counter() - t
+    cache = ChannelHistoryCache(store)
+    t = time.perf_counter()
+    history = cache[str(channel_ids[0])]
+    cold = time.perf_counter() - t
+    t = time.perf_counter()
+    cache[str(channel_ids[0])]
+    hot = time.perf_counter() - t
+    store.close()
+    return {
+        "messages": count, "channels": channels,
+        "save_message_seconds": save_seconds, "save_message_per_sec": count / save_seconds if save_seconds else None,
+        "durable_seconds": durable, "durable_messages_per_sec": count / durable,
+        "reopen_seconds": reopen, "cold_channel_load_seconds": cold, "channel_messages": len(history),
+        "hot_channel_load_seconds": hot, "disk_bytes": folder_size(folder),
+    }
+
+
+async def bench_export(count, backend, channels=10, chunk=100000):
+    # Exports count stored messages in every format. Run twice: once for the rate and once under
+    # tracemalloc, whose peak shows memory stays at about one chunk whatever the count.
+    fake = FakeDiscord(guilds=1, channels_per_guild=channels, members_per_guild=1000)
+    bot = await ready_bot(fake, storage_backend=backend)
+    channel_ids = [channel.id for channel in fake.channels.values()]
+    user_ids = [user.id for user in fake.users.values()]
+    texts = [fake.text() for _ in range(1000)]
+    rng = fake.random
+    for start in range(0, count, chunk):
+        for i in range(start, min(count, start + chunk)):
+            bot.save_message(rng.choice(channel_ids), rng.choice(user_ids), texts[i % 1000], message_id=i)
+        bot.save_data()
+
+    results = {}
+    for fmt, compress in (("jsonl", False), ("jsonl", True), ("csv", False), ("csv", True), ("parquet", True)):
+        name = fmt + ("_gzip" if compress and fmt != "parquet" else "")
+        path = os.path.join(bot.bot_data_folder, "exports", name)
+        stats = MessageExport(bot.message_store, path, fmt, compress=compress).run()
+        if stats["error"]:
+            results[name] = {"error": stats["error"]}
+            continue
+        tracemalloc.start()
+        MessageExport(bot.message_store, path, fmt, compress=compress).run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {"messages": stats["exported"], "seconds": stats["elapsed"], "messages_per_sec": stats["rate"],
+                         "file_bytes": os.path.getsize(path), "peak_traced_bytes": peak}
+    await bot.close()
+    return results
+
+
+async def bench_populate_users(members):
+    results = {}
+    for profile in ("full", "minimal"):
+        fake = FakeDiscord(guilds=0)
+        guild = fake.add_guild("huge", 1, members)
+        bot = await ready_bot(fake, profile=profile)
+        channel = guild.text_channels[0]
+        if bot.lazy_members:  # As if the guild had just been chunked
+            bot.member_cache[guild.id] = (time.monotonic() + 3600, await guild.chunk(cache=False))
+        samples = []
+        for _ in range(3):
+            t = time.perf_counter()
+            bot.populate_users(channel.id)
+            samples.append(time.perf_counter() - t)
+        assert len(bot.ui.lists["users"]) == members
+        await bot.close()
+        results[profile] = {"members": members, "best_seconds": min(samples), "median_seconds": statistics.median(samples)}
+    return results
+
+
+async def bench_cold_start(guilds, channels_per_guild, repeat=3):
+    samples = []
+    for _ in range(repeat):
+        fake = FakeDiscord(guilds=guilds, channels_per_guild=channels_per_guild, members_per_guild=10)
+        shutil.rmtree("BotData", ignore_errors=True)
+        t = time.perf_counter()
+        bot = OfflineFriendBot(fake, BenchUI())
+        await bot.on_ready()
+        samples.append(time.perf_counter() - t)
+        await bot.close()
+    return {"guilds": guilds, "channels": guilds * channels_per_guild, "best_seconds": min(samples), "median_seconds": statistics.median(samples)}
+
+
+def bench_rules(count, messages=10000):
+    # Compile time and per-message match cost for count auto-response rules: mostly keywords,
+    # a fifth regexes, half of those without a literal prefix so they go through the merged pattern
+    rng = random.Random(count)
+    vocabulary = WORDS + ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9))) for _ in range(count)]
+    data = []
+    for i in range(count):
+        word = rng.choice(vocabulary)
+        if i % 5:
+            data.append({"id": f"keyword{i}", "keywords": [word, rng.choice(vocabulary)], "whole_word": i % 2 == 0})
+        elif i % 10:
+            data.append({"id": f"regex{i}", "regex": rf"{word}\s+\w+"})
+        else:
+            data.append({"id": f"regex{i}", "regex": rf"\d+{word}"})
+    started = time.perf_counter()
+    ruleset = RuleSet([Rule(item, position) for position, item in enumerate(data)])
+    compile_seconds = time.perf_counter() - started
+    fake = FakeDiscord(guilds=1, channels_per_guild=1, members_per_guild=1, seed=count)
+    texts = [fake.text() + " " + rng.choice(vocabulary) for _ in range(messages)]
+    samples = []
+    hits = 0
+    for text in texts:
+        t = time.perf_counter()
+        hits += len(ruleset.match(text))
+        samples.append(time.perf_counter() - t)
+    return {"rules": count, "compile_seconds": compile_seconds, "messages_per_sec": messages / sum(samples),
+            "hits_per_message": hits / messages, **percentiles(samples)}
+
+
+def bench_chat_window(count):
+    # Needs a display; records why it was skipped otherwise
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        return {"skipped": str(e)}
+    from main import ChatWindow
+    root.withdraw()
+    fake = FakeDiscord(guilds=1, channels_per_guild=1, members_per_guild=200)
+    bot = OfflineFriendBot(fake, BenchUI())
+    channel = next(iter(fake.channels.values()))
+    members = channel.guild.members
+    bot.messages = {str(channel.id): [{"user_id": fake.random.choice(members).id, "content": fake.text()} for _ in range(count)]}
+    t = time.perf_counter()
+    window = ChatWindow(root, bot, channel.id, lambda user_id: None)
+    root.update()
+    opened = time.perf_counter() - t
+    samples = []
+    for _ in range(5):
+        t = time.perf_counter()
+        window.load_messages()
+        root.update()
+        samples.append(time.perf_counter() - t)
+    root.destroy()
+    return {"messages": count, "open_seconds": opened, "reload_best_seconds": min(samples), "reload_median_seconds": statistics.median(samples)}
+
+
+def folder_size(folder):
+    total = 0
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+def compare(results, baseline_path):
+    # Prints every timing or rate that moved by more than 10% against an earlier results file
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)["results"]
+
+    def walk(new, old, path):
+        if isinstance(new, dict) and isinstance(old, dict):
+            for key in new:
+                if key in old:
+                    walk(new[key], old[key], path + [key])
+        elif isinstance(new, (int, float)) and isinstance(old, (int, float)) and old and not isinstance(new, bool):
+            name = path[-1]
+            if name.endswith(("_seconds", "_ms", "_per_sec")):
+                change = (new - old) / old
+                worse = change < 0 if name.endswith("_per_sec") else change > 0
+                if abs(change) > 0.10:
+                    print(f"{'REGRESSION' if worse else 'improved  '} {'.'.join(path)}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+
+    walk(results, baseline, [])
+
+
+async def run(args):
+    results = {}
+    benches = set(args.only or ["on_message", "storage", "export", "populate_users", "cold_start", "rules", "chat_window"])
+    if "on_message" in benches:
+        results["on_message"] = {backend: await bench_on_message(args.messages, backend) for backend in args.backends}
+        print("on_message:", json.dumps(results["on_message"]), flush=True)
+    if "storage" in benches:
+        results["storage"] = {}
+        for backend in args.backends:
+            for size in args.sizes:
+                results["storage"][f"{backend}_{size}"] = await bench_save_and_load(size, backend)
+                print(f"storage {backend} {size}:", json.dumps(results["storage"][f"{backend}_{size}"]), flush=True)
+    if "populate_users" in benches:
+        results["populate_users"] = {str(members): await bench_populate_users(members) for members in args.members}
+        print("populate_users:", json.dumps(results["populate_users"]), flush=True)
+    if "cold_start" in benches:
+        results["cold_start"] = await bench_cold_start(args.guilds, 20)
+        print("cold_start:", json.dumps(results["cold_start"]), flush=True)
+    if "export" in benches:
+        results["export"] = {backend: await bench_export(args.export_size, backend) for backend in args.backends}
+        print("export:", json.dumps(results["export"]), flush=True)
+    if "rules" in benches:
+        results["rules"] = {str(count): bench_rules(count) for count in args.rules}
+        print("rules:", json.dumps(results["rules"]), flush=True)
+    if "chat_window" in benches:
+        results["chat_window"] = {str(count): bench_chat_window(count) for count in (10000, 1000000)}
+        print("chat_window:", json.dumps(results["chat_window"]), flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FriendBot offline against a synthetic Discord.")
+    parser.add_argument("--only", action="append", choices=["on_message", "storage", "export", "populate_users", "cold_start", "rules", "chat_window"], help="Run only this benchmark (repeatable)")
+    parser.add_argument("--sizes", default="10000,1000000,10000000", help="Message counts for the storage benchmark")
+    parser.add_argument("--backends", default="sqlite,log", help="Storage backends to measure")
+    parser.add_argument("--messages", type=int, default=100000, help="Messages in the on_message storm")
+    parser.add_argument("--export-size", type=int, default=1000000, help="Stored messages for the export benchmark")
+    parser.add_argument("--members", default="10000,100000,1000000", help="Member list sizes for populate_users")
+    parser.add_argument("--rules", default="100,1000,10000", help="Rule counts for the auto-response rules benchmark")
+    parser.add_argument("--guilds", type=int, default=1000, help="Guilds for the cold start benchmark")
+    parser.add_argument("--output", default="benchmarks", help="Folder for the results JSON")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--workdir", help="Where the bot's data goes (default: a temp folder, removed afterwards)")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    args.backends = args.backends.split(",")
+    args.members = [int(members) for members in args.members.split(",")]
+    args.rules = [int(count) for count in args.rules.split(",")]
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="friendbot-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # The bot writes BotData/ relative to the working directory
+    try:
+        started = time.time()
+        results = asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "started_at": datetime.datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "discord_py": discord.__version__,
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "workdir")},
+        "results": results,
+    }
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, f"bench-{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {path}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,504 @@
+import discord
+from discord.ext import commands
+import asyncio
+import collections
+import os
+import json
+import time
+import threading
+from storage import open_message_store, ChannelHistoryCache
+from search import open_search_index
+from broadcast import split_content
+from friends import FriendRegistry
+from rules import RuleEngine
+from snapshot import save_snapshot
+from uploads import AttachmentUploader, AttachmentError
+from ratelimit import retry_after_from, is_global_limit
+from usercache import UserCache
+from profiles import DEFAULT_PROFILE, client_options, current_rss
+from metrics import REGISTRY
+
+class FriendBot(commands.Bot):
+    def __init__(self, token, ui, *args, storage_backend="sqlite", history_cache_bytes=64 * 1024 * 1024, intents_profile=DEFAULT_PROFILE, member_cache_ttl=300, shared_data=False, **kwargs):
+        options = client_options(intents_profile)
+        super().__init__(command_prefix="!", *args, **options, **kwargs)
+        self.created_at = time.monotonic()
+        self.startup_seconds = None
+        self.intents_profile = intents_profile
+        self.lazy_members = not options["chunk_guilds_at_startup"]
+        self.member_cache_ttl = member_cache_ttl
+        self.member_cache = {}  # guild_id -> (expires_at, members), only used with lazy_members
+        self.member_requests = set()  # guild_ids being chunked right now
+        self.token = token
+        self.shared_data = shared_data  # Other processes (shard workers) use the same BotData folder
+        self.ui = ui  # BotView in the GUI, HeadlessSink in the daemon; all UI updates go through it
+        self.running = False
+        self.selected_server = None
+        self.selected_dm = None
+        self.selected_channel = None
+        self.bot_data_folder = None
+        self.storage_backend = storage_backend
+        self.message_store = None
+        self.search_index = None
+        self.history_cache_bytes = history_cache_bytes
+        self.friends = FriendRegistry(shared=shared_data)
+        self.messages = {}
+        self.message_listeners = {}  # channel_id -> callbacks run after a message is saved
+        self.user_cache = UserCache(self)
+        self.uploader = AttachmentUploader()
+        self.rules = None
+        self.rules_task = None
+        self.populate_servers_handle = None
+        REGISTRY.add_collector(self.collect_metrics)
+
+    async def on_ready(self):
+        print(f"Logged in as {self.user.name} ({self.user.id})")
+        self.log_message(f"Logged in as {self.user.name} ({self.user.id})")
+        self.running = True
+        self.populate_servers()
+        self.bot_data_folder = f"BotData/{self.user.name}"
+        if not os.path.exists(self.bot_data_folder):
+            os.makedirs(self.bot_data_folder)
+        if self.message_store is None:  # on_ready fires again after reconnects
+            self.message_store = open_message_store(self.bot_data_folder, self.storage_backend, migrate=self.is_primary())  # Shard workers share the folder
+            self.messages = ChannelHistoryCache(self.message_store, self.history_cache_bytes)  # Channels load on first use
+            self.search_index = open_search_index(self.bot_data_folder)
+            # Messages from now on are indexed live; anything stored before is imported once in the background
+            if self.is_primary():
+                threading.Thread(target=self.search_index.build_from, args=(self.message_store, self.message_store.high_water_mark(), self.log_message), daemon=True).start()
+            self.rules = RuleEngine(self, os.path.join(self.bot_data_folder, "rules.json"))
+            self.rules_task = asyncio.create_task(self.rules.watch())  # Loads the rules now and reloads them on change
+        self.load_data()
+        self.populate_dms()
+        if self.startup_seconds is None:
+            self.report_startup()
+
+    def is_primary(self):
+        # The process that gets DMs and does one-time maintenance when shards run in several processes
+        return True
+
+    def shard_status(self):
+        # [{"id", "status", "latency_ms", "guilds"}, ...]; empty for a single gateway connection
+        return []
+
+    async def on_guild_join(self, guild):
+        self.schedule_populate_servers()
+
+    async def on_guild_remove(self, guild):
+        self.schedule_populate_servers()
+
+    @property
+    def metrics_name(self):
+        return self.user.name if self.user else "starting"
+
+    def collect_metrics(self):
+        # Gauges read when metrics are scraped rather than updated on every change
+        bot = self.metrics_name
+        samples = [("friendbot_user_cache_size", {"bot": bot}, self.user_cache.stats()["size"])]
+        if self.latency == self.latency and self.latency != float("inf"):  # NaN before the first heartbeat
+            samples.append(("friendbot_gateway_latency_seconds", {"bot": bot}, self.latency))
+        for shard in self.shard_status():
+            if shard["latency_ms"] is not None:
+                samples.append(("friendbot_shard_latency_seconds", {"bot": bot, "shard": shard["id"]}, shard["latency_ms"] / 1000))
+        if self.message_store:
+            stats = self.messages.stats()
+            samples += [
+                ("friendbot_history_cache_bytes", {"bot": bot}, stats["resident_bytes"]),
+                ("friendbot_history_cache_channels", {"bot": bot}, stats["resident_channels"]),
+                ("friendbot_store_backlog", {"bot": bot}, self.message_store.backlog()),
+                ("friendbot_index_backlog", {"bot": bot}, self.search_index.backlog()),
+            ]
+        return samples
+
+    def report_startup(self):
+        self.startup_seconds = time.monotonic() - self.created_at
+        rss = current_rss()
+        rss_text = f"{rss / (1024 * 1024):.0f} MiB" if rss else "n/a"
+        self.log_message(f"Ready in {self.startup_seconds:.1f}s with the '{self.intents_profile}' intents profile, RSS {rss_text}, {len(self.guilds)} guilds")
+        try:
+            with open(os.path.join(self.bot_data_folder, "startup_stats.jsonl"), "a") as f:
+                f.write(json.dumps({"profile": self.intents_profile, "seconds": self.startup_seconds, "rss": rss, "guilds": len(self.guilds), "at": time.time()}) + "\n")
+        except OSError as e:
+            print(f"Error saving startup stats: {e}")
+
+    async def close(self):
+        if self.ui is not None:
+            self.log_message("Bot is closing and disconnecting...")
+        self.save_snapshot()
+        self.running = False
+        self.save_data()
+        if self.message_store:
+            stats = self.messages.stats()
+            self.log_message(f"History cache: {stats['resident_channels']} channels, {stats['resident_bytes'] // 1024} KiB resident, {stats['hit_rate']:.0%} hit rate, {stats['evictions']} evictions")
+            self.message_store.close()
+        if self.search_index:
+            self.search_index.close()
+        self.friends.close()
+        if self.populate_servers_handle:
+            self.populate_servers_handle.cancel()
+        if self.rules_task:
+            self.rules_task.cancel()
+            self.rules.close()
+        self.uploader.close()
+        REGISTRY.remove_collector(self.collect_metrics)
+        await super().close()
+
+    def run_bot(self):
+        # Standalone use only: runs the bot on a loop of its own and closes it when run() returns.
+        # The GUI and the daemon start bots on a shared loop instead.
+        try:
+            self.run(self.token)
+        except discord.LoginFailure:
+            print("Invalid token provided.")
+            self.log_message("Invalid token provided.")
+        except Exception as e:
+            print(f"Error running bot: {e}")
+            self.log_message(f"Error running bot: {e}")
+
+    def log_message(self, message):
+        if self.ui:
+            self.ui.log(message)
+        else:
+            print(message)
+
+    def server_items(self):
+        return [(guild.id, f"{guild.name} ({guild.id})") for guild in self.guilds]
+
+    def channel_items(self, guild):
+        return [(channel.id, f"{channel.name} ({channel.id})") for channel in guild.text_channels] if guild else []
+
+    def dm_items(self):
+        return [(user_id, self.friend_label(user_id, name)) for user_id, name in self.friends.accepted()]
+
+    async def broadcast_targets(self):
+        # [((kind, id), label), ...] for the broadcast window; a coroutine so it reads guilds and
+        # friends on the loop that changes them
+        items = []
+        for guild in self.guilds:
+            for channel in guild.text_channels:
+                items.append((("channel", channel.id), f"#{channel.name} - {guild.name}"))
+        for user_id, name in self.friends.accepted():
+            items.append((("user", user_id), f"@{name or user_id} (DM)"))
+        return items
+
+    def save_snapshot(self):
+        # The server, channel and DM lists for the next launch to show before the bot connects.
+        # Skipped for shard workers, which only see some of the guilds.
+        if self.shared_data or not self.running or self.bot_data_folder is None:
+            return
+        try:
+            save_snapshot(self.bot_data_folder, self.server_items(), {guild.id: self.channel_items(guild) for guild in self.guilds}, self.dm_items())
+        except OSError as e:
+            print(f"Error saving snapshot: {e}")
+
+    def populate_servers(self):
+        self.populate_servers_handle = None
+        if self.ui:
+            self.ui.set_list("servers", self.server_items())
+
+    def schedule_populate_servers(self, delay=0.5):
+        # Coalesces bursts (shards becoming ready one after another, mass joins) into one refresh
+        if self.populate_servers_handle is None:
+            self.populate_servers_handle = asyncio.get_running_loop().call_later(delay, self.populate_servers)
+
+    def populate_channels(self, server_id):
+        if self.ui:
+            self.selected_server = self.get_guild(server_id)
+            self.ui.set_list("channels", self.channel_items(self.selected_server))
+
+    def populate_dms(self):
+        if self.ui:
+            self.ui.set_list("dms", self.dm_items())
+
+    def friend_label(self, user_id, name=None):
+        if name is None:  # Friends migrated from friends.json have no name stored yet
+            user = self.user_cache.get(user_id)
+            if user:
+                name = user.name
+                self.friends.set_name(user_id, name)
+        return f"{name or 'Unknown user'} ({user_id})"
+
+    def populate_users(self, channel_id):
+        if self.ui:
+            self.selected_channel = channel_id
+            channel = self.get_channel(channel_id)
+            members = self.channel_members(channel) if channel else []
+            if members is None:
+                self.ui.set_list("users", [])
+                self.request_members(channel.guild, channel_id)
+                return
+            self.ui.set_list("users", [(member.id, f"{member.name} ({member.id})") for member in members])
+
+    def channel_members(self, channel):
+        # Members who can see channel, or None if the guild's members still have to be fetched
+        guild = getattr(channel, "guild", None)
+        if not self.lazy_members or guild is None:
+            return getattr(channel, "members", [])
+        entry = self.member_cache.get(guild.id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return [member for member in entry[1] if channel.permissions_for(member).read_messages]
+
+    def request_members(self, guild, channel_id):
+        if guild.id in self.member_requests:
+            return
+        self.member_requests.add(guild.id)
+        self.log_message(f"Fetching members for {guild.name}...")
+        asyncio.run_coroutine_threadsafe(self.load_members(guild, channel_id), self.loop)
+
+    async def load_members(self, guild, channel_id):
+        try:
+            started = time.monotonic()
+            members = await guild.chunk(cache=False)
+            self.member_cache[guild.id] = (time.monotonic() + self.member_cache_ttl, members)
+            self.log_message(f"Fetched {len(members)} members for {guild.name} in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            self.log_message(f"Error fetching members for {guild.name}: {e}")
+            return
+        finally:
+            self.member_requests.discard(guild.id)
+        if self.selected_channel == channel_id:  # Still the channel the user is looking at
+            self.populate_users(channel_id)
+
+    async def open_channel(self, channel_id=None, user_id=None):
+        # The channel with channel_id, or the DM channel with user_id (created if needed). None if neither exists.
+        if channel_id:
+            channel = self.get_channel(int(channel_id))
+            if channel is not None:
+                return channel
+        if user_id:
+            user = await self.user_cache.fetch(int(user_id))
+            if user is not None:
+                return user.dm_channel or await user.create_dm()
+        if channel_id:
+            try:
+                return await self.fetch_channel(int(channel_id))
+            except (discord.NotFound, discord.Forbidden):
+                pass
+        return None
+
+    async def deliver_friend_request(self, user_id, limiter=None):
+        # Returns None if the user doesn't exist. Raises on other failures; on a 429 the
+        # bucket for the failing route is blocked before re-raising.
+        route = "fetch_user"
+        try:
+            user = await self.user_cache.fetch(user_id, limiter)
+            if user is None:
+                return None
+            route = "create_dm"
+            if limiter:
+                await limiter.acquire(route)
+            channel = await user.create_dm()
+            route = "send_message"
+            if limiter:
+                await limiter.acquire(route)
+            await channel.send(f"Hello! I'm {self.user.name}, a bot, and I'd like to be your friend.  Please respond with 'yes' to accept.")
+            self.friends.mark_pending(user.id, user.name)
+            return user
+        except discord.HTTPException as e:
+            if limiter and e.status == 429:
+                limiter.block(route, retry_after_from(e), is_global=is_global_limit(e))
+            raise
+
+    async def send_friend_request(self, user_id):
+        try:
+            user = await self.deliver_friend_request(user_id)
+            if user:
+                self.log_message(f"Sent a friend request to user {user.name} ({user_id})")
+            else:
+                self.log_message(f"User with ID {user_id} not found.")
+        except discord.NotFound:
+            self.log_message(f"User with ID {user_id} not found.")
+        except discord.Forbidden:
+            self.log_message(f"Could not open a DM with user {user_id}.")
+        except Exception as e:
+            self.log_message(f"Error sending friend request: {e}")
+
+    async def deliver_message(self, channel, content, file_paths=None, progress=None, limiter=None):
+        # Sends content split into as many messages as needed, attachments with the last one.
+        # Raises on failure; attachments are checked before any part is sent.
+        file_paths = list(file_paths or [])
+        self.uploader.validate(file_paths, self.uploader.size_limit(channel))
+        parts = split_content(content) or [""]
+        route = f"send_message:{channel.id}"
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            message = await self.uploader.send(channel, part, file_paths if last else None, progress if last else None, limiter, route)
+            self.save_message(channel.id, self.user.id, part, message_id=getattr(message, "id", None))
+        return message
+
+    async def send_message_to_channel(self, channel, content, file_paths=None, progress=None):
+        # progress(path, state, detail) is called as each attachment is read, uploaded and sent
+        started = time.perf_counter()
+        try:
+            await self.deliver_message(channel, content, file_paths, progress)
+            self.log_message(f"Sent message to channel {getattr(channel, 'name', None) or channel.id}: {content[:200]}")
+            REGISTRY.observe("friendbot_send_seconds", time.perf_counter() - started, bot=self.metrics_name)
+            return True
+        except AttachmentError as e:
+            self.log_message(f"Cannot send message: {e}")
+            error = e
+        except Exception as e:
+            self.log_message(f"Error sending message: {e}")
+            error = e
+        REGISTRY.inc("friendbot_send_failures_total", bot=self.metrics_name, reason=type(error).__name__)
+        if progress:
+            progress(None, "failed", str(error))
+        return False
+
+    async def on_message(self, message):
+        if message.author == self.user:
+            return
+        started = time.perf_counter()
+
+        if self.shared_data and isinstance(message.channel, discord.DMChannel):
+            self.friends.follow()  # The request may have been sent by another shard worker
+        if message.author.id in self.friends.pending and isinstance(message.channel, discord.DMChannel):
+            self.handle_friend_reply(message)
+        if self.rules:
+            self.rules.handle(message)
+
+        self.save_message(message.channel.id, message.author.id, message.content, message.created_at.timestamp(), message.id)
+        REGISTRY.inc("friendbot_messages_total", bot=self.metrics_name)
+        REGISTRY.observe("friendbot_on_message_seconds", time.perf_counter() - started, bot=self.metrics_name)
+
+    def handle_friend_reply(self, message):
+        # Only called for DMs from users with a pending request
+        answer = message.content.strip().lower()
+        author = message.author
+        if answer == "yes":
+            self.friends.accept(author.id, author.name)
+            if self.ui:
+                self.ui.update_list_item("dms", (author.id, self.friend_label(author.id, author.name)))
+            self.log_message(f"User {author.name} ({author.id}) accepted friend request.")
+        elif answer == "no":
+            self.friends.decline(author.id, author.name)
+            self.log_message(f"User {author.name} ({author.id}) declined friend request.")
+
+    def load_data(self):
+        migrated = self.friends.load(self.bot_data_folder, migrate=self.is_primary())
+        if migrated:
+            self.log_message(f"Imported {migrated} friends from friends.json")
+
+    def save_data(self):
+        with REGISTRY.time("friendbot_save_data_seconds", bot=self.metrics_name):
+            self.friends.flush()  # Friend changes are written as they happen
+            # Messages are already on disk, just wait for the last batch; a writer stuck retrying
+            # is reported rather than waited on forever
+            for store in (self.message_store, self.search_index):
+                if store and not store.flush():
+                    self.log_message(f"{store.backlog()} messages are still not written to {type(store).__name__}: its writer is retrying a failing write")
+
+    def save_message(self, channel_id, user_id, message_content, created_at=None, message_id=None):
+        channel_id = str(channel_id)
+        if self.message_store is None:
+            return  # Nothing to store into before on_ready
+        started = time.perf_counter()
+        if created_at is None:
+            created_at = time.time()
+        record = {"user_id": user_id, "content": message_content, "created_at": created_at, "message_id": message_id}  # As load_channel returns it
+        self.messages.append(channel_id, record)
+        self.message_store.append(channel_id, user_id, message_content, created_at, message_id)
+        self.search_index.append(channel_id, user_id, message_content, created_at)
+        REGISTRY.observe("friendbot_save_message_seconds", time.perf_counter() - started, bot=self.metrics_name)
+        self.notify_message_listeners(channel_id, record)
+
+    async def import_messages(self, channel_id, records):
+        # Bulk insert for backfilled history. Records already stored (e.g. seen live by on_message)
+        # are skipped; the lookup and the write run off the loop. Returns how many were added.
+        channel_id = str(channel_id)
+        if self.message_store is None:
+            raise RuntimeError("The message store is not open yet")
+
+        def write():
+            self.message_store.flush_or_raise()  # Live messages still queued must be visible to the lookup
+            existing = self.message_store.existing_message_ids(channel_id, [r["message_id"] for r in records])
+            existing |= self.message_store.claim_unidentified(channel_id, [r for r in records if r["message_id"] not in existing])  # Stored before IDs were
+            fresh = [dict(r, channel_id=channel_id) for r in records if r["message_id"] not in existing]
+            if fresh:
+                self.message_store.append_many(fresh)
+                self.search_index.append_many([dict(r) for r in fresh])
+                self.message_store.flush_or_raise()
+            return len(fresh)
+
+        added = await asyncio.get_running_loop().run_in_executor(None, write)
+        if added:
+            self.messages.invalidate(channel_id)  # Older history landed in the middle, reload on next use
+            self.notify_message_listeners(channel_id, reset=True)
+        return added
+
+    def notify_message_listeners(self, channel_id, record=None, reset=False):
+        # record is the message just saved; reset means history changed in place rather than grew
+        # at the end (record is None then). "*" listeners hear about every channel.
+        for callback in list(self.message_listeners.get(channel_id, [])) + list(self.message_listeners.get("*", [])):
+            try:
+                callback(channel_id, record, reset)
+            except Exception as e:
+                print(f"Error in message listener: {e}")
+
+    def add_message_listener(self, channel_id, callback):
+        self.message_listeners.setdefault(str(channel_id), []).append(callback)
+
+    def remove_message_listener(self, channel_id, callback):
+        listeners = self.message_listeners.get(str(channel_id), [])
+        if callback in listeners:
+            listeners.remove(callback)
+
+
+class ShardedFriendBot(FriendBot, commands.AutoShardedBot):
+    # FriendBot over several gateway connections. shard_count=None lets Discord pick the count;
+    # shard_ids limits this process to some of the shards when they are spread over processes.
+    def __init__(self, token, ui, *args, shard_count=None, shard_ids=None, **kwargs):
+        super().__init__(token, ui, *args, shard_count=shard_count, shard_ids=shard_ids, **kwargs)
+        self.shard_states = {}  # shard_id -> "connecting", "ready", "disconnected"
+        self.last_shard_status = []
+
+    def is_primary(self):
+        return self.shard_ids is None or 0 in self.shard_ids  # DMs arrive on shard 0
+
+    async def on_shard_connect(self, shard_id):
+        self.shard_states[shard_id] = "connecting"
+
+    async def on_shard_ready(self, shard_id):
+        self.shard_states[shard_id] = "ready"
+        self.log_message(f"Shard {shard_id} ready")
+        if self.is_ready():  # Shards reconnecting later; on_ready covers the initial start
+            self.schedule_populate_servers()
+
+    async def on_shard_resumed(self, shard_id):
+        self.shard_states[shard_id] = "ready"
+
+    async def on_shard_disconnect(self, shard_id):
+        self.shard_states[shard_id] = "disconnected"
+        self.log_message(f"Shard {shard_id} disconnected")
+
+    def shard_status(self):
+        try:
+            shards = sorted(self.shards.items())
+            guilds = collections.Counter(guild.shard_id for guild in self.guilds)
+        except RuntimeError:  # Read from the Tk thread while the loop was adding a shard or guild
+            return self.last_shard_status
+        status = []
+        for shard_id, shard in shards:
+            latency = shard.latency
+            state = self.shard_states.get(shard_id, "connecting")
+            if shard.is_closed():
+                state = "closed"
+            elif shard.is_ws_ratelimited():
+                state = "rate limited"
+            status.append({
+                "id": shard_id,
+                "status": state,
+                "latency_ms": round(latency * 1000) if latency == latency and latency != float("inf") else None,
+                "guilds": guilds.get(shard_id, 0),
+            })
+        self.last_shard_status = status
+        return status
+
+
+def create_bot(token, ui, shards=None, shard_ids=None, **kwargs):
+    # shards: None for one gateway connection, "auto" for Discord's recommended count, or a number
+    if shards is None:
+        return FriendBot(token, ui, **kwargs)
+    shard_count = None if shards == "auto" else int(shards)
+    return ShardedFriendBot(token, ui, shard_count=shard_count, shard_ids=shard_ids, **kwargs)
@@ -0,0 +1,139 @@
+import os
+import re
+
+import discord
+
+from jobs import Job
+from ratelimit import RateLimiter
+from uploads import AttachmentError
+
+MESSAGE_LIMIT = 2000
+
+
+def split_content(content, limit=MESSAGE_LIMIT):
+    # Splits content into messages of at most limit characters, preferring paragraph breaks,
+    # then line breaks, then spaces; words longer than a whole message are cut. A code block
+    # cut in the middle is closed at the end of one part and reopened at the start of the next.
+    parts = []
+    reopen = ""
+    rest = content
+    while rest:
+        text = reopen + rest
+        if len(text) <= limit:
+            parts.append(text)
+            break
+        window = text[:limit - 4]  # Leaves room to close an open code block
+        cut = len(window)
+        for separator, earliest in (("\n\n", len(window) // 2), ("\n", len(window) // 2), (" ", len(reopen))):
+            position = window.rfind(separator)
+            if position > earliest:  # A break near the start would leave a tiny part
+                cut = position + len(separator)
+                break
+        part, rest = text[:cut], text[cut:]
+        # "```py" keeps its language when reopened; a word only counts as one when the line ends right after it
+        fence = part.rfind("```")
+        language = re.match(r"```[\w+-]{1,20}(?=\n)", text[fence:]) if part.count("```") % 2 else None
+        if language and fence + language.end() >= cut and text[:fence].strip():
+            part, rest = text[:fence], text[fence:]  # The cut went through "```py": the whole fence moves to the next part
+        if part.count("```") % 2:
+            reopen = (language.group() if language else "```") + "\n"
+            part = part.rstrip("\n") + "\n```"
+        else:
+            reopen = ""
+            rest = rest.lstrip("\n")
+        parts.append(part.rstrip() or part)
+    return parts
+
+
+class Broadcast(Job):
+    # Sends one message (with attachments) to many channels and users. A fixed pool of workers
+    # drains the target queue; every send goes through the shared RateLimiter, so the global
+    # bucket and each channel's own bucket are respected instead of running into 429s. The
+    # attachments are read once by the uploader and the same bytes are sent to every target.
+    def __init__(self, bot, targets, content, file_paths=None, concurrency=8, limiter=None, on_progress=None):
+        super().__init__(on_progress)
+        self.bot = bot
+        self.targets = list(dict.fromkeys(targets))  # ("channel", id) or ("user", id), deduped
+        self.content = content
+        self.file_paths = list(file_paths or [])
+        self.concurrency = concurrency
+        self.limiter = limiter or RateLimiter()
+        self.status = {target: "queued" for target in self.targets}
+        self.errors = {}
+        self.parts = len(split_content(content)) or 1
+        self.attachment_bytes = sum(os.path.getsize(path) for path in self.file_paths if os.path.exists(path))
+        self.sent = 0
+        self.failed = 0
+        self.total = len(self.targets)
+
+    def stats(self):
+        done = self.sent + self.failed
+        return {
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "remaining": self.total - done,
+            "rate": self.rate(done),
+            "messages_per_sec": self.rate(self.sent * self.parts),
+            "bytes_per_sec": self.rate(self.sent * self.attachment_bytes),
+            "elapsed": self.elapsed(),
+            "running": self.running,
+        }
+
+    def report(self, target=None):
+        # on_progress(target, status, stats); target is None for overall updates
+        super().report(target, self.status.get(target))
+
+    async def run(self):
+        self.start()
+        self.bot.log_message(f"Broadcast to {self.total} targets ({self.parts} message(s), {len(self.file_paths)} attachment(s) each)")
+        self.report()
+        try:
+            await self.run_workers(self.targets, self.send_target, self.concurrency)
+        finally:
+            for target, status in self.status.items():
+                if status in ("queued", "sending"):
+                    self.status[target] = "cancelled"
+            self.finish()
+            self.report()
+
+        stats = self.stats()
+        state = "cancelled" if self.cancelled else "finished"
+        self.bot.log_message(f"Broadcast {state}: {stats['sent']} sent, {stats['failed']} failed in {stats['elapsed']:.1f}s ({stats['rate']:.1f} targets/s)")
+        return stats
+
+    async def send_target(self, target):
+        self.status[target] = "sending"
+        self.report(target)
+        status, error = await self.send_one(target)
+        self.status[target] = status
+        if error:
+            self.errors[target] = error
+        if status == "sent":
+            self.sent += 1
+        elif status != "cancelled":
+            self.failed += 1
+        self.report(target)
+
+    async def send_one(self, target):
+        kind, target_id = target
+        try:
+            if kind == "user":
+                await self.limiter.acquire("create_dm")
+                channel = await self.bot.open_channel(user_id=target_id)
+            else:
+                channel = await self.bot.open_channel(channel_id=target_id)
+            if channel is None:
+                return "not_found", None
+            if self.cancelled:
+                return "cancelled", None
+            await self.bot.deliver_message(channel, self.content, self.file_paths, limiter=self.limiter)
+            return "sent", None
+        except discord.Forbidden:
+            return "forbidden", None
+        except discord.NotFound:
+            return "not_found", None
+        except AttachmentError as e:
+            return "failed", str(e)
+        except Exception as e:
+            return "failed", str(e)
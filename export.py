@@ -0,0 +1,222 @@
+import csv
+import gzip
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+from jobs import Job
+from metrics import REGISTRY
+
+COLUMNS = ("channel_id", "message_id", "user_id", "created_at", "content")
+
+
+class ExportError(Exception):
+    pass
+
+
+def open_text(path, compress):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+class JSONLWriter:
+    extension = ".jsonl"
+
+    def __init__(self, path, compress):
+        self.file = open_text(path, compress)
+
+    def write(self, rows):
+        self.file.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+
+    def close(self):
+        self.file.close()
+
+
+class CSVWriter:
+    extension = ".csv"
+
+    def __init__(self, path, compress):
+        self.file = open_text(path, compress)
+        self.writer = csv.DictWriter(self.file, COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    # One row group per chunk. Parquet compresses its columns itself: zstd when compression is
+    # asked for, snappy otherwise. Needs pyarrow, which is only imported when it is used.
+    extension = ".parquet"
+
+    def __init__(self, path, compress):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ("channel_id", pyarrow.int64()),
+            ("message_id", pyarrow.int64()),
+            ("user_id", pyarrow.int64()),
+            ("created_at", pyarrow.float64()),
+            ("content", pyarrow.string()),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd" if compress else "snappy")
+
+    def write(self, rows):
+        self.writer.write_table(self.pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+EXPORT_FORMATS = {
+    "jsonl": JSONLWriter,
+    "csv": CSVWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def export_path(folder, fmt, compress):
+    # BotData/<bot name>/exports/messages-<time>.<format>[.gz]
+    name = "messages-" + time.strftime("%Y%m%d-%H%M%S") + EXPORT_FORMATS[fmt].extension
+    if compress and fmt != "parquet":
+        name += ".gz"
+    return os.path.join(folder, "exports", name)
+
+
+def parse_time(value, end=False):
+    # A year (YYYY), a month (YYYY-MM), an ISO date or date and time, in local time unless it has
+    # a UTC offset, or epoch seconds. Four digits are always a year, never epoch second 2024.
+    # A bare year, month or date as the end of a range includes all of it.
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    value = value.strip()
+    if re.fullmatch(r"\d{4}", value):
+        year = int(value)
+        return datetime(year + 1 if end else year, 1, 1).timestamp()
+    if re.fullmatch(r"\d{4}-\d{2}", value):
+        year, month = map(int, value.split("-"))
+        if end:
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        try:
+            return datetime(year, month, 1).timestamp()
+        except ValueError:
+            raise ValueError(f"Not a date: {value}")
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Not a date: {value}")
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.timestamp()
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def export_rows(channel_id, records):
+    channel_id = to_int(channel_id)
+    return [
+        {"channel_id": channel_id, "message_id": to_int(r.get("message_id")), "user_id": to_int(r.get("user_id")),
+         "created_at": r.get("created_at"), "content": r.get("content")}
+        for r in records
+    ]
+
+
+class MessageExport(Job):
+    # Streams stored history into one file: the store is read chunk_size messages at a time per
+    # channel and each chunk is written before the next is read, so memory stays at one chunk no
+    # matter how much history there is. Meant to run on its own thread while the bot keeps storing
+    # messages. Written to <path>.part and renamed once complete, so a cancelled or failed export
+    # never leaves a file that looks finished.
+    def __init__(self, store, path, fmt="jsonl", channel_ids=None, since=None, until=None, compress=False, chunk_size=5000, on_progress=None, metrics_name=None):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        super().__init__(on_progress)
+        self.store = store
+        self.path = path
+        self.fmt = fmt
+        self.channel_ids = [str(channel_id) for channel_id in channel_ids] if channel_ids else None  # None: every channel
+        self.since = since
+        self.until = until
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.metrics_name = metrics_name
+        self.total = len(self.channel_ids) if self.channel_ids else 0
+        self.channels_done = 0
+        self.exported = 0
+        self.error = None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "format": self.fmt,
+            "total": self.total,
+            "channels_done": self.channels_done,
+            "exported": self.exported,
+            "rate": self.rate(self.exported),
+            "elapsed": self.elapsed(),
+            "running": self.running,
+            "cancelled": self.cancelled,
+            "error": self.error,
+        }
+
+    def run(self):
+        self.start()
+        tmp = self.path + ".part"
+        writer = None
+        try:
+            self.store.flush_or_raise()  # Include messages still queued for the store's writer
+            channel_ids = self.channel_ids if self.channel_ids is not None else self.store.channels()
+            self.total = len(channel_ids)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            writer = EXPORT_FORMATS[self.fmt](tmp, self.compress)
+            for channel_id in channel_ids:
+                for records in self.store.iter_chunks(channel_id, self.since, self.until, self.chunk_size):
+                    if self.cancelled:
+                        break
+                    writer.write(export_rows(channel_id, records))
+                    self.exported += len(records)
+                    REGISTRY.inc("friendbot_export_messages_total", len(records), bot=self.metrics_name)
+                    self.report()
+                if self.cancelled:
+                    break
+                self.channels_done += 1
+            writer.close()
+            writer = None
+            if self.cancelled:
+                os.remove(tmp)
+            else:
+                os.replace(tmp, self.path)
+        except Exception as e:
+            self.error = str(e)
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        finally:
+            self.finish()
+            self.report()
+        return self.stats()
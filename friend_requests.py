@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import re
+import time
+
+import discord
+
+from jobs import Job
+from ratelimit import RateLimiter, retry_after_from
+
+FINAL_STATUSES = ("sent", "not_found", "forbidden")  # Errors (retries used up on 429/5xx, ...) are retried by a rerun
+
+
+def read_user_ids(path):
+    # Accepts any text file with one or more user IDs per line (plain lists, CSV exports, ...)
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return [int(match) for match in re.findall(r"\d{15,20}", f.read())]
+
+
+class BulkFriendRequester(Job):
+    # Sends friend requests to many users through a fixed pool of workers. Every outcome is
+    # appended to progress_file as it completes; a rerun with the same file skips the users with a
+    # final outcome and tries the ones that failed with an error again.
+    def __init__(self, bot, user_ids, progress_file, concurrency=4, limiter=None, max_retries=5, on_progress=None):
+        super().__init__(on_progress)
+        self.bot = bot
+        self.user_ids = list(dict.fromkeys(user_ids))  # Dedupe, keep order
+        self.progress_file = progress_file
+        self.concurrency = concurrency
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.total = len(self.user_ids)
+
+    def load_progress(self):
+        done = set()
+        try:
+            with open(self.progress_file, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        if record.get("status", "sent") in FINAL_STATUSES:
+                            done.add(int(record["user_id"]))
+                    except (ValueError, KeyError, AttributeError):
+                        pass  # Torn line from an interrupted run
+        except FileNotFoundError:
+            pass
+        return done
+
+    def record(self, progress, user_id, status):
+        progress.write(json.dumps({"user_id": user_id, "status": status, "at": time.time()}) + "\n")
+        progress.flush()
+
+    def stats(self):
+        processed = self.sent + self.failed
+        remaining = self.total - processed - self.skipped
+        rate = self.rate(processed)
+        return {
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "remaining": remaining,
+            "rate": rate,
+            "eta": remaining / rate if rate > 0 else None,
+            "running": self.running,
+        }
+
+    async def run(self):
+        self.start()
+        done = self.load_progress()
+        pending = []
+        for user_id in self.user_ids:
+            if user_id in done or self.bot.friends.is_friend(user_id):
+                self.skipped += 1
+            else:
+                pending.append(user_id)
+        self.bot.log_message(f"Bulk friend requests: {len(pending)} to send, {self.skipped} skipped")
+        self.report()
+
+        os.makedirs(os.path.dirname(self.progress_file) or ".", exist_ok=True)
+        with open(self.progress_file, "a") as progress:
+            try:
+                await self.run_workers(pending, lambda user_id: self.request_one(user_id, progress), self.concurrency)
+            finally:
+                self.finish()
+                self.report()
+
+        stats = self.stats()
+        state = "cancelled" if self.cancelled else "finished"
+        self.bot.log_message(f"Bulk friend requests {state}: {stats['sent']} sent, {stats['failed']} failed, {stats['skipped']} skipped")
+        return stats
+
+    async def request_one(self, user_id, progress):
+        status = await self.send_one(user_id)
+        if status == "cancelled":
+            return
+        if status == "sent":
+            self.sent += 1
+        else:
+            self.failed += 1
+        self.record(progress, user_id, status)
+        self.report()
+
+    async def send_one(self, user_id):
+        for attempt in range(self.max_retries):
+            if self.cancelled:
+                return "cancelled"
+            try:
+                user = await self.bot.deliver_friend_request(user_id, self.limiter)
+                return "sent" if user else "not_found"
+            except discord.NotFound:
+                return "not_found"
+            except discord.Forbidden:
+                return "forbidden"
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    return "error"
+                # Rate limited or a server hiccup: back off, doubling each attempt.
+                # deliver_friend_request has already blocked the bucket that returned the 429.
+                delay = retry_after_from(e, default=1.0) if e.status == 429 else 1.0
+                await asyncio.sleep(max(delay, 2 ** attempt))
+            except Exception as e:
+                self.bot.log_message(f"Error sending friend request to {user_id}: {e}")
+                return "error"
+        return "error"
@@ -0,0 +1,164 @@
+import json
+import os
+import time
+
+from atomicfile import atomic_write
+
+PENDING = "pending"
+ACCEPTED = "accepted"
+DECLINED = "declined"
+
+
+class FriendRegistry:
+    # Friend state per user ID: pending after a request is sent, then accepted or declined by
+    # their reply. Pending IDs are kept in a set so on_message only looks at DMs from users who
+    # were actually asked. Every change is appended to friends.jsonl as it happens; the journal
+    # is compacted to one line per user on load once it has grown to twice that. With shared=True
+    # several processes append to the same journal (shard workers), so it is never compacted and
+    # follow() picks up what the others wrote.
+    def __init__(self, shared=False):
+        self.shared = shared
+        self.entries = {}  # user_id -> {"state", "name", "requested_at", "updated_at"}
+        self.pending = set()
+        self.journal_file = None
+        self.journal = None
+        self.journal_lines = 0
+        self.offset = 0  # Bytes of the journal applied so far
+
+    def __len__(self):
+        return len(self.entries)
+
+    def state(self, user_id):
+        entry = self.entries.get(int(user_id))
+        return entry["state"] if entry else None
+
+    def is_friend(self, user_id):
+        return self.state(user_id) == ACCEPTED
+
+    def accepted(self):
+        # [(user_id, name or None), ...] in the order they were added
+        return [(user_id, entry["name"]) for user_id, entry in self.entries.items() if entry["state"] == ACCEPTED]
+
+    def counts(self):
+        counts = {PENDING: 0, ACCEPTED: 0, DECLINED: 0}
+        for entry in self.entries.values():
+            counts[entry["state"]] += 1
+        return counts
+
+    # Changes
+    def mark_pending(self, user_id, name=None):
+        # A new request to someone who already accepted leaves them accepted
+        user_id = int(user_id)
+        entry = self.entries.get(user_id)
+        if entry and entry["state"] == ACCEPTED:
+            return entry
+        now = time.time()
+        return self.update(user_id, PENDING, name, requested_at=now, now=now)
+
+    def accept(self, user_id, name=None):
+        return self.update(int(user_id), ACCEPTED, name)
+
+    def decline(self, user_id, name=None):
+        return self.update(int(user_id), DECLINED, name)
+
+    def set_name(self, user_id, name):
+        entry = self.entries.get(int(user_id))
+        if entry and name and entry["name"] != name:
+            self.update(int(user_id), entry["state"], name)
+
+    def update(self, user_id, state, name=None, requested_at=None, now=None):
+        now = now or time.time()
+        entry = self.entries.get(user_id) or {"state": state, "name": None, "requested_at": None, "updated_at": now}
+        entry["state"] = state
+        entry["name"] = name or entry["name"]
+        entry["requested_at"] = requested_at or entry["requested_at"]
+        entry["updated_at"] = now
+        self.apply(user_id, entry)
+        self.write(user_id, entry)
+        return entry
+
+    def apply(self, user_id, entry):
+        self.entries[user_id] = entry
+        if entry["state"] == PENDING:
+            self.pending.add(user_id)
+        else:
+            self.pending.discard(user_id)
+
+    # Persistence
+    def load(self, folder, migrate=True):
+        self.close()
+        self.entries = {}
+        self.pending = set()
+        self.journal_file = os.path.join(folder, "friends.jsonl")
+        self.journal_lines = 0
+        self.offset = 0
+        self.follow()
+        migrated = migrate_legacy_friends(self.entries, os.path.join(folder, "friends.json")) if migrate else {}
+        self.pending = {user_id for user_id, entry in self.entries.items() if entry["state"] == PENDING}
+        if not self.shared and (migrated or self.journal_lines > 2 * len(self.entries)):
+            self.compact()
+        self.journal = open(self.journal_file, "a")
+        if self.shared:
+            for user_id, entry in migrated.items():
+                self.write(user_id, entry)  # Appended: other processes have the journal open, so it is never replaced
+        return len(migrated)
+
+    def follow(self):
+        # Applies journal lines added since the last call, in file order, so changes made by
+        # other processes (and our own, again) end in the same state everywhere
+        try:
+            with open(self.journal_file, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1  # A line still being written is read next time
+        self.offset += end
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+                user_id = int(record.pop("user_id"))
+            except (ValueError, KeyError, TypeError):
+                continue  # A line cut short by a crash
+            self.apply(user_id, record)
+            self.journal_lines += 1
+
+    def compact(self):
+        atomic_write(self.journal_file, lambda f: f.writelines(json.dumps({"user_id": user_id, **entry}) + "\n" for user_id, entry in self.entries.items()))
+        self.journal_lines = len(self.entries)
+        self.offset = os.path.getsize(self.journal_file)
+
+    def write(self, user_id, entry):
+        if self.journal is None:
+            return  # Not loaded yet (before on_ready)
+        self.journal.write(json.dumps({"user_id": user_id, **entry}) + "\n")
+        self.journal.flush()
+        self.journal_lines += 1
+
+    def flush(self):
+        if self.journal:
+            self.journal.flush()
+
+    def close(self):
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+
+def migrate_legacy_friends(entries, legacy_file):
+    # Imports an old {"user_id": "friends"} friends.json once, then renames it so it is not imported
+    # again. Returns the imported entries by user ID.
+    if not os.path.exists(legacy_file):
+        return {}
+    try:
+        with open(legacy_file, "r") as f:
+            legacy = json.load(f)
+    except ValueError:
+        legacy = {}
+    now = time.time()
+    imported = {}
+    for user_id, status in legacy.items():
+        if status == "friends" and int(user_id) not in entries:
+            entries[int(user_id)] = imported[int(user_id)] = {"state": ACCEPTED, "name": None, "requested_at": None, "updated_at": now}
+    os.replace(legacy_file, legacy_file + ".migrated")
+    return imported
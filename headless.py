@@ -0,0 +1,527 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+
+import discord
+
+from backfill import HistoryBackfill
+from broadcast import Broadcast
+from bot import create_bot
+from export import MessageExport, export_path, parse_time
+from metrics import DEFAULT_PORT as DEFAULT_METRICS_PORT, MetricsServer, monitor_loop_lag
+from profiles import INTENT_PROFILES, DEFAULT_PROFILE
+
+
+class HeadlessSink:
+    # Stands in for the GUI: logs go to stdout and every UI update becomes an event for subscribers
+    def __init__(self, name, server):
+        self.name = name
+        self.server = server
+        self.lists = {}
+
+    def log(self, message):
+        print(f"[{self.name}] {message}", flush=True)
+        self.server.publish({"event": "log", "bot": self.name, "message": message})
+
+    def set_list(self, name, items):
+        self.lists[name] = items
+        if self.server.subscribers:
+            self.server.publish({"event": "list", "bot": self.name, "list": name, "items": [{"id": item_id, "label": label} for item_id, label in items]})
+
+    def update_list_item(self, name, item):
+        items = self.lists.setdefault(name, [])
+        self.lists[name] = [existing for existing in items if existing[0] != item[0]] + [item]
+        if self.server.subscribers:
+            self.server.publish({"event": "list_item", "bot": self.name, "list": name, "id": item[0], "label": item[1]})
+
+    def call_soon(self, callback):
+        callback()
+
+
+class ControlServer:
+    # Local control API. Clients send one JSON object per line, e.g.
+    #   {"id": 1, "op": "channels", "guild_id": 123}
+    # and get back {"id": 1, "ok": true, "result": ...}. {"op": "subscribe"} turns the
+    # connection into a stream of {"event": ...} lines (logs, list updates, new messages).
+    def __init__(self, bots):
+        self.bots = bots  # name -> FriendBot
+        self.subscribers = set()
+        self.loop = asyncio.get_running_loop()
+        self.commands = {
+            "bots": self.cmd_bots,
+            "guilds": self.cmd_guilds,
+            "channels": self.cmd_channels,
+            "users": self.cmd_users,
+            "send": self.cmd_send,
+            "friend_request": self.cmd_friend_request,
+            "profile": self.cmd_profile,
+            "history": self.cmd_history,
+            "search": self.cmd_search,
+            "backfill": self.cmd_backfill,
+            "broadcast": self.cmd_broadcast,
+            "rules": self.cmd_rules,
+            "export": self.cmd_export,
+        }
+        self.backfills = {}  # bot name -> HistoryBackfill
+        self.broadcasts = {}  # bot name -> Broadcast
+        self.exports = {}  # bot name -> MessageExport
+
+    def publish(self, event):
+        # Callable from any thread (exports, index builds): the writers belong to the loop, so
+        # lines from other threads are handed over to it
+        if not self.subscribers:
+            return
+        line = (json.dumps(event, default=str) + "\n").encode()
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self.write_line(line)
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self.write_line, line)
+            except RuntimeError:
+                pass  # Loop already closed, nobody left to tell
+
+    def write_line(self, line):
+        for writer in list(self.subscribers):
+            if writer.is_closing():
+                self.subscribers.discard(writer)
+            else:
+                writer.write(line)
+
+    def watch(self, name, bot):
+        def on_message_saved(channel_id, record=None, reset=False):
+            # Publishes the record itself: reading it back from bot.messages would load cold
+            # channels on the loop and churn the cache
+            if reset or record is None:
+                return  # Backfilled history, not a new message
+            self.publish({"event": "message", "bot": name, "channel_id": channel_id, **record})
+        bot.add_message_listener("*", on_message_saved)
+
+    async def start(self, socket_path=None, host="127.0.0.1", port=None):
+        if port is not None or not hasattr(asyncio, "start_unix_server"):
+            return await asyncio.start_server(self.handle_client, host, port or 8765)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Left behind by a previous run
+        return await asyncio.start_unix_server(self.handle_client, socket_path)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.dispatch(line, writer)
+                if response is not None:
+                    writer.write((json.dumps(response, default=str) + "\n").encode())
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+
+    async def dispatch(self, line, writer):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"ok": False, "error": "Invalid JSON"}
+        request_id = request.get("id")
+        op = request.get("op")
+        if op == "subscribe":
+            self.subscribers.add(writer)
+            return {"id": request_id, "ok": True, "result": "subscribed"}
+        if op not in self.commands:
+            return {"id": request_id, "ok": False, "error": f"Unknown op: {op}"}
+        try:
+            bot = self.bot_for(request)
+            result = await self.commands[op](bot, request)
+            return {"id": request_id, "ok": True, "result": result}
+        except Exception as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+
+    def bot_for(self, request):
+        name = request.get("bot") or next(iter(self.bots))
+        if name not in self.bots:
+            raise ValueError(f"Unknown bot: {name}")
+        bot = self.bots[name]
+        if not bot.running:
+            raise RuntimeError(f"Bot {name} is not ready")
+        return bot
+
+    async def cmd_bots(self, bot, request):
+        return [{"name": name, "ready": b.running, "user": str(b.user) if b.user else None, "shards": b.shard_status()} for name, b in self.bots.items()]
+
+    async def cmd_guilds(self, bot, request):
+        return [{"id": guild.id, "name": guild.name} for guild in bot.guilds]
+
+    async def cmd_channels(self, bot, request):
+        guild = bot.get_guild(int(request["guild_id"]))
+        if guild is None:
+            raise ValueError("Guild not found")
+        return [{"id": channel.id, "name": channel.name} for channel in guild.text_channels]
+
+    async def cmd_users(self, bot, request):
+        channel = bot.get_channel(int(request["channel_id"]))
+        if channel is None:
+            raise ValueError("Channel not found")
+        members = bot.channel_members(channel)
+        if members is None:
+            await bot.load_members(channel.guild, channel.id)
+            members = bot.channel_members(channel) or []
+        return [{"id": member.id, "name": member.name} for member in members]
+
+    async def cmd_send(self, bot, request):
+        channel = await bot.open_channel(request.get("channel_id"), request.get("user_id"))
+        if channel is None:
+            raise ValueError("Channel or user not found")
+        if not await bot.send_message_to_channel(channel, request["content"], request.get("files")):
+            raise RuntimeError("Send failed (the reason is in the log)")
+        return {"channel_id": channel.id}
+
+    async def cmd_friend_request(self, bot, request):
+        user = await bot.deliver_friend_request(int(request["user_id"]))
+        if user is None:
+            raise ValueError("User not found")
+        return {"id": user.id, "name": user.name}
+
+    async def cmd_profile(self, bot, request):
+        user = await bot.user_cache.fetch(int(request["user_id"]))
+        if user is None:
+            raise ValueError("User not found")
+        return {"id": user.id, "name": user.name, "bot": user.bot, "created_at": user.created_at.isoformat()}
+
+    async def cmd_history(self, bot, request):
+        history = bot.messages.get(str(request["channel_id"]), [])
+        limit = int(request.get("limit", 100))
+        return history[-limit:]
+
+
+    async def cmd_search(self, bot, request):
+        results, has_more = await asyncio.to_thread(
+            bot.search_index.search, request.get("query"), request.get("channel_id"), request.get("user_id"),
+            page=int(request.get("page", 0)), page_size=int(request.get("page_size", 50)),
+        )
+        return {"results": results, "has_more": has_more}
+
+    async def cmd_backfill(self, bot, request):
+        # {"op": "backfill", "channel_ids": [...]} or {"guild_id": ...} starts a run in the background,
+        # {"op": "backfill"} alone reports progress and {"op": "backfill", "cancel": true} stops it
+        name = request.get("bot") or next(iter(self.bots))
+        current = self.backfills.get(name)
+        if request.get("cancel"):
+            if current:
+                current.cancel()
+            return current.stats() if current else None
+        channel_ids = request.get("channel_ids") or []
+        if "guild_id" in request:
+            guild = bot.get_guild(int(request["guild_id"]))
+            if guild is None:
+                raise ValueError("Guild not found")
+            channel_ids += [channel.id for channel in guild.text_channels]
+        if not channel_ids:
+            return current.stats() if current else None
+        if current and current.running:
+            raise RuntimeError("A backfill is already running")
+        checkpoint_file = os.path.join(bot.bot_data_folder, "backfill_checkpoints.json")
+        backfill = HistoryBackfill(bot, channel_ids, checkpoint_file, concurrency=int(request.get("concurrency", 4)),
+                                   on_progress=lambda stats: self.publish({"event": "backfill", "bot": name, **stats}))
+        self.backfills[name] = backfill
+        asyncio.create_task(backfill.run())
+        return backfill.stats()
+
+    async def cmd_broadcast(self, bot, request):
+        # {"op": "broadcast", "channel_ids": [...], "user_ids": [...], "content": "...", "files": [...]}
+        # starts a run in the background; without targets it reports per-target status, "cancel" stops it
+        name = request.get("bot") or next(iter(self.bots))
+        current = self.broadcasts.get(name)
+        if request.get("cancel"):
+            if current:
+                current.cancel()
+            return current.stats() if current else None
+        targets = [("channel", int(channel_id)) for channel_id in request.get("channel_ids", [])]
+        targets += [("user", int(user_id)) for user_id in request.get("user_ids", [])]
+        if not targets:
+            if current is None:
+                return None
+            return {**current.stats(), "targets": [{"kind": kind, "id": target_id, "status": status, "error": current.errors.get((kind, target_id))}
+                                                    for (kind, target_id), status in current.status.items()]}
+        if current and current.running:
+            raise RuntimeError("A broadcast is already running")
+
+        def on_progress(target, status, stats):
+            if target is not None:
+                self.publish({"event": "broadcast", "bot": name, "kind": target[0], "id": target[1], "status": status, **stats})
+
+        broadcast = Broadcast(bot, targets, request.get("content", ""), request.get("files"), concurrency=int(request.get("concurrency", 8)), on_progress=on_progress)
+        self.broadcasts[name] = broadcast
+        asyncio.create_task(broadcast.run())
+        return broadcast.stats()
+
+    async def cmd_rules(self, bot, request):
+        # Per-rule hit counters; "reload": true rereads rules.json without waiting for the file watcher
+        if bot.rules is None:
+            raise RuntimeError("Rules are not loaded yet")
+        if request.get("reload"):
+            await bot.rules.reload(force=True)
+        return bot.rules.stats()
+
+    async def cmd_export(self, bot, request):
+        # {"op": "export", "format": "csv", "channel_ids": [...] or "guild_id": ..., "since": "2024-01-01",
+        # "until": "2024-01-31", "gzip": true, "path": ...} starts an export of the stored history on its own
+        # thread (every channel unless some are given); "status": true reports progress and "cancel": true stops it
+        name = request.get("bot") or next(iter(self.bots))
+        current = self.exports.get(name)
+        if request.get("cancel"):
+            if current:
+                current.cancel()
+            return current.stats() if current else None
+        if request.get("status"):
+            return current.stats() if current else None
+        if current and current.running:
+            raise RuntimeError("An export is already running")
+        if bot.message_store is None:
+            raise RuntimeError("The message store is not open yet")
+        channel_ids = request.get("channel_ids") or []
+        if "guild_id" in request:
+            guild = bot.get_guild(int(request["guild_id"]))
+            if guild is None:
+                raise ValueError("Guild not found")
+            channel_ids += [channel.id for channel in guild.text_channels]
+        fmt = request.get("format", "jsonl")
+        compress = bool(request.get("gzip"))
+        path = request.get("path") or export_path(bot.bot_data_folder, fmt, compress)
+        export = MessageExport(bot.message_store, path, fmt, channel_ids or None, parse_time(request.get("since")), parse_time(request.get("until"), end=True),
+                               compress, on_progress=lambda stats: self.publish({"event": "export", "bot": name, **stats}), metrics_name=bot.metrics_name)
+        self.exports[name] = export
+        threading.Thread(target=export.run, name="export", daemon=True).start()
+        return export.stats()
+
+
+def load_tokens(names):
+    try:
+        with open("saved_tokens.json", "r") as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        saved = {}
+    tokens = {}
+    for name in names:
+        if name not in saved:
+            raise SystemExit(f"No saved token named {name!r} in saved_tokens.json")
+        tokens[name] = saved[name]
+    return tokens
+
+
+async def run_daemon(tokens, profile, socket_path, port, metrics_port=None, shards=None, shard_ids=None, shared_data=False, start_delay=0):
+    bots = {}
+    server = ControlServer(bots)
+    for name, token in tokens.items():
+        bot = create_bot(token, HeadlessSink(name, server), shards, shard_ids, intents_profile=profile, shared_data=shared_data)
+        bots[name] = bot
+        server.watch(name, bot)
+
+    listener = await server.start(socket_path=socket_path, port=port)
+    where = f"127.0.0.1:{port or 8765}" if port is not None or not hasattr(asyncio, "start_unix_server") else socket_path
+    print(f"Control API listening on {where}", flush=True)
+    metrics_server = None
+    if metrics_port:
+        try:
+            metrics_server = MetricsServer(metrics_port)
+            print(f"Metrics on http://127.0.0.1:{metrics_server.port}/metrics", flush=True)
+        except OSError as e:
+            print(f"Could not serve metrics on port {metrics_port}: {e}", flush=True)
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+
+    stopper = asyncio.create_task(stop.wait())
+    if start_delay:
+        await asyncio.wait([stopper], timeout=start_delay)  # Staggered shard workers wait their turn to identify
+    tasks = {asyncio.create_task(bot.start(bot.token)): name for name, bot in bots.items()}
+    exit_code = 0
+    try:
+        # A bot that stops (bad token, gateway error) is logged and dropped; the others keep
+        # running until a stop is requested or none is left
+        running = set(tasks)
+        while running and not stopper.done():
+            done, _ = await asyncio.wait(running | {stopper}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done - {stopper}:
+                running.discard(task)
+                error = task.exception() if not task.cancelled() else None
+                if isinstance(error, discord.LoginFailure):
+                    print(f"{tasks[task]}: Invalid token provided.", flush=True)  # Exits 0: restarting cannot fix it
+                elif error:
+                    print(f"{tasks[task]}: Error running bot: {error}", flush=True)
+                    exit_code = 1  # Gateway or network failure: lets a shard supervisor restart the worker
+                else:
+                    print(f"{tasks[task]}: Bot stopped", flush=True)
+        if stopper.done():
+            exit_code = 0  # Asked to stop, not a failure
+    finally:
+        listener.close()
+        lag_monitor.cancel()
+        if metrics_server:
+            metrics_server.close()
+        for bot in bots.values():
+            if not bot.is_closed():
+                await bot.close()
+        for task in tasks:
+            task.cancel()
+        stopper.cancel()
+    return exit_code
+
+
+IDENTIFY_INTERVAL = 5.0  # Discord accepts one gateway identify per 5 seconds per bot
+
+
+def split_shards(shard_count, processes):
+    # Contiguous slices, e.g. 10 shards over 3 processes: [0-3], [4-6], [7-9]
+    size, extra = divmod(shard_count, processes)
+    slices = []
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(list(range(start, end)))
+        start = end
+    return slices
+
+
+class ShardWorkers:
+    # Spreads a bot's shards over several headless.py processes, so on_message runs on more than
+    # one core. Workers share the bot's BotData folder: the SQLite message store and search index
+    # take writes from several processes. Each worker gets its own control socket (or port) and
+    # metrics port, starts only when the workers before it have identified, and is restarted if
+    # it exits on its own.
+    def __init__(self, token, profile, shard_count, processes, socket_path, port, metrics_port):
+        self.token = token
+        self.profile = profile
+        self.shard_count = shard_count
+        self.slices = split_shards(shard_count, processes)
+        self.socket_path = socket_path
+        self.port = port
+        self.metrics_port = metrics_port
+        self.processes = {}  # worker index -> asyncio subprocess
+        self.stopping = False
+
+    def command(self, index, start_delay):
+        shard_ids = self.slices[index]
+        args = [sys.executable, os.path.abspath(__file__), "--profile", self.profile,
+                "--shards", str(self.shard_count), "--shard-ids", ",".join(map(str, shard_ids)),
+                "--shared-data", "--start-delay", str(start_delay),
+                "--metrics-port", str(self.metrics_port + 1 + index if self.metrics_port else 0)]
+        if self.port is not None:
+            args += ["--port", str(self.port + index)]
+        else:
+            args += ["--socket", f"{self.socket_path}.{index}"]
+        return args
+
+    async def spawn(self, index, start_delay):
+        env = dict(os.environ, FRIENDBOT_TOKEN=self.token)  # Not on the command line, where ps would show it
+        self.processes[index] = await asyncio.create_subprocess_exec(*self.command(index, start_delay), env=env)
+        where = f"127.0.0.1:{self.port + index}" if self.port is not None else f"{self.socket_path}.{index}"
+        print(f"Worker {index}: shards {self.slices[index][0]}-{self.slices[index][-1]} of {self.shard_count}, control API on {where}", flush=True)
+
+    async def watch(self, index):
+        delay = 5.0
+        while not self.stopping:
+            code = await self.processes[index].wait()
+            if self.stopping or code == 0:
+                return  # Stopped on a signal, or gave up on its own (e.g. an invalid token)
+            print(f"Worker {index} exited with code {code}, restarting in {delay:.0f}s", flush=True)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+            if not self.stopping:
+                await self.spawn(index, 0)
+
+    async def run(self):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, AttributeError):
+                pass
+        start_delay = 0.0
+        for index, shard_ids in enumerate(self.slices):
+            await self.spawn(index, start_delay)
+            start_delay += len(shard_ids) * IDENTIFY_INTERVAL
+        watchers = [asyncio.create_task(self.watch(index)) for index in self.processes]
+        try:
+            await stop.wait()
+        finally:
+            self.stopping = True
+            for watcher in watchers:
+                watcher.cancel()
+            await self.stop()
+
+    async def stop(self, timeout=15):
+        running = [process for process in self.processes.values() if process.returncode is None]
+        for process in running:
+            process.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in running)), timeout)
+        except asyncio.TimeoutError:
+            for process in running:
+                if process.returncode is None:
+                    process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run FriendBot without the GUI and control it over a local socket.")
+    parser.add_argument("--bot", action="append", default=[], help="Name of a token in saved_tokens.json (repeat for more bots)")
+    parser.add_argument("--token", help="Bot token (or set FRIENDBOT_TOKEN)")
+    parser.add_argument("--profile", choices=sorted(INTENT_PROFILES), default=DEFAULT_PROFILE, help="Gateway intents profile")
+    parser.add_argument("--socket", default="friendbot.sock", help="Unix socket path for the control API")
+    parser.add_argument("--port", type=int, help="Serve the control API on 127.0.0.1:PORT instead of a Unix socket")
+    parser.add_argument("--metrics-port", type=int, default=DEFAULT_METRICS_PORT, help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics (0 to disable)")
+    parser.add_argument("--shards", help="Connect with this many gateway shards, or 'auto' for Discord's recommendation")
+    parser.add_argument("--shard-processes", type=int, default=1, help="Spread the shards over this many worker processes (needs a number for --shards)")
+    parser.add_argument("--shard-ids", help=argparse.SUPPRESS)  # Set by ShardWorkers for its workers
+    parser.add_argument("--shared-data", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--start-delay", type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.shards is not None and args.shards != "auto" and not (args.shards.isdigit() and int(args.shards) > 0):
+        parser.error("--shards must be a positive number or 'auto'")
+
+    tokens = load_tokens(args.bot)
+    token = args.token or os.environ.get("FRIENDBOT_TOKEN")
+    if token:
+        tokens["default"] = token
+    if not tokens:
+        parser.error("Give --bot NAME, --token TOKEN or set FRIENDBOT_TOKEN")
+
+    if args.shard_processes > 1:
+        if args.shards is None or args.shards == "auto":
+            parser.error("--shard-processes needs --shards set to a number")
+        if int(args.shards) < args.shard_processes:
+            parser.error("--shard-processes cannot be more than --shards")
+        if len(tokens) != 1:
+            parser.error("--shard-processes runs exactly one bot")
+        workers = ShardWorkers(next(iter(tokens.values())), args.profile, int(args.shards), args.shard_processes, args.socket, args.port, args.metrics_port)
+        try:
+            asyncio.run(workers.run())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    shard_ids = [int(shard_id) for shard_id in args.shard_ids.split(",")] if args.shard_ids else None
+    try:
+        return asyncio.run(run_daemon(tokens, args.profile, args.socket, args.port, args.metrics_port, args.shards, shard_ids, args.shared_data, args.start_delay))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+
+class Job:
+    # What the long-running jobs (bulk friend requests, history backfill, broadcast, export) have
+    # in common: start and finish times, cancellation, a progress callback that can never break
+    # the job, and a fixed pool of workers draining a queue. Subclasses provide stats().
+    def __init__(self, on_progress=None):
+        self.on_progress = on_progress
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = False
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def finish(self):
+        self.running = False
+        self.finished_at = time.monotonic()
+
+    def elapsed(self):
+        end = self.finished_at or time.monotonic()
+        return end - self.started_at if self.started_at else 0.0
+
+    def rate(self, count):
+        elapsed = self.elapsed()
+        return count / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        raise NotImplementedError
+
+    def report(self, *args):
+        # Calls on_progress(*args, stats)
+        if self.on_progress:
+            try:
+                self.on_progress(*args, self.stats())
+            except Exception as e:
+                print(f"Error reporting progress: {e}")
+
+    def cancel(self):
+        self.cancelled = True
+
+    async def run_workers(self, items, handle, concurrency):
+        # Awaits handle(item) for every item, at most concurrency at a time; once cancelled no
+        # new items are started
+        pending = asyncio.Queue()
+        for item in items:
+            pending.put_nowait(item)
+
+        async def worker():
+            while not self.cancelled:
+                try:
+                    item = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await handle(item)
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, pending.qsize())))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
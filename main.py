@@ -1,172 +1,22 @@
-import discord
-from discord.ext import commands
+import time
+STARTED = time.perf_counter()  # Time to first usable window is measured from here, imports included
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox, scrolledtext, Listbox, filedialog, Menu
+import tkinter.font as tkfont
+import bisect
 import threading
+import queue
+import collections
 import asyncio
 import os
 import json
-import re
-
-class FriendBot(commands.Bot):
-    def __init__(self, token, log_text, server_list, dm_list, channel_list, user_list, *args, **kwargs):
-        super().__init__(command_prefix="!", intents=discord.Intents.all(), *args, **kwargs)
-        self.token = token
-        self.log_text = log_text
-        self.server_list = server_list
-        self.dm_list = dm_list
-        self.channel_list = channel_list
-        self.user_list = user_list
-        self.running = False
-        self.selected_server = None
-        self.selected_dm = None
-        self.selected_channel = None
-        self.bot_data_folder = None
-        self.friends_file = None
-        self.messages_file = None
-        self.friends = {}
-        self.messages = {}
-
-    async def on_ready(self):
-        print(f"Logged in as {self.user.name} ({self.user.id})")
-        self.log_message(f"Logged in as {self.user.name} ({self.user.id})")
-        self.running = True
-        self.populate_servers()
-        self.bot_data_folder = f"BotData/{self.user.name}"
-        if not os.path.exists(self.bot_data_folder):
-            os.makedirs(self.bot_data_folder)
-        self.friends_file = os.path.join(self.bot_data_folder, "friends.json")
-        self.messages_file = os.path.join(self.bot_data_folder, "messages.json")
-        self.load_data()
-        self.populate_dms()
-
-    async def close(self):
-        if hasattr(self, 'log_text') and self.log_text is not None:
-            self.log_message("Bot is closing and disconnecting...")
-        self.running = False
-        self.save_data()
-        await super().close()
-
-    def run_bot(self):
-        try:
-            self.run(self.token)
-        except discord.LoginFailure:
-            print("Invalid token provided.")
-            self.log_message("Invalid token provided.")
-        except Exception as e:
-            print(f"Error running bot: {e}")
-            self.log_message(f"Error running bot: {e}")
-        finally:
-            if self.running:
-                asyncio.run_coroutine_threadsafe(self.close(), self.loop)
-
-    def log_message(self, message):
-        if self.log_text:
-            try:
-                self.log_text.config(state=tk.NORMAL)
-                self.log_text.insert(tk.END, message + "\n")
-                self.log_text.see(tk.END)
-                self.log_text.config(state=tk.DISABLED)
-            except Exception as e:
-                print(f"Error in log_message: {e}")
-        else:
-            print(message)
-
-    def populate_servers(self):
-        if self.server_list:
-            self.server_list.delete(0, tk.END)
-            for guild in self.guilds:
-                self.server_list.insert(tk.END, f"{guild.name} ({guild.id})")
-
-    def populate_channels(self, server_id):
-        if self.channel_list:
-            self.channel_list.delete(0, tk.END)
-            self.selected_server = self.get_guild(server_id)
-            if self.selected_server:
-                for channel in self.selected_server.text_channels:
-                    self.channel_list.insert(tk.END, f"{channel.name} ({channel.id})")
-
-    def populate_dms(self):
-        if self.dm_list:
-            self.dm_list.delete(0, tk.END)
-            for user_id, friend_status in self.friends.items():
-                if friend_status == "friends":
-                    user = self.get_user(int(user_id))
-                    if user:
-                        self.dm_list.insert(tk.END, f"{user.name} ({user.id})")
-
-    def populate_users(self, channel_id):
-        if self.user_list:
-            self.user_list.delete(0, tk.END)
-            channel = self.get_channel(channel_id)
-            if channel:
-                for member in channel.members:
-                    self.user_list.insert(tk.END, f"{member.name} ({member.id})")
-
-    async def send_friend_request(self, user_id):
-        try:
-            user = await self.fetch_user(user_id)
-            channel = await user.create_dm()
-            await channel.send(f"Hello! I'm {self.user.name}, a bot, and I'd like to be your friend.  Please respond with 'yes' to accept.")
-            self.log_message(f"Sent a friend request to user {user.name} ({user_id})")
-        except discord.NotFound:
-            self.log_message(f"User with ID {user_id} not found.")
-        except discord.Forbidden:
-            self.log_message(f"Could not open a DM with user {user_id}.")
-        except Exception as e:
-            self.log_message(f"Error sending friend request: {e}")
-
-    async def send_message_to_channel(self, channel, content, file_paths=None):
-        try:
-            if not file_paths:
-                file_paths = []
-
-            if len(file_paths) > 10:
-                self.log_message("Cannot attach more than 10 files.")
-                return
-
-            files = [discord.File(fp) for fp in file_paths]
-
-            await channel.send(content=content[:2000], files=files)  # Truncate message
-            self.log_message(f"Sent message to channel {channel.name}: {content[:2000]}")  # Truncated message
-            self.save_message(channel.id, self.user.id, content)
-        except Exception as e:
-            self.log_message(f"Error sending message: {e}")
-
-    async def on_message(self, message):
-        if message.author == self.user:
-            return
-
-        if isinstance(message.channel, discord.DMChannel) and message.content.lower() == "yes":
-            self.friends[str(message.author.id)] = "friends"
-            self.populate_dms()
-            self.log_message(f"User {message.author.name} ({message.author.id}) accepted friend request.")
-
-        self.save_message(message.channel.id, message.author.id, message.content)
-
-    def load_data(self):
-        try:
-            with open(self.friends_file, "r") as f:
-                self.friends = json.load(f)
-        except FileNotFoundError:
-            self.friends = {}
-        try:
-            with open(self.messages_file, "r") as f:
-                self.messages = json.load(f)
-        except FileNotFoundError:
-            self.messages = {}
-
-    def save_data(self):
-        with open(self.friends_file, "w") as f:
-            json.dump(self.friends, f)
-        with open(self.messages_file, "w") as f:
-            json.dump(self.messages, f)
-
-    def save_message(self, channel_id, user_id, message_content):
-        channel_id = str(channel_id)
-        if channel_id not in self.messages:
-            self.messages[channel_id] = []
-        self.messages[channel_id].append({"user_id": user_id, "content": message_content})
+from supervisor import BotSupervisor, submit
+from profiles import INTENT_PROFILES, DEFAULT_PROFILE
+from metrics import REGISTRY, MetricsServer
+from snapshot import load_snapshot
+from export import EXPORT_FORMATS, MessageExport, export_path, parse_time
+# Modules that import discord (bot, broadcast, backfill, friend_requests) are imported where
+# they are first used: discord and aiohttp take longer to import than the window takes to open.
 
 class ChatWindow(tk.Toplevel):  # Separate class for Chat Window
     def __init__(self, parent, bot, channel_id, view_profile_callback, user_id=None):
@@ -180,9 +30,21 @@ class ChatWindow(tk.Toplevel):  # Separate class for Chat Window
         self.parent = parent
         self.view_profile_callback = view_profile_callback #Call the callback function instead of accessing the GUI
 
+        # Only a window of the history is rendered: first_index is the oldest rendered message,
+        # cursor is one past the newest. Older pages are loaded when scrolled to the top.
+        self.page_size = 200
+        self.max_rendered = 1000
+        self.first_index = 0
+        self.cursor = 0
+        self.rendered_lines = []  # Text lines used by each rendered message, oldest first
+        self.update_pending = False
+        self.loading_older = False
+        self.authors_prefetched = False
+        self.prefetch_future = None
+
         self.messages_text = scrolledtext.ScrolledText(self, width=80, height=20)
         self.messages_text.pack(pady=5, padx=5, fill="both", expand=True)
-        self.messages_text.config(state=tk.DISABLED)
+        self.messages_text.config(state=tk.DISABLED, yscrollcommand=self.on_scroll)
         self.messages_text.bind("<Button-3>", self.on_message_right_click)
 
         self.chatbox_label = tk.Label(self, text="Chat:")
@@ -194,6 +56,10 @@ class ChatWindow(tk.Toplevel):  # Separate class for Chat Window
         self.file_paths = []
         self.attached_files_label = tk.Label(self, text="Attached Files: None")
         self.attached_files_label.pack(pady=5, padx=5)
+        self.upload_states = {}  # file name -> state of the most recent send
+        self.upload_error = None
+        self.upload_status_label = tk.Label(self, text="")
+        self.upload_status_label.pack(pady=0, padx=5)
 
         self.attach_file_button = tk.Button(self, text="Attach File", command=self.attach_file)
         self.attach_file_button.pack(pady=5, padx=5)
@@ -202,24 +68,116 @@ class ChatWindow(tk.Toplevel):  # Separate class for Chat Window
         self.send_button.pack(pady=5, padx=5)
 
         self.load_messages()
-        self.after(3500, self.update_messages) #Call update messages loop
+        self.bot.add_message_listener(self.channel_id, self.on_new_message)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def history(self):
+        return self.bot.messages.get(self.channel_id, [])
+
+    def format_message(self, msg):
+        try:
+            user = self.bot.user_cache.get(msg["user_id"])
+            if user:
+                return f"{user.name}: {msg['content']}\n"
+        except Exception as e:
+            print(f"Error displaying message: {e}")
+        return f"Unknown User ({msg['user_id']}): {msg['content']}\n"
+
+    def render_messages(self, messages, index):
+        # Inserts messages at index, tagging each line with its author for the context menu
+        line_counts = []
+        for msg in messages:
+            line = self.format_message(msg)
+            self.messages_text.insert(index, line, (f"user:{msg['user_id']}",))
+            line_counts.append(line.count("\n"))
+            if index != tk.END:
+                index = self.messages_text.index(f"{index} + {len(line)} chars")
+        return line_counts
 
     def load_messages(self):
+        history = self.history()
+        self.cursor = len(history)
+        self.first_index = max(0, self.cursor - self.page_size)
+
         self.messages_text.config(state=tk.NORMAL)
         self.messages_text.delete("1.0", tk.END)
+        self.rendered_lines = self.render_messages(history[self.first_index:self.cursor], tk.END)
+        self.messages_text.config(state=tk.DISABLED)
+        self.messages_text.see(tk.END)
+
+        # Resolve every unknown author in the channel in one pass, then redraw once
+        unknown = {msg["user_id"] for msg in history if msg["user_id"] is not None and not self.bot.user_cache.known(msg["user_id"])}
+        if unknown and self.bot.running and not self.authors_prefetched:
+            self.authors_prefetched = True
+            self.prefetch_future = self.bot.ui.run_async(self.bot.loop, self.bot.user_cache.prefetch(unknown), self.on_authors_prefetched, timeout=60)
+
+    def on_authors_prefetched(self, fetched):
+        if fetched:
+            self.reload_if_open()
+
+    def reload_if_open(self):
+        if self.winfo_exists():
+            self.load_messages()
+
+    def on_new_message(self, channel_id, record=None, reset=False):
+        # Called from the bot thread; hop onto the Tk thread and coalesce bursts into one update
+        if reset:  # Backfilled history was inserted, redraw from scratch
+            self.bot.ui.call_soon(self.reload_if_open)
+            return
+        if not self.update_pending:
+            self.update_pending = True
+            self.bot.ui.call_soon(self.append_new_messages)
+
+    def append_new_messages(self):
+        self.update_pending = False
+        if not self.winfo_exists():
+            return
+        history = self.history()
+        if self.cursor >= len(history):
+            return
+        at_bottom = self.messages_text.yview()[1] >= 1.0
+        new_messages = history[self.cursor:]
+        self.cursor += len(new_messages)
 
-        if self.channel_id in self.bot.messages:
-            for msg in self.bot.messages[self.channel_id]:
-                try:
-                    user = self.bot.get_user(int(msg["user_id"]))
-                    if user:
-                        self.messages_text.insert(tk.END, f"{user.name}: {msg['content']}\n")
-                    else:
-                        self.messages_text.insert(tk.END, f"Unknown User ({msg['user_id']}): {msg['content']}\n")
-                except Exception as e:
-                    print(f"Error displaying message: {e}")
+        self.messages_text.config(state=tk.NORMAL)
+        self.rendered_lines.extend(self.render_messages(new_messages, tk.END))
+        if at_bottom:
+            # Trim the oldest rendered messages so the widget doesn't grow without bound
+            excess = len(self.rendered_lines) - self.max_rendered
+            if excess > 0:
+                lines = sum(self.rendered_lines[:excess])
+                self.messages_text.delete("1.0", f"{lines + 1}.0")
+                del self.rendered_lines[:excess]
+                self.first_index += excess
+        self.messages_text.config(state=tk.DISABLED)
+        if at_bottom:
+            self.messages_text.see(tk.END)
+
+    def load_older_messages(self):
+        self.loading_older = False
+        if self.first_index == 0 or not self.winfo_exists():
+            return
+        new_first = max(0, self.first_index - self.page_size)
+        older = self.history()[new_first:self.first_index]
+        self.first_index = new_first
 
+        self.messages_text.config(state=tk.NORMAL)
+        line_counts = self.render_messages(older, "1.0")
         self.messages_text.config(state=tk.DISABLED)
+        self.rendered_lines[:0] = line_counts
+        self.messages_text.yview(f"{sum(line_counts) + 1}.0")  # Keep the previously top line in place
+
+    def on_scroll(self, first, last):
+        self.messages_text.vbar.set(first, last)
+        if float(first) <= 0.0 and self.first_index > 0 and not self.loading_older:
+            self.loading_older = True
+            self.after_idle(self.load_older_messages)
+
+    def on_close(self):
+        self.bot.remove_message_listener(self.channel_id, self.on_new_message)
+        if self.prefetch_future:
+            self.prefetch_future.cancel()
+        self.destroy()
 
     def attach_file(self):
         file_path = filedialog.askopenfilename()
@@ -241,38 +199,69 @@ class ChatWindow(tk.Toplevel):  # Separate class for Chat Window
         if not message_content:
             return
 
-        channel = self.bot.get_channel(int(self.channel_id))
-        if channel is None:
-            user = self.bot.get_user(self.user_id)
-            if user:
-                channel = user.dm_channel
-                if channel is None:
-                    asyncio.run_coroutine_threadsafe(user.create_dm(), self.bot.loop)
-                    channel = user.dm_channel
+        if not self.bot.running:
+            messagebox.showinfo("Info", "The bot is not running.")
+            return
 
-        if channel:
-            asyncio.run_coroutine_threadsafe(self.bot.send_message_to_channel(channel, message_content, self.file_paths), self.bot.loop)
+        # The channel (or the DM with user_id, created if needed) is resolved on the bot loop
+        async def send(file_paths):
+            channel = await self.bot.open_channel(self.channel_id, self.user_id)
+            if channel is None:
+                return None
+            return await self.bot.send_message_to_channel(channel, message_content, file_paths, self.on_upload_progress)
+
+        self.upload_states = {os.path.basename(fp): "queued" for fp in self.file_paths}
+        self.upload_error = None
+        self.show_upload_progress()
+        self.send_button.config(state=tk.DISABLED)
+        self.bot.ui.run_async(self.bot.loop, send(self.file_paths), self.on_sent, self.on_send_error)
+
+    def on_sent(self, sent):
+        if not self.winfo_exists():
+            return
+        self.send_button.config(state=tk.NORMAL)
+        if sent is None:
+            messagebox.showinfo("Error", "Could not find the channel.", parent=self)
+        elif sent:
             self.chatbox_entry.delete(0, tk.END)
             self.file_paths = []
             self.update_attached_files_label()
-            self.load_messages() #Reload messages after sending
-        else:
-            messagebox.showinfo("Error", "Could not find the channel.")
-
-    def update_messages(self):
-        self.load_messages() #Reload messsages
-        self.after(3500, self.update_messages) #Restart timeout for 3.5 seconds
+        # On failure the text and attachments stay, so the user can retry; the reason is in the upload status
+
+    def on_send_error(self, error):
+        if self.winfo_exists():
+            self.send_button.config(state=tk.NORMAL)
+            messagebox.showerror("Error", f"Could not send the message: {error}", parent=self)
+
+    def on_upload_progress(self, path, state, detail):
+        # Called on the bot loop; the label is updated on the Tk thread
+        def update():
+            if path is None:  # The whole send failed
+                for name in self.upload_states:
+                    self.upload_states[name] = "failed"
+                self.upload_error = detail
+            else:
+                self.upload_states[os.path.basename(path)] = state
+            if self.winfo_exists():
+                self.show_upload_progress()
+        self.bot.ui.call_soon(update)
+
+    def show_upload_progress(self):
+        if not self.upload_states:
+            self.upload_status_label.config(text="")
+            return
+        text = "Uploads: " + ", ".join(f"{name} {state}" for name, state in self.upload_states.items())
+        if "failed" in self.upload_states.values() and self.upload_error:
+            text += f" ({self.upload_error})"
+        self.upload_status_label.config(text=text)
 
     def on_message_right_click(self, event):
         try:
             index = self.messages_text.index("@%s,%s" % (event.x, event.y))
-            line_start = int(float(index))
-            message_line = self.messages_text.get(f"{line_start}.0", f"{line_start+1}.0")
-
-            user_id_search = re.search(r'\((\d+)\):', message_line)
+            user_tags = [tag for tag in self.messages_text.tag_names(index) if tag.startswith("user:")]
 
-            if user_id_search:
-                user_id = int(user_id_search.group(1))
+            if user_tags:
+                user_id = int(user_tags[0].split(":")[1])
 
                 menu = Menu(self, tearoff=0)
                 menu.add_command(label="View Profile", command=lambda: self.view_profile(user_id))
@@ -284,17 +273,663 @@ class ChatWindow(tk.Toplevel):  # Separate class for Chat Window
         if self.view_profile_callback: #Call the callback and view the profile
             self.view_profile_callback(user_id)
 
-import re
+class BroadcastWindow(tk.Toplevel):
+    # Sends one message to many channels and friends at once. Targets are picked from a
+    # filterable list (Ctrl/Shift to select several); each target's delivery shows below.
+    def __init__(self, parent, bot, items, selected=None):
+        # items are the targets as [((kind, id), label), ...], listed on the bot loop (see open_broadcast)
+        super().__init__(parent)
+        self.title("Broadcast")
+        self.geometry("900x650")
+        self.bot = bot
+        self.broadcast = None
+        self.update_pending = False
+        self.changed = set()
+        self.file_paths = []
+
+        top = tk.Frame(self)
+        top.pack(fill="both", expand=True, padx=5, pady=5)
+        left = tk.Frame(top)
+        left.pack(side="left", fill="both", expand=True)
+        tk.Label(left, text="Targets:").pack(anchor="w")
+        self.target_list = VirtualList(left, width=40, height=15, selectmode=tk.EXTENDED)
+        self.target_list.pack(fill="both", expand=True)
+        buttons = tk.Frame(left)
+        buttons.pack(fill="x")
+        tk.Button(buttons, text="Select All Shown", command=self.select_all_shown).pack(side="left")
+        tk.Button(buttons, text="Clear", command=lambda: self.set_selection(set())).pack(side="left")
+
+        right = tk.Frame(top)
+        right.pack(side="left", fill="both", expand=True, padx=5)
+        tk.Label(right, text="Message:").pack(anchor="w")
+        self.content_text = scrolledtext.ScrolledText(right, width=50, height=12)
+        self.content_text.pack(fill="both", expand=True)
+        self.content_text.bind("<KeyRelease>", self.update_length_label)
+        self.length_label = tk.Label(right, text="")
+        self.length_label.pack(anchor="w")
+        self.attached_files_label = tk.Label(right, text="Attached Files: None")
+        self.attached_files_label.pack(anchor="w")
+        actions = tk.Frame(right)
+        actions.pack(fill="x")
+        tk.Button(actions, text="Attach File", command=self.attach_file).pack(side="left")
+        self.send_button = tk.Button(actions, text="Send", command=self.send)
+        self.send_button.pack(side="left", padx=5)
+
+        self.status_label = tk.Label(self, text="", anchor="w")
+        self.status_label.pack(fill="x", padx=5)
+        self.status_tree = ttk.Treeview(self, columns=("status", "detail"), show="tree headings", height=10)
+        self.status_tree.heading("#0", text="Target")
+        self.status_tree.heading("status", text="Status")
+        self.status_tree.heading("detail", text="Detail")
+        self.status_tree.pack(fill="both", expand=True, padx=5, pady=5)
+
+        self.labels = dict(items)
+        self.target_list.set_items(items)
+        if selected:
+            self.set_selection(set(selected) & set(self.labels))
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def select_all_shown(self):
+        self.set_selection({self.target_list.ids[p] for p in self.target_list.view})
+
+    def set_selection(self, targets):
+        self.target_list.selected = targets
+        self.target_list.render()
+
+    def update_length_label(self, event=None):
+        from broadcast import split_content
+        content = self.content_text.get("1.0", "end-1c")
+        parts = len(split_content(content))
+        self.length_label.config(text=f"{len(content)} characters, sent as {parts} message(s)" if content else "")
+
+    def attach_file(self):
+        file_path = filedialog.askopenfilename(parent=self)
+        if file_path:
+            if len(self.file_paths) < 10:
+                self.file_paths.append(file_path)
+                self.attached_files_label.config(text=f"Attached Files: {', '.join(os.path.basename(fp) for fp in self.file_paths)}")
+            else:
+                messagebox.showinfo("Info", "Cannot attach more than 10 files.", parent=self)
+
+    def send(self):
+        if self.broadcast and self.broadcast.running:
+            if messagebox.askyesno("Broadcast", "Cancel the broadcast?", parent=self):
+                self.broadcast.cancel()
+            return
+        if not self.bot.running:
+            messagebox.showinfo("Info", "The bot is not running.", parent=self)
+            return
+        selected = self.target_list.selected  # Includes targets hidden by the current filter
+        targets = [target for target in self.target_list.ids if target in selected]
+        content = self.content_text.get("1.0", "end-1c").strip()
+        if not targets or not (content or self.file_paths):
+            messagebox.showinfo("Info", "Pick at least one target and write a message or attach a file.", parent=self)
+            return
+        if not messagebox.askyesno("Broadcast", f"Send to {len(targets)} targets?", parent=self):
+            return
+
+        self.status_tree.delete(*self.status_tree.get_children())
+        for target in targets:
+            self.status_tree.insert("", tk.END, iid=f"{target[0]}:{target[1]}", text=self.labels.get(target, str(target[1])), values=("queued", ""))
+        from broadcast import Broadcast
+        self.broadcast = Broadcast(self.bot, targets, content, self.file_paths, on_progress=self.on_progress)
+        self.send_button.config(text="Cancel")
+        self.bot.ui.run_async(self.bot.loop, self.broadcast.run())
+
+    def on_progress(self, target, status, stats):
+        # Called on the bot loop for every target; the tree is updated in one batch per GUI tick
+        if target is not None:
+            self.changed.add(target)
+        if not self.update_pending:
+            self.update_pending = True
+            self.bot.ui.call_soon(self.show_progress)
+
+    def show_progress(self):
+        self.update_pending = False
+        if not self.winfo_exists():
+            return
+        changed, self.changed = self.changed, set()
+        for target in changed:
+            detail = self.broadcast.errors.get(target, "")
+            self.status_tree.item(f"{target[0]}:{target[1]}", values=(self.broadcast.status[target], detail))
+        stats = self.broadcast.stats()
+        self.status_label.config(text=f"{stats['sent']} sent, {stats['failed']} failed, {stats['remaining']} left | "
+                                      f"{stats['rate']:.1f} targets/s, {stats['bytes_per_sec'] / 1024:.0f} KiB/s | {stats['elapsed']:.1f}s")
+        if not stats["running"]:
+            self.send_button.config(text="Send")
+
+    def on_close(self):
+        if self.broadcast and self.broadcast.running:
+            if not messagebox.askyesno("Broadcast", "The broadcast keeps running in the background. Close anyway?", parent=self):
+                return
+        self.destroy()
+
+
+class ExportWindow(tk.Toplevel):
+    # Exports stored history (the given channels, or all of them) to a file on a background
+    # thread, so the bot keeps receiving messages meanwhile; progress shows at the bottom.
+    def __init__(self, parent, bot, channel_ids=None):
+        super().__init__(parent)
+        self.title("Export History")
+        self.resizable(False, False)
+        self.bot = bot
+        self.channel_ids = channel_ids or None
+        self.export = None
+        self.update_pending = False
+        self.path_chosen = False
+
+        form = tk.Frame(self)
+        form.pack(fill="x", padx=10, pady=10)
+        tk.Label(form, text="Channels:").grid(row=0, column=0, sticky="e")
+        tk.Label(form, text=f"{len(channel_ids)} selected" if channel_ids else "All").grid(row=0, column=1, sticky="w")
+        tk.Label(form, text="Format:").grid(row=1, column=0, sticky="e")
+        self.format_var = tk.StringVar(self, "jsonl")
+        ttk.Combobox(form, textvariable=self.format_var, values=list(EXPORT_FORMATS), state="readonly", width=10).grid(row=1, column=1, sticky="w", pady=2)
+        self.format_var.trace_add("write", lambda *args: self.update_path())
+        tk.Label(form, text="From (YYYY-MM-DD):").grid(row=2, column=0, sticky="e")
+        self.since_entry = tk.Entry(form, width=20)
+        self.since_entry.grid(row=2, column=1, sticky="w", pady=2)
+        tk.Label(form, text="To (YYYY-MM-DD):").grid(row=3, column=0, sticky="e")
+        self.until_entry = tk.Entry(form, width=20)
+        self.until_entry.grid(row=3, column=1, sticky="w", pady=2)
+        self.gzip_var = tk.BooleanVar(self, False)
+        tk.Checkbutton(form, text="Compress", variable=self.gzip_var, command=self.update_path).grid(row=4, column=1, sticky="w")
+        tk.Label(form, text="Save to:").grid(row=5, column=0, sticky="e")
+        self.path_var = tk.StringVar(self)
+        tk.Entry(form, textvariable=self.path_var, width=60).grid(row=5, column=1, sticky="w", pady=2)
+        tk.Button(form, text="Browse", command=self.browse).grid(row=5, column=2, padx=5)
+
+        self.export_button = tk.Button(self, text="Export", command=self.start)
+        self.export_button.pack(pady=5)
+        self.status_label = tk.Label(self, text="", anchor="w")
+        self.status_label.pack(fill="x", padx=10, pady=(0, 10))
+        self.update_path()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def update_path(self):
+        if not self.path_chosen:
+            self.path_var.set(export_path(self.bot.bot_data_folder, self.format_var.get(), self.gzip_var.get()))
+
+    def browse(self):
+        current = self.path_var.get()
+        path = filedialog.asksaveasfilename(parent=self, initialdir=os.path.dirname(current), initialfile=os.path.basename(current))
+        if path:
+            self.path_chosen = True
+            self.path_var.set(path)
+
+    def start(self):
+        if self.export and self.export.running:
+            if messagebox.askyesno("Export", "Cancel the export?", parent=self):
+                self.export.cancel()
+            return
+        if self.bot.message_store is None:
+            messagebox.showinfo("Info", "The bot is not running.", parent=self)
+            return
+        path = self.path_var.get().strip()
+        if not path:
+            messagebox.showinfo("Info", "Choose where to save the export.", parent=self)
+            return
+        try:
+            since = parse_time(self.since_entry.get())
+            until = parse_time(self.until_entry.get(), end=True)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=self)
+            return
+        self.export = MessageExport(self.bot.message_store, path, self.format_var.get(), self.channel_ids, since, until, self.gzip_var.get(),
+                                    on_progress=self.on_progress, metrics_name=self.bot.metrics_name)
+        self.export_button.config(text="Cancel")
+        threading.Thread(target=self.export.run, name="export", daemon=True).start()
+
+    def on_progress(self, stats):
+        # Called from the export thread after every chunk; only one label update is queued at a time
+        if not self.update_pending:
+            self.update_pending = True
+            self.bot.ui.call_soon(self.show_progress)
+
+    def show_progress(self):
+        self.update_pending = False
+        if not self.winfo_exists():
+            return
+        stats = self.export.stats()
+        if stats["running"]:
+            self.status_label.config(text=f"{stats['exported']} messages, {stats['channels_done']}/{stats['total']} channels | {stats['rate']:.0f} msg/s | {stats['elapsed']:.1f}s")
+            return
+        if stats["error"]:
+            self.status_label.config(text=f"Export failed: {stats['error']}")
+        elif stats["cancelled"]:
+            self.status_label.config(text="Export cancelled.")
+        else:
+            self.status_label.config(text=f"Exported {stats['exported']} messages in {stats['elapsed']:.1f}s to {stats['path']}")
+        self.export_button.config(text="Export")
+
+    def on_close(self):
+        if self.export and self.export.running:
+            if not messagebox.askyesno("Export", "The export keeps running in the background. Close anyway?", parent=self):
+                return
+        self.destroy()
+
+
+class VirtualList(tk.Frame):
+    # Listbox over a backing array of (id, label) rows. Only the rows that fit on screen are
+    # ever put into the Tk widget, so a 100k-member list costs the same to show as a short one.
+    # The filter box searches a lowercase index that is built in chunks across after() ticks.
+    INDEX_CHUNK = 10000
+
+    def __init__(self, parent, width=30, height=20, selectmode=tk.BROWSE):
+        super().__init__(parent)
+        self.ids = []
+        self.labels = []
+        self.view = range(0)  # Positions in ids/labels that pass the filter
+        self.offset = 0
+        self.rows = height
+        self.rendered = []  # Labels currently in the listbox
+        self.selected = set()
+        self.selectmode = selectmode
+        self.extend_selection = False
+        self.select_callbacks = []
+
+        self.generation = 0
+        self.index_ready = True
+        self.lowers = []
+        self.sorted_keys = []
+        self.sorted_positions = []
+        self.haystack = ""
+        self.line_starts = []
+
+        self.filter_var = tk.StringVar(self)
+        self.filter_entry = tk.Entry(self, textvariable=self.filter_var)
+        self.filter_entry.pack(fill="x")
+        self.filter_var.trace_add("write", self.on_filter_changed)
+        self.filter_job = None
+
+        self.scrollbar = tk.Scrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.listbox = Listbox(self, width=width, height=height, selectmode=selectmode, exportselection=False, activestyle="none")
+        self.listbox.pack(side="left", fill="both", expand=True)
+        self.listbox.bind("<<ListboxSelect>>", self.on_listbox_select)
+        self.listbox.bind("<ButtonPress-1>", self.on_click, add="+")
+        self.listbox.bind("<Configure>", self.on_resize)
+        self.listbox.bind("<MouseWheel>", self.on_mousewheel)
+        self.listbox.bind("<Button-4>", lambda event: self.scroll_by(-3))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll_by(3))
+        self.line_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1
+
+    # Data
+    def set_items(self, items):
+        self.ids = [item[0] for item in items]
+        self.labels = [item[1] for item in items]
+        self.selected &= set(self.ids)
+        self.view = range(len(self.ids))
+        self.build_index()
+        self.render()
+
+    def upsert_item(self, item_id, label):
+        # Relabels the row with item_id or appends it, without rebuilding the list
+        try:
+            position = self.ids.index(item_id)
+        except ValueError:
+            position = None
+        if position is not None:
+            if self.labels[position] == label:
+                return
+            self.labels[position] = label
+            self.build_index()  # Relabelling is rare; the index is simply rebuilt
+        else:
+            self.ids.append(item_id)
+            self.labels.append(label)
+            if self.index_ready:
+                lower = label.lower()
+                at = bisect.bisect_left(self.sorted_keys, lower)
+                self.sorted_keys.insert(at, lower)
+                self.sorted_positions.insert(at, len(self.lowers))
+                self.line_starts.append(len(self.haystack) + 1 if self.lowers else 0)
+                self.haystack = self.haystack + "\n" + lower if self.lowers else lower
+                self.lowers.append(lower)
+            # A running index_step picks the new row up by itself
+        if self.filter_var.get().strip():
+            self.apply_filter()
+        else:
+            self.view = range(len(self.ids))
+            self.render()
+
+    def selected_ids(self):
+        if not self.selected:
+            return []
+        return [self.ids[p] for p in self.view if self.ids[p] in self.selected]
+
+    def id_at(self, y):
+        row = self.listbox.nearest(y)
+        position = self.offset + row
+        if 0 <= row < len(self.rendered) and position < len(self.view):
+            return self.ids[self.view[position]]
+        return None
+
+    def select_id(self, item_id):
+        self.selected = {item_id}
+        self.render()
+
+    def bind_select(self, callback):
+        self.select_callbacks.append(callback)
+
+    def bind(self, sequence=None, func=None, add=None):
+        # Mouse bindings belong on the listbox itself
+        return self.listbox.bind(sequence, func, add)
+
+    # Search index
+    def build_index(self):
+        self.generation += 1
+        self.index_ready = False
+        self.lowers = []
+        self.after(0, self.index_step, self.generation, 0)
+
+    def index_step(self, generation, start):
+        if generation != self.generation:
+            return  # The items were replaced while we were indexing
+        end = min(start + self.INDEX_CHUNK, len(self.labels))
+        self.lowers.extend(label.lower() for label in self.labels[start:end])
+        if end < len(self.labels):
+            self.after(1, self.index_step, generation, end)
+            return
+        self.sorted_positions = sorted(range(len(self.lowers)), key=self.lowers.__getitem__)
+        self.sorted_keys = [self.lowers[p] for p in self.sorted_positions]
+        self.haystack = "\n".join(self.lowers)
+        self.line_starts = []
+        offset = 0
+        for lower in self.lowers:
+            self.line_starts.append(offset)
+            offset += len(lower) + 1
+        self.index_ready = True
+        if self.filter_var.get():
+            self.apply_filter()
+
+    def search(self, query):
+        # Prefix matches first (binary search on the sorted keys), then other substring matches in list order
+        query = query.lower()
+        lo = bisect.bisect_left(self.sorted_keys, query)
+        hi = bisect.bisect_left(self.sorted_keys, query + "\uffff")
+        prefix = sorted(self.sorted_positions[lo:hi])
+        seen = set(prefix)
+        substring = []
+        pos = self.haystack.find(query)
+        while pos != -1:
+            line = bisect.bisect_right(self.line_starts, pos) - 1
+            if line not in seen:
+                substring.append(line)
+            next_line = line + 1
+            if next_line >= len(self.line_starts):
+                break
+            pos = self.haystack.find(query, self.line_starts[next_line])
+        return prefix + substring
+
+    def on_filter_changed(self, *args):
+        if self.filter_job:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(80, self.apply_filter)
+
+    def apply_filter(self):
+        self.filter_job = None
+        query = self.filter_var.get().strip()
+        if not query:
+            self.view = range(len(self.ids))
+        elif self.index_ready:
+            self.view = self.search(query)
+        else:
+            return  # index_step filters once the index is ready
+        self.offset = 0
+        self.render()
+
+    # Rendering
+    def render(self):
+        self.offset = max(0, min(self.offset, len(self.view) - self.rows))
+        visible = self.view[self.offset:self.offset + self.rows]
+        labels = [self.labels[p] for p in visible]
+        # Rewrite only the rows whose text changed
+        for row, label in enumerate(labels):
+            if row < len(self.rendered):
+                if self.rendered[row] != label:
+                    self.listbox.delete(row)
+                    self.listbox.insert(row, label)
+            else:
+                self.listbox.insert(tk.END, label)
+        if len(self.rendered) > len(labels):
+            self.listbox.delete(len(labels), tk.END)
+        self.rendered = labels
+
+        self.listbox.selection_clear(0, tk.END)
+        for row, position in enumerate(visible):
+            if self.ids[position] in self.selected:
+                self.listbox.selection_set(row)
+        total = len(self.view)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_resize(self, event):
+        rows = max(1, event.height // self.line_height)
+        if rows != self.rows:
+            self.rows = rows
+            self.render()
+
+    def scroll_by(self, rows):
+        self.offset += rows
+        self.render()
+        return "break"
+
+    def on_mousewheel(self, event):
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.offset = int(float(amount) * len(self.view))
+        elif unit == "pages":
+            self.offset += int(amount) * self.rows
+        else:
+            self.offset += int(amount)
+        self.render()
+
+    # Selection
+    def on_click(self, event):
+        self.extend_selection = bool(event.state & 0x0005)  # Shift or Control held
+
+    def on_listbox_select(self, event):
+        selected_rows = set(self.listbox.curselection())
+        visible_ids = [self.ids[p] for p in self.view[self.offset:self.offset + len(self.rendered)]]
+        if self.selectmode == tk.EXTENDED and self.extend_selection:
+            for row, item_id in enumerate(visible_ids):
+                if row in selected_rows:
+                    self.selected.add(item_id)
+                else:
+                    self.selected.discard(item_id)
+        else:
+            self.selected = {visible_ids[row] for row in selected_rows if row < len(visible_ids)}
+        for callback in self.select_callbacks:
+            callback(event)
+
+class GuiBridge:
+    # The only way the bot thread touches Tk. Updates are queued from any thread and applied
+    # once per tick on the Tk main loop: log lines are joined into a single insert and only the
+    # latest contents of each list are applied (VirtualList then redraws just the visible rows).
+    def __init__(self, root, log_text, lists, interval=50, max_log_lines=2000):
+        self.root = root
+        self.log_text = log_text
+        self.lists = lists  # name -> VirtualList
+        self.interval = interval
+        self.max_log_lines = max_log_lines
+        self.log_lines = 0
+        self.queue = queue.SimpleQueue()
+        self.next_drain = time.monotonic() + self.interval / 1000
+        self.root.after(self.interval, self.drain)
+        REGISTRY.add_collector(lambda: [("friendbot_gui_queue_depth", {}, self.queue.qsize())])
+
+    def log(self, message):
+        self.queue.put(("log", message))
+
+    def clear_log(self):
+        self.queue.put(("clear_log", None))
+
+    def set_list(self, name, items):
+        self.queue.put(("list", (name, list(items))))
+
+    def update_list_item(self, name, item):
+        self.queue.put(("list_item", (name, item)))
+
+    def call_soon(self, callback):
+        self.queue.put(("call", callback))
+
+    def run_async(self, loop, coro, on_result=None, on_error=None, timeout=None):
+        # Runs coro on the bot loop and calls on_result(value) or on_error(exception) back on the Tk
+        # thread. Returns the Future; cancel() on it cancels the coroutine and skips the callbacks.
+        future = submit(loop, coro, timeout)
+
+        def done(future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                if on_result:
+                    self.call_soon(lambda: on_result(future.result()))
+            elif on_error:
+                self.call_soon(lambda: on_error(error))
+            else:
+                self.log(f"Background task failed: {error!r}")
+
+        future.add_done_callback(done)
+        return future
+
+    def drain(self):
+        # A tick that runs late means the Tk main loop was busy (or blocked) for that long
+        REGISTRY.observe("friendbot_tk_stall_seconds", max(0.0, time.monotonic() - self.next_drain))
+        log_lines = []
+        lists = {}
+        list_items = {}  # name -> [(id, label), ...] to upsert after any full replacement
+        callbacks = []
+        clear_log = False
+        while True:
+            try:
+                kind, payload = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                log_lines.append(payload)
+            elif kind == "clear_log":
+                clear_log = True
+                log_lines = []
+            elif kind == "list":
+                lists[payload[0]] = payload[1]  # Only the newest contents matter
+                list_items.pop(payload[0], None)
+            elif kind == "list_item":
+                list_items.setdefault(payload[0], []).append(payload[1])
+            elif kind == "call":
+                callbacks.append(payload)
+
+        try:
+            if clear_log or log_lines:
+                self.apply_log(log_lines, clear_log)
+            for name, items in lists.items():
+                self.lists[name].set_items(items)
+            for name, items in list_items.items():
+                for item_id, label in items:
+                    self.lists[name].upsert_item(item_id, label)
+        except Exception as e:
+            print(f"Error updating GUI: {e}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in GUI callback: {e}")
+        self.next_drain = time.monotonic() + self.interval / 1000
+        self.root.after(self.interval, self.drain)
+
+    def apply_log(self, lines, clear):
+        self.log_text.config(state=tk.NORMAL)
+        if clear:
+            self.log_text.delete("1.0", tk.END)
+            self.log_lines = 0
+        if lines:
+            text = "\n".join(lines) + "\n"
+            self.log_text.insert(tk.END, text)
+            self.log_lines += text.count("\n")
+            excess = self.log_lines - self.max_log_lines
+            if excess > 0:
+                self.log_text.delete("1.0", f"{excess + 1}.0")
+                self.log_lines -= excess
+            self.log_text.see(tk.END)
+        self.log_text.config(state=tk.DISABLED)
+
+class BotView:
+    # Per-bot UI sink with the same interface as GuiBridge. It remembers the bot's latest lists
+    # and recent log so switching bots can restore them, and only reaches the widgets while selected.
+    def __init__(self, bridge, max_log_lines=2000):
+        self.bridge = bridge
+        self.active = False
+        self.lists = {}
+        self.log_lines = collections.deque(maxlen=max_log_lines)
+        self.lock = threading.Lock()
+        self.snapshot = None  # Lists saved at the last shutdown, shown until the bot is ready
+
+    def log(self, message):
+        with self.lock:
+            self.log_lines.append(message)
+            if self.active:
+                self.bridge.log(message)
+
+    def set_list(self, name, items):
+        items = list(items)
+        with self.lock:
+            self.lists[name] = items
+            if self.active:
+                self.bridge.set_list(name, items)
+
+    def update_list_item(self, name, item):
+        with self.lock:
+            items = self.lists.setdefault(name, [])
+            for i, (item_id, label) in enumerate(items):
+                if item_id == item[0]:
+                    items[i] = item
+                    break
+            else:
+                items.append(item)
+            if self.active:
+                self.bridge.update_list_item(name, item)
+
+    def call_soon(self, callback):
+        self.bridge.call_soon(callback)
+
+    def run_async(self, loop, coro, on_result=None, on_error=None, timeout=None):
+        return self.bridge.run_async(loop, coro, on_result, on_error, timeout)
+
+    def activate(self):
+        with self.lock:
+            self.active = True
+            self.bridge.clear_log()
+            for line in self.log_lines:
+                self.bridge.log(line)
+            for name in self.bridge.lists:
+                self.bridge.set_list(name, self.lists.get(name, []))
+
+    def deactivate(self):
+        with self.lock:
+            self.active = False
 
 class BotGUI:
-    def __init__(self, loop):
+    def __init__(self, loop=None):
         self.root = tk.Tk()
         self.root.title("Simple Bot Control")
         self.root.geometry("1200x700")
 
-        self.loop = loop
+        self.supervisor = BotSupervisor(loop)  # Every bot runs on this one loop, in the supervisor's thread
+        self.loop = self.supervisor.loop
+        self.closing = False
+        self.views = {}  # bot name -> BotView
+        self.bot_name = None  # Bot whose data the main tab is showing
         self.bot = None
+        self.bulk_requesters = {}  # bot name -> BulkFriendRequester
+        self.bulk_update_pending = False
+        self.backfills = {}  # bot name -> HistoryBackfill
+        self.backfill_update_pending = False
         self.saved_tokens = self.load_saved_tokens()
+        self.bot_settings = self.load_bot_settings()
 
         # Notebook (Tabs)
         self.notebook = ttk.Notebook(self.root)
@@ -314,7 +949,7 @@ class BotGUI:
         self.token_dropdown_var.set("Select Bot")
 
         # Fix: Create OptionMenu *after* defining the variable and with a default value
-        self.token_dropdown = tk.OptionMenu(self.main_tab, self.token_dropdown_var, "Select Bot", *list(self.saved_tokens.keys()), command=self.load_token)
+        self.token_dropdown = tk.OptionMenu(self.main_tab, self.token_dropdown_var, "Select Bot", *list(self.saved_tokens.keys()), command=self.select_bot)
         self.token_dropdown.grid(row=0, column=2, sticky="w", padx=5, pady=5)
 
         #Top Buttons
@@ -323,32 +958,35 @@ class BotGUI:
 
         self.server_list_label = tk.Label(self.main_tab, text="Servers:")
         self.server_list_label.grid(row=1, column=0, sticky="w", padx=5, pady=5)
-        self.server_list = Listbox(self.main_tab, width=30, height=20)
+        self.server_list = VirtualList(self.main_tab, width=30, height=20)
         self.server_list.grid(row=2, column=0, padx=5, pady=5, sticky="nsew")
-        self.server_list.bind("<<ListboxSelect>>", self.on_server_select)
+        self.server_list.bind_select(self.on_server_select)
+        self.server_list.bind("<Button-3>", self.on_server_right_click)
 
         self.dm_list_label = tk.Label(self.main_tab, text="DMs/Friends:")
         self.dm_list_label.grid(row=1, column=1, sticky="w", padx=5, pady=5)
-        self.dm_list = Listbox(self.main_tab, width=30, height=20)
+        self.dm_list = VirtualList(self.main_tab, width=30, height=20)
         self.dm_list.grid(row=2, column=1, padx=5, pady=5, sticky="nsew")
         self.dm_list.bind("<Button-3>", self.on_dm_right_click)  # Right-click event
-        self.dm_list.bind("<<ListboxSelect>>", self.on_dm_select)
+        self.dm_list.bind_select(self.on_dm_select)
 
         self.channel_list_label = tk.Label(self.main_tab, text="Channels:")
         self.channel_list_label.grid(row=1, column=2, sticky="w", padx=5, pady=5)
-        self.channel_list = Listbox(self.main_tab, width=30, height=20)
+        self.channel_list = VirtualList(self.main_tab, width=30, height=20)
         self.channel_list.grid(row=2, column=2, padx=5, pady=5, sticky="nsew")
         self.channel_list.bind("<Button-3>", self.on_channel_right_click)
-        self.channel_list.bind("<<ListboxSelect>>", self.on_channel_select)
+        self.channel_list.bind_select(self.on_channel_select)
 
         self.user_list_label = tk.Label(self.main_tab, text="Users:")
         self.user_list_label.grid(row=1, column=3, sticky="w", padx=5, pady=5)
-        self.user_list = Listbox(self.main_tab, width=30, height=20)
+        self.user_list = VirtualList(self.main_tab, width=30, height=20, selectmode=tk.EXTENDED)  # Multi-select for bulk add
         self.user_list.grid(row=2, column=3, padx=5, pady=5, sticky="nsew")
         self.user_list.bind("<Button-3>", self.on_user_right_click)
 
         self.log_label = tk.Label(self.main_tab, text="Log:")
         self.log_label.grid(row=3, column=0, sticky="w", padx=5, pady=5)
+        self.bulk_status_label = tk.Label(self.main_tab, text="")
+        self.bulk_status_label.grid(row=3, column=1, columnspan=3, sticky="e", padx=5, pady=5)
         self.log_text = scrolledtext.ScrolledText(self.main_tab, width=100, height=10)
         self.log_text.grid(row=4, column=0, columnspan=4, padx=5, pady=5, sticky="nsew")
         self.log_text.config(state=tk.DISABLED)
@@ -362,8 +1000,33 @@ class BotGUI:
         self.message_button = tk.Button(self.main_tab, text="Message", command=self.open_message_ui)
         self.message_button.grid(row=5, column=2, pady=10)
 
+        self.bulk_add_button = tk.Button(self.main_tab, text="Bulk Add", command=self.bulk_add_friends)
+        self.bulk_add_button.grid(row=5, column=3, pady=10)
+
+        self.profile_label = tk.Label(self.main_tab, text="Intents Profile:")
+        self.profile_label.grid(row=6, column=0, sticky="e", padx=5, pady=5)
+        options = tk.Frame(self.main_tab)
+        options.grid(row=6, column=1, sticky="w", padx=5, pady=5)
+        self.profile_var = tk.StringVar(self.main_tab)
+        self.profile_var.set(DEFAULT_PROFILE)
+        self.profile_dropdown = tk.OptionMenu(options, self.profile_var, *INTENT_PROFILES.keys())
+        self.profile_dropdown.pack(side="left")
+        tk.Label(options, text="Shards:").pack(side="left", padx=(10, 0))
+        self.shards_var = tk.StringVar(self.main_tab)
+        self.shards_var.set("off")
+        self.shards_box = ttk.Combobox(options, textvariable=self.shards_var, values=("off", "auto", "2", "4", "8", "16"), width=6)
+        self.shards_box.pack(side="left", padx=5)
+        actions = tk.Frame(self.main_tab)
+        actions.grid(row=6, column=2, pady=5)
+        self.broadcast_button = tk.Button(actions, text="Broadcast", command=self.open_broadcast)
+        self.broadcast_button.pack(side="left")
+        self.export_button = tk.Button(actions, text="Export", command=self.open_export)
+        self.export_button.pack(side="left", padx=5)
+        self.backfill_status_label = tk.Label(self.main_tab, text="")
+        self.backfill_status_label.grid(row=6, column=3, sticky="e", padx=5, pady=5)
+
         # Configure row and column weights for resizing
-        for i in range(6):
+        for i in range(7):
             self.main_tab.grid_rowconfigure(i, weight=0)
         self.main_tab.grid_rowconfigure(4, weight=1)
         self.main_tab.grid_columnconfigure(0, weight=1)
@@ -371,7 +1034,89 @@ class BotGUI:
         self.main_tab.grid_columnconfigure(2, weight=1)
         self.main_tab.grid_columnconfigure(3, weight=1)
 
+        self.bridge = GuiBridge(self.root, self.log_text, {
+            "servers": self.server_list,
+            "dms": self.dm_list,
+            "channels": self.channel_list,
+            "users": self.user_list,
+        })
+
+        # Bots Tab
+        self.bots_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.bots_tab, text="Bots")
+        self.bots_tree = ttk.Treeview(self.bots_tab, columns=("status", "latency", "guilds", "uptime"), show="tree headings")
+        self.bots_tree.heading("#0", text="Bot")
+        self.bots_tree.heading("status", text="Status")
+        self.bots_tree.heading("latency", text="Latency")
+        self.bots_tree.heading("guilds", text="Guilds")
+        self.bots_tree.heading("uptime", text="Uptime")
+        self.bots_tree.pack(fill="both", expand=True, padx=5, pady=5)
+        self.bots_tree.bind("<Double-1>", self.on_bots_tree_select)
+
+        # Search Tab
+        self.search_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.search_tab, text="Search")
+        self.search_page = 0
+        self.search_results = []
+        self.search_future = None
+        self.search_seq = 0
+        search_bar = tk.Frame(self.search_tab)
+        search_bar.pack(fill="x", padx=5, pady=5)
+        tk.Label(search_bar, text="Keywords:").pack(side="left")
+        self.search_entry = tk.Entry(search_bar, width=40)
+        self.search_entry.pack(side="left", padx=5)
+        self.search_entry.bind("<Return>", lambda event: self.run_search(0))
+        tk.Label(search_bar, text="Author ID:").pack(side="left")
+        self.search_author_entry = tk.Entry(search_bar, width=20)
+        self.search_author_entry.pack(side="left", padx=5)
+        tk.Label(search_bar, text="Channel ID:").pack(side="left")
+        self.search_channel_entry = tk.Entry(search_bar, width=20)
+        self.search_channel_entry.pack(side="left", padx=5)
+        tk.Button(search_bar, text="Search", command=lambda: self.run_search(0)).pack(side="left", padx=5)
+        self.search_prev_button = tk.Button(search_bar, text="< Prev", state=tk.DISABLED, command=lambda: self.run_search(self.search_page - 1))
+        self.search_prev_button.pack(side="left")
+        self.search_next_button = tk.Button(search_bar, text="Next >", state=tk.DISABLED, command=lambda: self.run_search(self.search_page + 1))
+        self.search_next_button.pack(side="left")
+        self.search_status_label = tk.Label(search_bar, text="")
+        self.search_status_label.pack(side="left", padx=5)
+        self.search_tree = ttk.Treeview(self.search_tab, columns=("channel", "author", "time", "message"), show="headings")
+        self.search_tree.heading("channel", text="Channel")
+        self.search_tree.heading("author", text="Author")
+        self.search_tree.heading("time", text="Time")
+        self.search_tree.heading("message", text="Message")
+        self.search_tree.column("message", width=600)
+        self.search_tree.pack(fill="both", expand=True, padx=5, pady=5)
+        self.search_tree.bind("<Double-1>", self.on_search_result_open)
+
+        # Stats Tab
+        self.stats_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.stats_tab, text="Stats")
+        self.stats_label = tk.Label(self.stats_tab, text="", anchor="w")
+        self.stats_label.pack(fill="x", padx=5, pady=5)
+        self.stats_tree = ttk.Treeview(self.stats_tab, columns=("labels", "value"), show="tree headings")
+        self.stats_tree.heading("#0", text="Metric")
+        self.stats_tree.heading("labels", text="Labels")
+        self.stats_tree.heading("value", text="Value")
+        self.stats_tree.column("#0", width=300)
+        self.stats_tree.column("value", width=500)
+        self.stats_tree.pack(fill="both", expand=True, padx=5, pady=5)
+        try:
+            self.metrics_server = MetricsServer()
+            self.stats_label.config(text=f"Prometheus metrics: http://127.0.0.1:{self.metrics_server.port}/metrics")
+        except OSError as e:
+            self.metrics_server = None
+            self.stats_label.config(text=f"Metrics endpoint unavailable: {e}")
+
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.root.after(2000, self.refresh_bot_health)
+        self.root.after(2000, self.refresh_stats)
+
+        # Show the bot used last, with the lists it had when it shut down
+        self.ready_bots = set()
+        last_bot = max((name for name in self.saved_tokens if name in self.bot_settings), key=lambda name: self.bot_settings[name].get("last_started", 0), default=None)
+        if last_bot:
+            self.select_bot(last_bot)
+        self.bridge.call_soon(self.report_window_ready)  # Runs after the restored lists are applied
 
     def start_bot(self):
         token = self.token_entry.get()
@@ -379,55 +1124,226 @@ class BotGUI:
             messagebox.showerror("Error", "Please enter a bot token.")
             return
 
-        if self.bot is not None:
-            messagebox.showinfo("Info", "Bot is already running. Stop it first.")
+        bot_name = self.save_token(self.token_dropdown_var.get(), token)
+        if not bot_name:
             return
 
-        self.save_token(self.token_dropdown_var.get(), token)
-
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.delete("1.0", tk.END)
-        self.log_text.config(state=tk.DISABLED)
+        if self.supervisor.is_running(bot_name):
+            messagebox.showinfo("Info", f"{bot_name} is already running. Stop it first.")
+            return
 
-        self.bot = FriendBot(token, self.log_text, self.server_list, self.dm_list, self.channel_list, self.user_list)
-        self.start_button.config(state=tk.DISABLED)
-        self.stop_button.config(state=tk.NORMAL)
+        profile = self.profile_var.get()
+        shards = self.shards_var.get().strip().lower() or "off"
+        if shards not in ("off", "auto") and not (shards.isdigit() and int(shards) > 0):
+            messagebox.showerror("Error", "Shards must be off, auto or a number of shards.")
+            return
+        self.bot_settings.setdefault(bot_name, {}).update(intents_profile=profile, shards=shards, last_started=time.time())
+        self.save_bot_settings()
 
-        threading.Thread(target=self.bot.run_bot).start()
+        view = self.views.get(bot_name) or BotView(self.bridge)  # A restored view is updated in place once the bot is ready
+        self.views[bot_name] = view
+        from bot import create_bot
+        bot = create_bot(token, view, None if shards == "off" else shards, intents_profile=profile)
+        self.supervisor.start_bot(bot_name, bot)
+        self.show_bot(bot_name)
 
     def stop_bot(self):
-        if self.bot is None:
+        if self.bot_name is None or not self.supervisor.is_running(self.bot_name):
             messagebox.showinfo("Info", "Bot is not running.")
             return
 
+        self.supervisor.stop_bot(self.bot_name)
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
-        asyncio.run_coroutine_threadsafe(self.bot.close(), self.loop)
 
-    def on_closing(self):
-        if self.bot:
-            asyncio.run_coroutine_threadsafe(self.bot.close(), self.loop)
+    def select_bot(self, bot_name):
+        self.token_dropdown_var.set(bot_name)
+        self.load_token(bot_name)
+        self.profile_var.set(self.bot_settings.get(bot_name, {}).get("intents_profile", DEFAULT_PROFILE))
+        self.shards_var.set(self.bot_settings.get(bot_name, {}).get("shards", "off"))
+        self.show_bot(bot_name)
+
+    def show_bot(self, bot_name):
+        # Points the main tab at bot_name; its lists and log are restored from its view
+        if self.bot_name in self.views:
+            self.views[self.bot_name].deactivate()
+        self.bot_name = bot_name
+        self.bot = self.supervisor.get(bot_name)
+        view = self.views.get(bot_name)
+        if view is None:
+            view = self.snapshot_view(bot_name)
+            if view:
+                self.views[bot_name] = view
+        if view:
+            view.activate()
+        else:
+            self.bridge.clear_log()
+            for name in self.bridge.lists:
+                self.bridge.set_list(name, [])
+        running = self.supervisor.is_running(bot_name)
+        self.start_button.config(state=tk.DISABLED if running else tk.NORMAL)
+        self.stop_button.config(state=tk.NORMAL if running else tk.DISABLED)
+        self.show_bulk_progress()
+        self.show_backfill_progress()
+
+    def snapshot_view(self, bot_name):
+        # A view with the lists saved when bot_name last shut down, or None if there are none
+        folder = self.bot_settings.get(bot_name, {}).get("data_folder")
+        snapshot = load_snapshot(folder) if folder else None
+        if snapshot is None:
+            return None
+        view = BotView(self.bridge)
+        view.lists = {"servers": snapshot["servers"], "dms": snapshot["dms"]}
+        view.snapshot = snapshot
+        saved_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(snapshot["saved_at"] or 0))
+        view.log_lines.append(f"Showing the lists saved on {saved_at}. Start the bot to connect.")
+        return view
+
+    def report_window_ready(self):
+        self.root.update_idletasks()
+        REGISTRY.set_gauge("friendbot_gui_startup_seconds", time.perf_counter() - STARTED)
+
+    def on_bot_ready(self, bot_name):
+        # Remembers where the bot keeps its data (for the next launch's snapshot) and replaces
+        # the saved channel list of the selected server with the live one
+        bot = self.supervisor.get(bot_name)
+        settings = self.bot_settings.setdefault(bot_name, {})
+        if bot.bot_data_folder and settings.get("data_folder") != bot.bot_data_folder:
+            settings["data_folder"] = bot.bot_data_folder
+            self.save_bot_settings()
+        view = self.views.get(bot_name)
+        if view:
+            view.snapshot = None
+        if bot_name == self.bot_name:
+            selection = self.server_list.selected_ids()
+            if selection:
+                bot.populate_channels(selection[0])
+
+    def refresh_bot_health(self):
+        for health in self.supervisor.health():
+            if health["status"] == "ready" and health["name"] not in self.ready_bots:
+                self.ready_bots.add(health["name"])
+                self.on_bot_ready(health["name"])
+            elif health["status"] != "ready":
+                self.ready_bots.discard(health["name"])
+            latency = f"{health['latency_ms']} ms" if health["latency_ms"] is not None else "-"
+            status = f"failed: {health['error']}" if health["error"] else health["status"]
+            uptime = f"{int(health['uptime']) // 3600}h{int(health['uptime']) // 60 % 60:02d}m"
+            values = (status, latency, health["guilds"], uptime)
+            if self.bots_tree.exists(health["name"]):
+                self.bots_tree.item(health["name"], values=values)
+            else:
+                self.bots_tree.insert("", tk.END, iid=health["name"], text=health["name"], values=values)
+            stale = set(self.bots_tree.get_children(health["name"]))
+            for shard in health["shards"]:
+                iid = f"{health['name']}/shard{shard['id']}"
+                latency = f"{shard['latency_ms']} ms" if shard["latency_ms"] is not None else "-"
+                values = (shard["status"], latency, shard["guilds"], "")
+                if self.bots_tree.exists(iid):
+                    self.bots_tree.item(iid, values=values)
+                else:
+                    self.bots_tree.insert(health["name"], tk.END, iid=iid, text=f"Shard {shard['id']}", values=values)
+                stale.discard(iid)
+            if stale:
+                self.bots_tree.delete(*stale)
+        if self.bot_name:
+            running = self.supervisor.is_running(self.bot_name)
+            self.start_button.config(state=tk.DISABLED if running else tk.NORMAL)
+            self.stop_button.config(state=tk.NORMAL if running else tk.DISABLED)
+        self.root.after(2000, self.refresh_bot_health)
+
+    def refresh_stats(self):
+        # Only redrawn while the Stats tab is showing
+        try:
+            if self.notebook.select() == str(self.stats_tab):
+                self.stats_tree.delete(*self.stats_tree.get_children())
+                for name, labels, value in REGISTRY.snapshot():
+                    self.stats_tree.insert("", tk.END, text=name, values=(labels, value))
+        except Exception as e:
+            print(f"Error refreshing stats: {e}")
+        self.root.after(2000, self.refresh_stats)
+
+    def on_bots_tree_select(self, event):
+        selection = self.bots_tree.selection()
+        if selection:
+            self.select_bot(self.bots_tree.parent(selection[0]) or selection[0])  # A shard row selects its bot
+            self.notebook.select(self.main_tab)
 
+    def run_search(self, page):
+        if self.bot is None or self.bot.search_index is None:
+            messagebox.showinfo("Info", "Start the bot first.")
+            return
+        try:
+            user_id = int(self.search_author_entry.get()) if self.search_author_entry.get().strip() else None
+            channel_id = int(self.search_channel_entry.get()) if self.search_channel_entry.get().strip() else None
+        except ValueError:
+            messagebox.showinfo("Error", "IDs must be numbers.")
+            return
+        # Large indexes take a while to search, so it runs on a worker thread; a newer search drops the older one
+        if self.search_future:
+            self.search_future.cancel()
+        self.search_seq += 1
+        seq = self.search_seq
+        started = time.perf_counter()
+        page = max(0, page)
+        self.search_status_label.config(text="Searching...")
+        search = asyncio.to_thread(self.bot.search_index.search, self.search_entry.get(), channel_id, user_id, page=page)
+        self.search_future = self.bridge.run_async(self.loop, search, lambda result: self.show_search_results(seq, page, *result, (time.perf_counter() - started) * 1000),
+                                                   lambda error: self.search_status_label.config(text=f"Search failed: {error}"))
+
+    def show_search_results(self, seq, page, results, has_more, elapsed):
+        if seq != self.search_seq:
+            return  # A newer search was started meanwhile
+        self.search_future = None
+        self.search_page = page
+        self.search_results = results
+
+        self.search_tree.delete(*self.search_tree.get_children())
+        for i, result in enumerate(results):
+            channel = self.bot.get_channel(int(result["channel_id"]))
+            channel_name = getattr(channel, "name", None) or result["channel_id"]
+            user = self.bot.user_cache.get(result["user_id"]) if isinstance(result["user_id"], int) else None
+            author = user.name if user else result["user_id"]
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(result["created_at"])) if result["created_at"] else ""
+            self.search_tree.insert("", tk.END, iid=str(i), values=(channel_name, author, when, result["snippet"]))
+        self.search_prev_button.config(state=tk.NORMAL if self.search_page > 0 else tk.DISABLED)
+        self.search_next_button.config(state=tk.NORMAL if has_more else tk.DISABLED)
+        self.search_status_label.config(text=f"Page {self.search_page + 1}, {len(results)} results in {elapsed:.0f} ms")
+
+    def on_search_result_open(self, event):
+        selection = self.search_tree.selection()
+        if selection and self.bot:
+            ChatWindow(self.root, self.bot, self.search_results[int(selection[0])]["channel_id"], self.view_profile)
+
+    def on_closing(self):
+        # Bots are closed and the loop thread joined before Tk goes away, so data is saved and nothing is killed mid-write
+        if self.closing:
+            return
+        self.closing = True
+        self.root.withdraw()
+        self.supervisor.shutdown(timeout=10)
+        if self.metrics_server:
+            self.metrics_server.close()
         self.root.destroy()
-        os._exit(0)
 
     def on_server_select(self, event):
-        selection = self.server_list.curselection()
-        if selection:
-            server_info = self.server_list.get(selection[0])
-            server_id = int(server_info.split("(")[1].split(")")[0])
-            self.bot.populate_channels(server_id)
+        selection = self.server_list.selected_ids()
+        if not selection:
+            return
+        if self.bot and self.bot.running:
+            self.bot.populate_channels(selection[0])
+        else:
+            view = self.views.get(self.bot_name)
+            if view and view.snapshot:
+                view.set_list("channels", view.snapshot["channels"].get(selection[0], []))
 
     def on_dm_select(self, event):
         pass
 
     def on_channel_select(self, event):
-        try:
-            channel_info = self.channel_list.get(self.channel_list.curselection()[0])
-            channel_id = int(channel_info.split("(")[1].split(")")[0])
-            self.bot.populate_users(channel_id)
-        except IndexError:
-            pass
+        selection = self.channel_list.selected_ids()
+        if selection and self.bot:
+            self.bot.populate_users(selection[0])
 
 
     def on_dm_right_click(self, event):
@@ -435,25 +1351,37 @@ class BotGUI:
 
     def on_channel_right_click(self, event):
         try:
-            selection = self.channel_list.curselection()
-            if selection:
-                channel_info = self.channel_list.get(selection[0])
-                channel_id = int(channel_info.split("(")[1].split(")")[0])
+            channel_id = self.channel_list.id_at(event.y)
+            if channel_id:
+                self.channel_list.select_id(channel_id)
 
                 menu = Menu(self.root, tearoff=0)
                 menu.add_command(label="Message", command=lambda: self.open_message_ui(channel_id=channel_id))
                 menu.add_command(label="Users", command=lambda: self.on_users_button(channel_id)) #Now calls on_users_button
+                menu.add_command(label="Backfill History", command=lambda: self.backfill_history([channel_id]))
+                menu.add_command(label="Broadcast...", command=lambda: self.open_broadcast([("channel", channel_id)]))
+                menu.add_command(label="Export History...", command=lambda: self.open_export([channel_id]))
                 menu.tk_popup(event.x_root, event.y_root, 0)
         except Exception as e:
             print(f"Error showing context menu: {e}")
 
-    def on_user_right_click(self, event):
+    def on_server_right_click(self, event):
         try:
-            selection = self.user_list.curselection()
-            if selection:
-                user_info = self.user_list.get(selection[0])
-                user_id = int(user_info.split("(")[1].split(")")[0])
+            server_id = self.server_list.id_at(event.y)
+            if server_id and self.bot:
+                guild = self.bot.get_guild(server_id)
+                if guild:
+                    menu = Menu(self.root, tearoff=0)
+                    menu.add_command(label="Backfill All Channels", command=lambda: self.backfill_history([channel.id for channel in guild.text_channels]))
+                    menu.add_command(label="Export History...", command=lambda: self.open_export([channel.id for channel in guild.text_channels]))
+                    menu.tk_popup(event.x_root, event.y_root, 0)
+        except Exception as e:
+            print(f"Error showing context menu: {e}")
 
+    def on_user_right_click(self, event):
+        try:
+            user_id = self.user_list.id_at(event.y)
+            if user_id:
                 menu = Menu(self.root, tearoff=0)
                 menu.add_command(label="View Profile", command=lambda: self.view_profile(user_id))
                 menu.tk_popup(event.x_root, event.y_root, 0)
@@ -468,6 +1396,17 @@ class BotGUI:
         except FileNotFoundError:
             return {}
 
+    def load_bot_settings(self):
+        try:
+            with open("bot_settings.json", "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_bot_settings(self):
+        with open("bot_settings.json", "w") as f:
+            json.dump(self.bot_settings, f)
+
     def save_token(self, bot_name, token):
         if not bot_name or bot_name == "Select Bot":
             bot_name = simpledialog.askstring("Bot Name", "Enter a name for this bot:")
@@ -477,6 +1416,8 @@ class BotGUI:
         with open("saved_tokens.json", "w") as f:
             json.dump(self.saved_tokens, f)
         self.update_token_dropdown()
+        self.token_dropdown_var.set(bot_name)
+        return bot_name
 
     def load_token(self, bot_name):
         if bot_name in self.saved_tokens:
@@ -487,16 +1428,19 @@ class BotGUI:
         menu = self.token_dropdown["menu"]
         menu.delete(0, "end")
         for bot_name in self.saved_tokens:
-            menu.add_command(label=bot_name, command=lambda value=bot_name: self.load_token(value))
+            menu.add_command(label=bot_name, command=lambda value=bot_name: self.select_bot(value))
 
     def open_message_ui(self, channel_id=None):
+       if self.bot is None or not self.bot.running:  # Lists restored from a snapshot can be clicked before any bot runs
+           messagebox.showinfo("Info", "Start the bot first.")
+           return
        if channel_id is None:
            if self.bot.selected_server and self.bot.selected_channel:
-               try:
-                   channel_id = self.bot.channel_list.get(self.bot.channel_list.curselection()[0]).split("(")[1].split(")")[0]
-               except IndexError:
+               selection = self.channel_list.selected_ids()
+               if not selection:
                    self.log_message("No channel selected.")
                    return
+               channel_id = selection[0]
            elif self.bot.selected_dm:
                user = self.bot.get_user(self.bot.selected_dm)
                if user and user.dm_channel:
@@ -507,56 +1451,163 @@ class BotGUI:
        if channel_id:
            ChatWindow(self.root, self.bot, channel_id, self.view_profile)
 
+    def open_broadcast(self, selected=None):
+        if self.bot is None or not self.bot.running:
+            messagebox.showinfo("Info", "Start the bot first.")
+            return
+        if selected is None:  # Whatever is selected in the channel and DM lists
+            selected = [("channel", channel_id) for channel_id in self.channel_list.selected_ids()]
+            selected += [("user", user_id) for user_id in self.dm_list.selected_ids()]
+        bot = self.bot
+        # Guilds and friends change on the bot loop, so the target list is taken there
+        self.bridge.run_async(self.loop, bot.broadcast_targets(), lambda items: BroadcastWindow(self.root, bot, items, selected),
+                              lambda error: self.log_message(f"Error listing broadcast targets: {error}"))
+
+    def open_export(self, channel_ids=None):
+        if self.bot is None or self.bot.message_store is None:
+            messagebox.showinfo("Info", "Start the bot first.")
+            return
+        if channel_ids is None:  # The channels selected in the list, or all of them
+            channel_ids = self.channel_list.selected_ids()
+        ExportWindow(self.root, self.bot, channel_ids)
+
     def log_message(self, message):
-        if self.log_text:
-            try:
-                self.log_text.config(state=tk.NORMAL)
-                self.log_text.insert(tk.END, message + "\n")
-                self.log_text.see(tk.END)
-                self.log_text.config(state=tk.DISABLED)
-            except Exception as e:
-                print(f"Error in log_message: {e}")
-        else:
-            print(message)
+        self.bridge.log(message)
 
     def on_users_button(self, channel_id):
+        if self.bot is None or not self.bot.running:
+            messagebox.showinfo("Info", "Start the bot first.")
+            return
         self.bot.populate_users(channel_id) #Call the bot to populate users
         #self.notebook.select(self.main_tab) #Shows main tab
         self.notebook.select(self.main_tab) #Select back to the main tab
         self.log_message("Users button is clicked")
 
     def view_profile(self, user_id): #Now doesn't have async
-        asyncio.run_coroutine_threadsafe(self.get_and_show_profile(user_id), self.loop) #Calls to get the data
+        if self.bot is None or not self.bot.running:
+            messagebox.showinfo("Info", "Start the bot first.")
+            return
+        # Fetched on the bot loop, shown back on the Tk thread
+        self.bridge.run_async(self.loop, self.bot.user_cache.fetch(user_id), lambda user: self.show_profile(user_id, user), lambda error: self.on_profile_error(user_id, error), timeout=15)
 
-    async def get_and_show_profile(self, user_id): #We only use this to get and show the profile.
-        try:
-            user = await self.bot.fetch_user(user_id) #Gets the user and waits for the info
-            if user:
-                profile_info = f"Name: {user.name}\nID: {user.id}\nStatus: {user.status}\nCreated At: {user.created_at}\n" #We get the info for the status
-                messagebox.showinfo("Profile", profile_info) #We make the message show up after.
+    def show_profile(self, user_id, user):
+        if user:
+            profile_info = f"Name: {user.name}\nID: {user.id}\nStatus: {getattr(user, 'status', 'unknown')}\nCreated At: {user.created_at}\n" #We get the info for the status
+            messagebox.showinfo("Profile", profile_info) #We make the message show up after.
+        else:
+            self.log_message(f"User with ID {user_id} not found.")
 
-        except discord.NotFound:
+    def on_profile_error(self, user_id, error):
+        import discord
+        if isinstance(error, discord.NotFound):
             self.log_message(f"User with ID {user_id} not found.")
-        except Exception as e:
-            self.log_message(f"Error getting user data: {e}")
+        elif isinstance(error, asyncio.TimeoutError):
+            self.log_message(f"Timed out getting user {user_id}.")
+        else:
+            self.log_message(f"Error getting user data: {error}")
 
     def add_friend_by_id(self): #Add friend by ID
         user_id = simpledialog.askstring("Add User", "Enter User ID:") #Ask for the ID
         if user_id:
           try:
             user_id = int(user_id)
-            asyncio.run_coroutine_threadsafe(self.bot.send_friend_request(user_id), self.loop) #Call the bot to send the request
+            if self.bot is None or not self.bot.running:
+                messagebox.showinfo("Info", "Start the bot first.")
+                return
+            self.bridge.run_async(self.loop, self.bot.send_friend_request(user_id)) #Call the bot to send the request
             self.log_message(f"Sending friend request to {user_id}")
           except ValueError:
             messagebox.showinfo("Error", "Not a valid user ID.")
           except Exception as e:
             self.log_message(f"Error sending friend request: {e}")
 
+    def bulk_add_friends(self):
+        requester = self.bulk_requesters.get(self.bot_name)
+        if requester and requester.running:
+            if messagebox.askyesno("Bulk Add", "A bulk run is in progress. Cancel it?"):
+                requester.cancel()
+            return
+        if self.bot is None or not self.bot.running:
+            messagebox.showinfo("Info", "Start the bot first.")
+            return
+        from friend_requests import BulkFriendRequester, read_user_ids
+
+        # Selected users in the user list win, otherwise import IDs from a file
+        user_ids = self.user_list.selected_ids()
+        if not user_ids:
+            file_path = filedialog.askopenfilename(title="Import User IDs", filetypes=[("Text files", "*.txt *.csv"), ("All files", "*.*")])
+            if not file_path:
+                return
+            try:
+                user_ids = read_user_ids(file_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not read {file_path}: {e}")
+                return
+        if not user_ids:
+            messagebox.showinfo("Info", "No user IDs found.")
+            return
+        if not messagebox.askyesno("Bulk Add", f"Send friend requests to {len(user_ids)} users?"):
+            return
+
+        progress_file = os.path.join(self.bot.bot_data_folder, "friend_requests_progress.jsonl")
+        requester = BulkFriendRequester(self.bot, user_ids, progress_file, on_progress=self.on_bulk_progress)
+        self.bulk_requesters[self.bot_name] = requester
+        self.bulk_add_button.config(text="Cancel Bulk")
+        self.bridge.run_async(self.loop, requester.run())
+
+    def on_bulk_progress(self, stats):
+        # Called from the bot thread after every request; only one label update is queued at a time
+        if not self.bulk_update_pending:
+            self.bulk_update_pending = True
+            self.bridge.call_soon(self.show_bulk_progress)
+
+    def show_bulk_progress(self):
+        # Shows the run of the selected bot; other bots' runs carry on unseen
+        self.bulk_update_pending = False
+        requester = self.bulk_requesters.get(self.bot_name)
+        if requester is None:
+            self.bulk_status_label.config(text="")
+            self.bulk_add_button.config(text="Bulk Add")
+            return
+        stats = requester.stats()
+        eta = f"{int(stats['eta']) // 60}m{int(stats['eta']) % 60:02d}s" if stats["eta"] is not None else "-"
+        self.bulk_status_label.config(text=f"Bulk add: {stats['sent']} sent, {stats['failed']} failed, {stats['skipped']} skipped, {stats['remaining']} left | {stats['rate']:.1f}/s | ETA {eta}")
+        self.bulk_add_button.config(text="Cancel Bulk" if stats["running"] else "Bulk Add")
+
+    def backfill_history(self, channel_ids):
+        backfill = self.backfills.get(self.bot_name)
+        if backfill and backfill.running:
+            if messagebox.askyesno("Backfill", "A history backfill is in progress. Cancel it?"):
+                backfill.cancel()
+            return
+        if self.bot is None or not self.bot.running:
+            messagebox.showinfo("Info", "Start the bot first.")
+            return
+        from backfill import HistoryBackfill
+        checkpoint_file = os.path.join(self.bot.bot_data_folder, "backfill_checkpoints.json")
+        backfill = HistoryBackfill(self.bot, channel_ids, checkpoint_file, on_progress=self.on_backfill_progress)
+        self.backfills[self.bot_name] = backfill
+        self.bridge.run_async(self.loop, backfill.run())
+
+    def on_backfill_progress(self, stats):
+        # Called from the bot thread after every batch; only one label update is queued at a time
+        if not self.backfill_update_pending:
+            self.backfill_update_pending = True
+            self.bridge.call_soon(self.show_backfill_progress)
+
+    def show_backfill_progress(self):
+        self.backfill_update_pending = False
+        backfill = self.backfills.get(self.bot_name)
+        if backfill is None:
+            self.backfill_status_label.config(text="")
+            return
+        stats = backfill.stats()
+        state = "" if stats["running"] else " (done)"
+        self.backfill_status_label.config(text=f"Backfill{state}: {stats['channels_done']}/{stats['total']} channels, {stats['imported']} imported | {stats['rate']:.0f} msg/s")
 
     def run(self):
         self.root.mainloop()
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    gui = BotGUI(loop)
+    gui = BotGUI()
     gui.run()
\ No newline at end of file
@@ -0,0 +1,222 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from sub-millisecond handler times up to slow uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DEFAULT_PORT = 9464
+
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in key) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation; good enough to spot a slow path
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    # Process-wide counters, histograms and gauges. Recording is a dict update under a lock, cheap
+    # enough for on_message. Gauges that are expensive or owned by another object (cache sizes,
+    # queue depths) are read from collectors only when the Stats tab or /metrics asks for them.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # name -> {label key: value}
+        self.histograms = {}  # name -> {label key: Histogram}
+        self.gauges = {}  # name -> {label key: value}
+        self.help = {}
+        self.collectors = []  # Callables returning [(name, labels, value), ...] gauge samples
+
+    def describe(self, name, help_text):
+        self.help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        key = label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[label_key(labels)] = value
+
+    @contextmanager
+    def time(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def collect_gauges(self):
+        with self._lock:
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+        for collector in list(self.collectors):
+            try:
+                for name, labels, value in collector():
+                    gauges.setdefault(name, {})[label_key(labels)] = value
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        return gauges
+
+    def snapshot(self):
+        # Flat rows for the Stats tab: (name, labels, value text)
+        rows = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                for key, value in sorted(series.items()):
+                    rows.append((name, format_labels(key), str(value)))
+            for name, series in sorted(self.histograms.items()):
+                for key, h in sorted(series.items()):
+                    p50, p99 = h.quantile(0.5), h.quantile(0.99)
+                    rows.append((name, format_labels(key), f"n={h.count} avg={h.sum / h.count * 1000:.2f}ms p50<={p50 * 1000:g}ms p99<={p99 * 1000:g}ms"))
+        for name, series in sorted(self.collect_gauges().items()):
+            for key, value in sorted(series.items()):
+                rows.append((name, format_labels(key), f"{value:g}" if isinstance(value, float) else str(value)))
+        return rows
+
+    def render_prometheus(self):
+        lines = []
+
+        def header(name, kind):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                header(name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                header(name, "histogram")
+                for key, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(h.buckets + (float("inf"),), h.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {h.count}")
+        for name, series in sorted(self.collect_gauges().items()):
+            header(name, "gauge")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REGISTRY.describe("friendbot_on_message_seconds", "Time spent handling one gateway message")
+REGISTRY.describe("friendbot_save_message_seconds", "Time to hand one message to the cache, store and index")
+REGISTRY.describe("friendbot_save_data_seconds", "Time to write friends and flush the message store")
+REGISTRY.describe("friendbot_send_seconds", "End-to-end send_message_to_channel latency, uploads included")
+REGISTRY.describe("friendbot_send_failures_total", "Messages that could not be sent")
+REGISTRY.describe("friendbot_messages_total", "Messages received")
+REGISTRY.describe("friendbot_gateway_latency_seconds", "Heartbeat latency reported by discord.py")
+REGISTRY.describe("friendbot_shard_latency_seconds", "Heartbeat latency of each gateway shard")
+REGISTRY.describe("friendbot_loop_lag_seconds", "How late asyncio timers fire on the bot loop")
+REGISTRY.describe("friendbot_tk_stall_seconds", "How late the Tk main loop runs its periodic GUI update")
+REGISTRY.describe("friendbot_history_cache_bytes", "Bytes of channel history resident in memory")
+REGISTRY.describe("friendbot_history_cache_channels", "Channels resident in the history cache")
+REGISTRY.describe("friendbot_user_cache_size", "Users in the user cache")
+REGISTRY.describe("friendbot_store_backlog", "Messages queued but not yet committed to the message store")
+REGISTRY.describe("friendbot_index_backlog", "Messages queued but not yet committed to the search index")
+REGISTRY.describe("friendbot_gui_queue_depth", "GUI updates waiting for the Tk main loop")
+REGISTRY.describe("friendbot_gui_startup_seconds", "Time from launch until the window and its restored lists were drawn")
+REGISTRY.describe("friendbot_rule_match_seconds", "Time to match one message against all auto-response rules")
+REGISTRY.describe("friendbot_rule_hits_total", "Auto-response rule matches that fired (after cooldowns)")
+REGISTRY.describe("friendbot_rule_action_seconds", "Time to run a rule's reply, reaction and log actions")
+REGISTRY.describe("friendbot_export_messages_total", "Stored messages written to history exports")
+
+
+async def monitor_loop_lag(interval=0.5, registry=REGISTRY):
+    # Sleeps for interval and records how much later than that it actually woke up. Anything
+    # blocking the loop (a slow handler, sync disk I/O) shows up here for every bot on it.
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        registry.observe("friendbot_loop_lag_seconds", max(0.0, loop.time() - started - interval))
+
+
+class MetricsServer:
+    # Serves REGISTRY as Prometheus text on http://127.0.0.1:<port>/metrics from a daemon thread
+    def __init__(self, port=DEFAULT_PORT, host="127.0.0.1", registry=REGISTRY):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry_ref.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would flood stdout
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
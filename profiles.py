@@ -0,0 +1,87 @@
+import os
+import sys
+
+
+# discord is imported inside the profile functions so the GUI can list profiles without it
+def _full():
+    import discord
+    return {
+        "intents": discord.Intents.all(),
+        "member_cache_flags": discord.MemberCacheFlags.all(),
+        "chunk_guilds_at_startup": True,
+    }
+
+
+def _minimal():
+    # Only what the bot reads: guilds, channels, messages and their content. The members intent
+    # stays on so populate_users can chunk a guild on demand, but nothing is cached at startup.
+    import discord
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    intents.presences = False
+    intents.typing = False
+    intents.voice_states = False
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,  # History lives in the message store, no need for discord.py's copy
+    }
+
+
+INTENT_PROFILES = {
+    "full": _full,
+    "minimal": _minimal,
+}
+
+DEFAULT_PROFILE = "full"
+
+
+def client_options(profile):
+    # Keyword arguments for commands.Bot for the given intents profile
+    if profile not in INTENT_PROFILES:
+        raise ValueError(f"Unknown intents profile: {profile}")
+    return INTENT_PROFILES[profile]()
+
+
+def current_rss():
+    # Resident set size of this process in bytes, or None if the platform doesn't tell us
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Peak, not current, but close enough
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+        except Exception:
+            pass
+    return None
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    def delay(self, now):
+        # Seconds until a token is available, 0 if one can be taken right now
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class RateLimiter:
+    # Client-side mirror of Discord's buckets: a global bucket shared by every request plus
+    # one bucket per route. Workers call acquire() before each request and block() on 429.
+    DEFAULT_ROUTES = {
+        "fetch_user": (5, 1.0),
+        "create_dm": (2, 1.0),
+        "send_message": (5, 5.0),
+        "history": (5, 1.0),
+    }
+
+    def __init__(self, global_rate=50, global_per=1.0, routes=None):
+        self.global_bucket = TokenBucket(global_rate, global_per)
+        self.route_limits = dict(self.DEFAULT_ROUTES)
+        if routes:
+            self.route_limits.update(routes)
+        self.buckets = {}
+
+    def bucket(self, route):
+        # Routes can carry a major parameter, e.g. "history:<channel_id>" gets its own bucket per channel
+        if route not in self.buckets:
+            rate, per = self.route_limits.get(route.split(":")[0], (5, 1.0))
+            self.buckets[route] = TokenBucket(rate, per)
+        return self.buckets[route]
+
+    async def acquire(self, route):
+        # Checking and taking happen without an await in between, so no lock is needed; waiting
+        # happens outside of any lock, so a blocked route never holds up requests to other routes.
+        bucket = self.bucket(route)
+        while True:
+            now = time.monotonic()
+            wait = max(self.global_bucket.delay(now), bucket.delay(now))
+            if wait <= 0:
+                self.global_bucket.take()
+                bucket.take()
+                return
+            await asyncio.sleep(wait)
+
+    def block(self, route, retry_after, is_global=False):
+        if is_global:
+            self.global_bucket.block(retry_after)
+        else:
+            self.bucket(route).block(retry_after)
+
+
+def retry_after_from(error, default=1.0):
+    # Reads the wait time out of a discord.HTTPException for a 429
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", default))
+    except (TypeError, ValueError):
+        return default
+
+
+def is_global_limit(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    return headers.get("X-RateLimit-Global", "").lower() == "true"
@@ -0,0 +1,397 @@
+import asyncio
+import collections
+import json
+import os
+import re
+import time
+
+from metrics import REGISTRY
+from ratelimit import RateLimiter
+
+REGEX_CHUNK = 200  # Regex rules merged into one pattern
+MIN_TRIGGER = 3  # Shorter literal prefixes occur in too many messages to be worth it
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class AhoCorasick:
+    # Finds every occurrence of any of a set of keywords in a single pass over the text,
+    # however many keywords there are
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for keyword, value in keywords:
+            node = 0
+            for ch in keyword:
+                child = self.goto[node].get(ch)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][ch] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                node = child
+            self.out[node] += ((value, len(keyword)),)
+
+        pending = collections.deque(self.goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for ch, child in self.goto[node].items():
+                pending.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                self.out[child] += self.out[self.fail[child]]  # Keywords ending at the fallback state end here too
+
+    def search(self, text):
+        # Yields (value, start, end) for every keyword occurrence
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for value, length in out[node]:
+                yield value, i + 1 - length, i + 1
+
+
+def is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+def has_top_level_alternation(pattern):
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def literal_prefix(pattern):
+    # Literal text every match of pattern starts with (after a leading ^ or \b), or "" when
+    # there is none we can be sure of. A regex is only run when its prefix occurs in the text.
+    if has_top_level_alternation(pattern):
+        return ""
+    i = 0
+    while pattern.startswith(("^", "\\b"), i):
+        i += 1 if pattern[i] == "^" else 2
+    prefix = []
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                break  # A class like \d or \w, not a literal
+            literal, step = pattern[i + 1], 2
+        elif ch in ".[]()|^$+*?{}":
+            break
+        else:
+            literal, step = ch, 1
+        following = pattern[i + step:i + step + 1]
+        if following in ("?", "*", "{"):
+            break  # Optional or counted: not required
+        prefix.append(literal)
+        i += step
+        if following == "+":
+            break
+    return "".join(prefix)
+
+
+class Placeholders(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+class Rule:
+    COOLDOWN_SCOPES = ("channel", "user", "global")
+
+    def __init__(self, data, position):
+        self.id = str(data.get("id") or f"rule{position}")
+        keywords = data.get("keywords") or []
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        if data.get("keyword"):
+            keywords = keywords + [data["keyword"]]
+        self.keywords = [keyword for keyword in keywords if keyword]
+        self.regex = data.get("regex")
+        self.case_sensitive = bool(data.get("case_sensitive", False))
+        self.whole_word = bool(data.get("whole_word", False))
+        self.channels = {int(channel_id) for channel_id in data.get("channels") or []}
+        self.guilds = {int(guild_id) for guild_id in data.get("guilds") or []}
+        self.dm_only = bool(data.get("dm_only", False))
+        self.reply = data.get("reply")
+        self.react = data.get("react")
+        self.log = bool(data.get("log", False))
+        self.cooldown = float(data.get("cooldown", 0))
+        self.cooldown_scope = data.get("cooldown_scope", "channel")
+        self.enabled = bool(data.get("enabled", True))
+        if not self.keywords and not self.regex:
+            raise ValueError(f"rule {self.id} has neither keywords nor regex")
+        if self.cooldown_scope not in self.COOLDOWN_SCOPES:
+            raise ValueError(f"rule {self.id}: cooldown_scope must be one of {', '.join(self.COOLDOWN_SCOPES)}")
+        if self.regex:
+            re.compile(self.regex, 0 if self.case_sensitive else re.IGNORECASE)  # Fail here rather than in the merged pattern
+
+    def applies_to(self, channel):
+        guild = getattr(channel, "guild", None)
+        if self.dm_only and guild is not None:
+            return False
+        if self.channels and channel.id not in self.channels:
+            return False
+        if self.guilds and (guild is None or guild.id not in self.guilds):
+            return False
+        return True
+
+
+class RuleSet:
+    # All rules compiled into as few matchers as possible: one automaton for case-insensitive
+    # keywords, one for case-sensitive ones, and regexes merged REGEX_CHUNK at a time into a
+    # pattern that reports every rule matching at a position (so one rule never hides another).
+    # Regexes that start with a literal are not merged: the literal goes into the case-insensitive
+    # automaton as a trigger and the regex only runs on messages that contain it. A message is
+    # scanned once per matcher, however many rules there are.
+    def __init__(self, rules):
+        self.rules = rules
+        folded, exact = [], []
+        self.triggered = {}  # rule index -> compiled regex, run when its literal prefix is seen
+        mergeable = []
+        self.standalone = []  # [(compiled, rule index)] for patterns that cannot be merged
+        for index, rule in enumerate(rules):
+            if not rule.enabled:
+                continue
+            for keyword in rule.keywords:
+                if rule.case_sensitive:
+                    exact.append((keyword, index))
+                else:
+                    folded.append((keyword.lower(), index))
+            if not rule.regex:
+                continue
+            prefix = literal_prefix(rule.regex)
+            if len(prefix) >= MIN_TRIGGER:
+                folded.append((prefix.lower(), ("regex", index)))
+                self.triggered[index] = re.compile(rule.regex, 0 if rule.case_sensitive else re.IGNORECASE)
+            elif BACKREFERENCE.search(rule.regex) or not self.can_merge(index, rule):
+                self.standalone.append((re.compile(rule.regex, 0 if rule.case_sensitive else re.IGNORECASE), index))
+            else:
+                mergeable.append((index, rule))
+        self.folded = AhoCorasick(folded) if folded else None
+        self.exact = AhoCorasick(exact) if exact else None
+
+        self.merged = []  # [(compiled, [(group number, rule index), ...]), ...]
+        for start in range(0, len(mergeable), REGEX_CHUNK):
+            self.merge(mergeable[start:start + REGEX_CHUNK])
+
+    def merged_pattern(self, chunk):
+        patterns = [(index, rule.regex if rule.case_sensitive else f"(?i:{rule.regex})") for index, rule in chunk]
+        prefilter = "|".join(f"(?:{pattern})" for index, pattern in patterns)
+        groups = "".join(f"(?:(?=(?P<rule{index}>{pattern})))?" for index, pattern in patterns)
+        return f"(?=(?:{prefilter})){groups}"
+
+    def can_merge(self, index, rule):
+        # Global flags and named groups cannot be embedded in the merged pattern
+        try:
+            re.compile(self.merged_pattern([(index, rule)]))
+            return True
+        except re.error:
+            return False
+
+    def merge(self, chunk):
+        try:
+            compiled = re.compile(self.merged_pattern(chunk))
+        except re.error:
+            # Rules that merge on their own but not together; halve the chunk until they are apart
+            if len(chunk) == 1:
+                index, rule = chunk[0]
+                self.standalone.append((re.compile(rule.regex, 0 if rule.case_sensitive else re.IGNORECASE), index))
+            else:
+                self.merge(chunk[:len(chunk) // 2])
+                self.merge(chunk[len(chunk) // 2:])
+            return
+        self.merged.append((compiled, [(compiled.groupindex[f"rule{index}"], index) for index, rule in chunk]))
+
+    def match(self, text):
+        # Indexes of the rules whose keywords or regex occur in text
+        matched = set()
+        candidates = set()  # Regex rules whose literal prefix occurs in text
+        if self.folded:
+            self.scan_keywords(self.folded, text.lower(), matched, candidates)
+        if self.exact:
+            self.scan_keywords(self.exact, text, matched, candidates)
+        for index in candidates:
+            if index not in matched and self.triggered[index].search(text):
+                matched.add(index)
+        for compiled, groups in self.merged:
+            for m in compiled.finditer(text):
+                for group, index in groups:
+                    if m.start(group) != -1:
+                        matched.add(index)
+        for compiled, index in self.standalone:
+            if index not in matched and compiled.search(text):
+                matched.add(index)
+        return matched
+
+    def scan_keywords(self, automaton, text, matched, candidates):
+        rules = self.rules
+        for index, start, end in automaton.search(text):
+            if type(index) is tuple:
+                candidates.add(index[1])
+                continue
+            if index in matched:
+                continue
+            if rules[index].whole_word:
+                if start > 0 and is_word_char(text[start - 1]) or end < len(text) and is_word_char(text[end]):
+                    continue
+            matched.add(index)
+
+
+def load_rules(path):
+    # Reads a rules file ({"rules": [...]} or a bare list) and compiles it; raises on any invalid rule
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("rules", [])
+    rules = [Rule(item, position) for position, item in enumerate(data)]
+    seen = set()
+    for rule in rules:
+        if rule.id in seen:
+            raise ValueError(f"duplicate rule id: {rule.id}")
+        seen.add(rule.id)
+    return RuleSet(rules)
+
+
+class RuleEngine:
+    # Runs the rules in BotData/<name>/rules.json against every incoming message. Matching is
+    # synchronous and cheap; replies and reactions run as tasks so on_message never waits on
+    # Discord. The file is polled for changes and recompiled off the loop, then swapped in whole,
+    # so a broken edit keeps the previous rules running.
+    def __init__(self, bot, rules_file, limiter=None, poll_interval=2.0):
+        self.bot = bot
+        self.rules_file = rules_file
+        self.limiter = limiter or RateLimiter()
+        self.poll_interval = poll_interval
+        self.ruleset = RuleSet([])
+        self.mtime = None
+        self.cooldowns = {}  # (rule id, scope key) -> monotonic time the rule may fire again
+        self.counters = {}  # rule id -> {"hits", "cooldown_skips", "errors", "last_hit"}
+        self.tasks = set()
+
+    async def watch(self):
+        while True:
+            try:
+                await self.reload()
+            except Exception as e:
+                self.bot.log_message(f"Error reloading rules: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def reload(self, force=False):
+        # Returns True if new rules were swapped in
+        try:
+            mtime = os.stat(self.rules_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime and not force:
+            return False
+        self.mtime = mtime
+        if mtime is None:
+            if self.ruleset.rules:
+                self.ruleset = RuleSet([])
+                self.bot.log_message("Rules file removed, all rules disabled")
+            return True
+        started = time.perf_counter()
+        try:
+            ruleset = await asyncio.get_running_loop().run_in_executor(None, load_rules, self.rules_file)
+        except (OSError, ValueError, re.error) as e:
+            self.bot.log_message(f"Rules not reloaded, keeping the previous {len(self.ruleset.rules)}: {e}")
+            return False
+        self.ruleset = ruleset
+        active = {rule.id for rule in ruleset.rules}
+        self.cooldowns = {key: until for key, until in self.cooldowns.items() if key[0] in active}
+        self.bot.log_message(f"Loaded {len(ruleset.rules)} rules in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return True
+
+    def handle(self, message):
+        ruleset = self.ruleset
+        if not ruleset.rules or getattr(message.author, "bot", False):
+            return  # Replying to bots invites reply loops
+        bot = self.bot.metrics_name
+        started = time.perf_counter()
+        matched = ruleset.match(message.content)
+        REGISTRY.observe("friendbot_rule_match_seconds", time.perf_counter() - started, bot=bot)
+        if not matched:
+            return
+        now = time.monotonic()
+        for index in sorted(matched):
+            rule = ruleset.rules[index]
+            if not rule.applies_to(message.channel):
+                continue
+            counters = self.counters.setdefault(rule.id, {"hits": 0, "cooldown_skips": 0, "errors": 0, "last_hit": None})
+            if rule.cooldown:
+                key = (rule.id, self.cooldown_key(rule, message))
+                if self.cooldowns.get(key, 0) > now:
+                    counters["cooldown_skips"] += 1
+                    continue
+                self.cooldowns[key] = now + rule.cooldown
+            counters["hits"] += 1
+            counters["last_hit"] = time.time()
+            REGISTRY.inc("friendbot_rule_hits_total", bot=bot, rule=rule.id)
+            task = asyncio.create_task(self.run_actions(rule, message))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        if len(self.cooldowns) > 10000:
+            self.cooldowns = {key: until for key, until in self.cooldowns.items() if until > now}
+
+    def cooldown_key(self, rule, message):
+        if rule.cooldown_scope == "user":
+            return message.author.id
+        if rule.cooldown_scope == "channel":
+            return message.channel.id
+        return None
+
+    async def run_actions(self, rule, message):
+        started = time.perf_counter()
+        try:
+            if rule.log:
+                self.bot.log_message(f"Rule {rule.id} matched {message.author.name} in {getattr(message.channel, 'name', None) or 'DM'}: {message.content[:200]}")
+            if rule.react:
+                await self.limiter.acquire(f"add_reaction:{message.channel.id}")
+                await message.add_reaction(rule.react)
+            if rule.reply:
+                await self.bot.deliver_message(message.channel, self.format_reply(rule.reply, message), limiter=self.limiter)
+        except Exception as e:
+            self.counters[rule.id]["errors"] += 1
+            self.bot.log_message(f"Rule {rule.id} failed: {e}")
+        REGISTRY.observe("friendbot_rule_action_seconds", time.perf_counter() - started, bot=self.bot.metrics_name, rule=rule.id)
+
+    def format_reply(self, reply, message):
+        # {author}, {mention} and {channel} are filled in; other braces are left as they are
+        placeholders = Placeholders(author=message.author.name, mention=message.author.mention, channel=getattr(message.channel, "name", None) or "DM")
+        try:
+            return reply.format_map(placeholders)
+        except (IndexError, ValueError):
+            return reply
+
+    def stats(self):
+        return {
+            "rules": len(self.ruleset.rules),
+            "file": self.rules_file,
+            "counters": {rule.id: self.counters.get(rule.id, {"hits": 0, "cooldown_skips": 0, "errors": 0, "last_hit": None}) for rule in self.ruleset.rules},
+        }
+
+    def close(self):
+        for task in list(self.tasks):
+            task.cancel()
@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from storage import MessageStore
+
+
+def build_match(query=None, channel_id=None, user_id=None):
+    # Turns free text into a safe FTS5 expression: every word is quoted, "word*" stays a prefix
+    # search, and channel/author filters become column filters so they use the index too.
+    parts = []
+    for word in re.findall(r'[^\s"]+\*?', query or ""):
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            parts.append(f'content:"{word}"' + ("*" if prefix else ""))
+    if channel_id:
+        parts.append(f'channel_id:"{int(channel_id)}"')
+    if user_id:
+        parts.append(f'user_id:"{int(user_id)}"')
+    return " AND ".join(parts)
+
+
+class SearchIndex(MessageStore):
+    # Full-text index over message history in BotData/<name>/search.db (SQLite FTS5). It is fed
+    # through the same batched writer as the message store, so indexing never blocks on_message.
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+            "content, channel_id, user_id, created_at UNINDEXED, tokenize='unicode61')"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.commit()
+        self.start()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _write_batch(self, batch):
+        conn = self._connect()
+        with conn:
+            self._insert(conn, batch)
+
+    def _insert(self, conn, records):
+        conn.executemany(
+            "INSERT INTO messages_fts (content, channel_id, user_id, created_at) VALUES (?, ?, ?, ?)",
+            [(r["content"] or "", str(r["channel_id"]), str(r["user_id"]), r["created_at"]) for r in records],
+        )
+
+    def _close_backend(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get_meta(self, key):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def build_from(self, store, mark, log=print):
+        # One-time import of history that predates the index. Everything stored after mark (the
+        # store's high-water mark when live indexing began), live or backfilled, is indexed as it is
+        # stored, so only records up to mark are copied. The position reached is saved in the same
+        # transaction as each chunk, so a build cut short resumes where it stopped without indexing
+        # anything twice; the first run's mark is kept for that.
+        if self.get_meta("built"):
+            return
+        saved_mark = self.get_meta("build_mark")
+        if saved_mark is None:
+            self.set_meta("build_mark", json.dumps(mark))
+        else:
+            mark = json.loads(saved_mark)
+        position = self.get_meta("build_position")
+        position = json.loads(position) if position else None
+        started = time.time()
+        count = 0
+        conn = self._connect()
+        for records, position in store.iter_upto(mark, position):
+            with conn:
+                self._insert(conn, records)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('build_position', ?)", (json.dumps(position),))
+            count += len(records)
+        self.set_meta("built", time.time())
+        log(f"Search index built from {count} stored messages in {time.time() - started:.1f}s")
+
+    def search(self, query=None, channel_id=None, user_id=None, page=0, page_size=50):
+        # Ranked by bm25 when there are keywords, newest first otherwise. Returns (results, has_more).
+        match = build_match(query, channel_id, user_id)
+        if not match:
+            return [], False
+        order = "bm25(messages_fts)" if query and query.strip() else "created_at DESC"
+        try:
+            rows = self._connect().execute(
+                "SELECT channel_id, user_id, content, created_at, "
+                "snippet(messages_fts, 0, '[', ']', '...', 12) "
+                f"FROM messages_fts WHERE messages_fts MATCH ? ORDER BY {order} LIMIT ? OFFSET ?",
+                (match, page_size + 1, page * page_size),
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return [], False  # Nothing searchable left in the query, e.g. only punctuation
+        results = [
+            {"channel_id": channel, "user_id": int(user) if user and user.isdigit() else user, "content": content, "created_at": created_at, "snippet": snippet}
+            for channel, user, content, created_at, snippet in rows[:page_size]
+        ]
+        return results, len(rows) > page_size
+
+
+def open_search_index(folder):
+    return SearchIndex(os.path.join(folder, "search.db"))
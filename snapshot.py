@@ -0,0 +1,41 @@
+import json
+import os
+import time
+
+from atomicfile import atomic_write_json
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_path(folder):
+    return os.path.join(folder, "snapshot.json")
+
+
+def save_snapshot(folder, servers, channels, dms):
+    # servers and dms are [(id, label), ...], channels is {guild_id: [(id, label), ...]}: the lists
+    # exactly as the GUI shows them, so the next launch can draw them before the bot connects.
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "servers": servers,
+        "channels": {str(guild_id): items for guild_id, items in channels.items()},
+        "dms": dms,
+    }
+    atomic_write_json(snapshot_path(folder), data, separators=(",", ":"))
+
+
+def load_snapshot(folder):
+    # The saved lists with ids as ints, or None if there is no usable snapshot
+    try:
+        with open(snapshot_path(folder), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        return None
+    return {
+        "saved_at": data.get("saved_at"),
+        "servers": [(int(item_id), label) for item_id, label in data.get("servers", [])],
+        "channels": {int(guild_id): [(int(item_id), label) for item_id, label in items] for guild_id, items in data.get("channels", {}).items()},
+        "dms": [(int(item_id), label) for item_id, label in data.get("dms", [])],
+    }
@@ -0,0 +1,667 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class StoreBacklogError(Exception):
+    pass
+
+
+class MessageStore:
+    # Base class for message storage engines. Writes are queued and committed
+    # in groups by a background thread, so save_message never blocks on disk and
+    # no record waits longer than max_latency seconds before hitting the disk.
+    # A batch that fails to write (disk full, database busy) goes back to the front
+    # of the queue and is retried with backoff; it only counts as committed once written.
+    MAX_RETRY_DELAY = 5.0
+    CLOSE_RETRIES = 5  # On close, attempts before unsaved records are given up
+    FLUSH_TIMEOUT = 10.0  # How long flush() waits for a writer that is stuck retrying
+
+    def __init__(self, batch_size=500, max_latency=0.05):
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._pending = []
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._committed = 0
+        self._closing = False
+        self._writer = None
+
+    def start(self):
+        self._writer = threading.Thread(target=self._writer_loop, name=f"{type(self).__name__}-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, channel_id, user_id, content, created_at=None, message_id=None):
+        record = {
+            "channel_id": str(channel_id),
+            "user_id": user_id,
+            "content": content,
+            "created_at": created_at if created_at is not None else time.time(),
+            "message_id": message_id,
+        }
+        with self._cond:
+            self._pending.append(record)
+            self._queued += 1
+            self._cond.notify_all()
+
+    def append_many(self, records):
+        with self._cond:
+            for record in records:
+                record = dict(record)
+                record["channel_id"] = str(record["channel_id"])
+                record.setdefault("created_at", time.time())
+                record.setdefault("message_id", None)
+                self._pending.append(record)
+                self._queued += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        # Waits for everything appended so far to be committed, at most timeout seconds
+        # (FLUSH_TIMEOUT by default). False means the writer is still behind.
+        with self._cond:
+            target = self._queued
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._committed >= target or self._writer is None, self.FLUSH_TIMEOUT if timeout is None else timeout)
+
+    def flush_or_raise(self):
+        if not self.flush():
+            raise StoreBacklogError(f"{self.backlog()} messages are still not written after {self.FLUSH_TIMEOUT:.0f}s: the writer is retrying a failing write")
+
+    def backlog(self):
+        # Records appended but not yet committed
+        return self._queued - self._committed
+
+    def close(self):
+        if self._writer is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._writer.join()
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()  # Wakes flush() callers if records were given up
+        self._close_backend()
+
+    def _writer_loop(self):
+        failures = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closing)
+                if not self._pending and self._closing:
+                    return
+                # Give the batch a chance to fill up, but never hold a record longer than max_latency
+                deadline = time.monotonic() + self.max_latency
+                while len(self._pending) < self.batch_size and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                failures += 1
+                with self._cond:
+                    if self._closing and failures >= self.CLOSE_RETRIES:
+                        print(f"Error writing messages: {e}. Giving up on {len(batch) + len(self._pending)} unsaved messages")
+                        self._pending = []
+                        return
+                    print(f"Error writing messages, retrying: {e}")
+                    self._pending[:0] = batch
+                    self._cond.wait_for(lambda: self._closing, min(self.MAX_RETRY_DELAY, 0.1 * 2 ** failures))
+                continue
+            failures = 0
+            with self._cond:
+                self._committed += len(batch)
+                self._cond.notify_all()
+
+    def load_all(self):
+        self.flush_or_raise()
+        messages = {}
+        for channel_id in self.channels():
+            messages[channel_id] = self.load_channel(channel_id)
+        return messages
+
+    def is_empty(self):
+        return not self.channels()
+
+    def existing_message_ids(self, channel_id, message_ids):
+        # Which of message_ids are already stored for channel_id. Backends with an index override this.
+        message_ids = set(message_ids)
+        return {r.get("message_id") for r in self.load_channel(channel_id)} & message_ids
+
+    def claim_unidentified(self, channel_id, records):
+        # Message IDs of the records that are already stored without one (see pair_unidentified).
+        # This generic version cannot write the IDs back, so a later lookup pairs them again;
+        # backends that can update rows in place override it.
+        history = self.load_channel(channel_id)
+        rows = [(i, r.get("user_id"), r.get("content"), r.get("created_at")) for i, r in enumerate(history) if r.get("message_id") is None]
+        first_timed = min((row[3] for row in rows if row[3] and row[3] > 0), default=None)
+        return set(pair_unidentified(rows, records, first_timed))
+
+    def iter_chunks(self, channel_id, since=None, until=None, chunk_size=5000):
+        # The channel's messages with since <= created_at < until, as lists of at most chunk_size
+        # records. Backends that can read part of a channel override this to keep memory bounded.
+        records = [r for r in self.load_channel(channel_id) if in_range(r.get("created_at"), since, until)]
+        for start in range(0, len(records), chunk_size):
+            yield records[start:start + chunk_size]
+
+    # Backend hooks
+    def channels(self):
+        raise NotImplementedError
+
+    def high_water_mark(self):
+        # A JSON-able position that every record stored so far is at or before
+        raise NotImplementedError
+
+    def iter_upto(self, mark, position=None, chunk_size=5000):
+        # Records of every channel stored up to mark, after position, in storage order, as
+        # (records, position) pairs; passing a pair's position back resumes after that chunk
+        raise NotImplementedError
+
+    def load_channel(self, channel_id):
+        raise NotImplementedError
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _close_backend(self):
+        pass
+
+
+class SQLiteMessageStore(MessageStore):
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "channel_id TEXT NOT NULL, "
+            "user_id INTEGER, "
+            "content TEXT, "
+            "created_at REAL)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+        if "message_id" not in columns:  # Stores created before backfill support
+            conn.execute("ALTER TABLE messages ADD COLUMN message_id INTEGER")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages (channel_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel_time ON messages (channel_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages (message_id)")
+        conn.commit()
+        self.start()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _write_batch(self, batch):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (channel_id, user_id, content, created_at, message_id) VALUES (?, ?, ?, ?, ?)",
+                [(r["channel_id"], r["user_id"], r["content"], r["created_at"], r.get("message_id")) for r in batch],
+            )
+
+    def channels(self):
+        rows = self._connect().execute("SELECT DISTINCT channel_id FROM messages").fetchall()
+        return [row[0] for row in rows]
+
+    def high_water_mark(self):
+        return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+
+    def iter_upto(self, mark, position=None, chunk_size=5000):
+        conn = self._connect()
+        position = position or 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, channel_id, user_id, content, created_at FROM messages WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                (position, mark, chunk_size),
+            ).fetchall()
+            if not rows:
+                return
+            position = rows[-1][0]
+            yield [
+                {"channel_id": channel_id, "user_id": user_id, "content": content, "created_at": created_at}
+                for _, channel_id, user_id, content, created_at in rows
+            ], position
+
+    def load_channel(self, channel_id):
+        # Ordered by time rather than insertion, so backfilled history lands before live messages
+        rows = self._connect().execute(
+            "SELECT user_id, content, created_at, message_id FROM messages WHERE channel_id = ? ORDER BY created_at, id",
+            (str(channel_id),),
+        ).fetchall()
+        return [
+            {"user_id": user_id, "content": content, "created_at": created_at, "message_id": message_id}
+            for user_id, content, created_at, message_id in rows
+        ]
+
+    def iter_chunks(self, channel_id, since=None, until=None, chunk_size=5000):
+        # Keyset pagination on (created_at, id): every chunk is a range scan of the channel/time
+        # index, and messages stored meanwhile (live or backfilled) never shift later pages.
+        # Uses its own connection, so an export thread does not leave one behind.
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA busy_timeout=5000")
+        try:
+            cursor = (float("-inf") if since is None else since, 0)
+            end = float("inf") if until is None else until
+            while True:
+                rows = conn.execute(
+                    "SELECT user_id, content, created_at, message_id, id FROM messages "
+                    "WHERE channel_id = ? AND (created_at, id) > (?, ?) AND created_at < ? ORDER BY created_at, id LIMIT ?",
+                    (str(channel_id), cursor[0], cursor[1], end, chunk_size),
+                ).fetchall()
+                if not rows:
+                    return
+                yield [
+                    {"user_id": user_id, "content": content, "created_at": created_at, "message_id": message_id}
+                    for user_id, content, created_at, message_id, _ in rows
+                ]
+                cursor = (rows[-1][2], rows[-1][4])
+        finally:
+            conn.close()
+
+    def claim_unidentified(self, channel_id, records):
+        # Pairs the records with rows stored without a message ID and writes the IDs into those
+        # rows, so every row is claimed once and later lookups find it by ID
+        times = [r["created_at"] for r in records if r.get("created_at")]
+        if not times:
+            return set()
+        conn = self._connect()
+        channel_id = str(channel_id)
+        first_timed = conn.execute("SELECT MIN(created_at) FROM messages WHERE channel_id = ? AND message_id IS NULL AND created_at > 0", (channel_id,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT id, user_id, content, created_at FROM messages WHERE message_id IS NULL AND channel_id = ? "
+            "AND (created_at IS NULL OR created_at <= 0 OR created_at BETWEEN ? AND ?)",
+            (channel_id, min(times) - UNIDENTIFIED_TOLERANCE, max(times) + UNIDENTIFIED_TOLERANCE),
+        ).fetchall()
+        claimed = pair_unidentified(rows, records, first_timed)
+        if claimed:
+            with conn:
+                conn.executemany("UPDATE messages SET message_id = ? WHERE id = ?", list(claimed.items()))
+        return set(claimed)
+
+    def existing_message_ids(self, channel_id, message_ids):
+        found = set()
+        message_ids = [m for m in message_ids if m is not None]
+        conn = self._connect()
+        for start in range(0, len(message_ids), 500):  # Stay under SQLite's bound-parameter limit
+            chunk = message_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT message_id FROM messages WHERE channel_id = ? AND message_id IN ({','.join('?' * len(chunk))})",
+                [str(channel_id)] + chunk,
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def _close_backend(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class SegmentedLogStore(MessageStore):
+    # Append-only JSON-lines log, one directory per channel, rolled into a new
+    # segment file every segment_size bytes. A torn last line from a crash is
+    # skipped when reading.
+    def __init__(self, folder, segment_size=4 * 1024 * 1024, fsync=True, **kwargs):
+        super().__init__(**kwargs)
+        self.folder = folder
+        self.segment_size = segment_size
+        self.fsync = fsync
+        # channel_id -> (stored message IDs, {key: row} of rows stored without one, key counter),
+        # built from the segments the first time backfill asks about the channel and kept up to
+        # date by _write_batch, so each backfill batch is a set lookup instead of a channel read
+        self._id_index = {}
+        self._index_lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+        self.start()
+
+    def _channel_folder(self, channel_id):
+        return os.path.join(self.folder, str(channel_id))
+
+    def _segments(self, channel_id):
+        folder = self._channel_folder(channel_id)
+        try:
+            names = sorted(name for name in os.listdir(folder) if name.endswith(".log"))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(folder, name) for name in names]
+
+    def _active_segment(self, channel_id):
+        segments = self._segments(channel_id)
+        if segments and os.path.getsize(segments[-1]) < self.segment_size:
+            return segments[-1]
+        folder = self._channel_folder(channel_id)
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f"{len(segments) + 1:08d}.log")
+
+    def _write_batch(self, batch):
+        by_channel = {}
+        for record in batch:
+            by_channel.setdefault(record["channel_id"], []).append(record)
+        with self._index_lock:  # An index being built must not miss or double count these
+            for channel_id, records in by_channel.items():
+                lines = "".join(
+                    json.dumps({"user_id": r["user_id"], "content": r["content"], "created_at": r["created_at"], "message_id": r.get("message_id")}) + "\n"
+                    for r in records
+                )
+                with open(self._active_segment(channel_id), "a", encoding="utf-8") as f:
+                    f.write(lines)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                if channel_id in self._id_index:
+                    for record in records:
+                        self._index_record(self._id_index[channel_id], record)
+
+    def _index_record(self, index, record):
+        ids, unidentified, keys = index
+        if record.get("message_id") is not None:
+            ids.add(record["message_id"])
+        else:
+            unidentified[next(keys)] = (record.get("user_id"), record.get("content"), record.get("created_at"))
+
+    def _channel_index(self, channel_id):
+        # Call with _index_lock held
+        channel_id = str(channel_id)
+        index = self._id_index.get(channel_id)
+        if index is None:
+            index = (set(), {}, itertools.count())
+            for segment in self._segments(channel_id):
+                with open(segment, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            self._index_record(index, json.loads(line))
+                        except ValueError:
+                            pass  # Torn write at the end of a segment
+            self._id_index[channel_id] = index
+        return index
+
+    def existing_message_ids(self, channel_id, message_ids):
+        with self._index_lock:
+            ids = self._channel_index(channel_id)[0]
+            return ids & set(message_ids)
+
+    def claim_unidentified(self, channel_id, records):
+        # The log cannot be rewritten, so claimed rows are only marked in the index: a rerun after
+        # a restart pairs them again and gets the same answer
+        with self._index_lock:
+            ids, unidentified, _ = self._channel_index(channel_id)
+            rows = [(key, *row) for key, row in unidentified.items()]
+            first_timed = min((row[3] for row in rows if row[3] and row[3] > 0), default=None)
+            claimed = pair_unidentified(rows, records, first_timed)
+            for message_id, key in claimed.items():
+                del unidentified[key]
+                ids.add(message_id)
+            return set(claimed)
+
+    def channels(self):
+        try:
+            return [name for name in os.listdir(self.folder) if os.path.isdir(self._channel_folder(name))]
+        except FileNotFoundError:
+            return []
+
+    def high_water_mark(self):
+        # {channel_id: [segment count, size of the last segment]}
+        mark = {}
+        for channel_id in self.channels():
+            segments = self._segments(channel_id)
+            if segments:
+                mark[channel_id] = [len(segments), os.path.getsize(segments[-1])]
+        return mark
+
+    def iter_upto(self, mark, position=None, chunk_size=5000):
+        # position is [channel_id, segment number, byte offset]; channels are read in sorted order
+        start_channel, start_segment, start_offset = position or (None, 0, 0)
+        chunk = []
+        for channel_id in sorted(mark):
+            if start_channel is not None and channel_id < start_channel:
+                continue
+            resuming = channel_id == start_channel
+            count, last_size = mark[channel_id]
+            for index, segment in enumerate(self._segments(channel_id)[:count]):
+                if resuming and index < start_segment:
+                    continue
+                end = last_size if index == count - 1 else None
+                with open(segment, "rb") as f:
+                    f.seek(start_offset if resuming and index == start_segment else 0)
+                    while end is None or f.tell() < end:
+                        line = f.readline()
+                        if not line.endswith(b"\n"):
+                            break  # End of the segment, or a torn write
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        record["channel_id"] = channel_id
+                        chunk.append(record)
+                        if len(chunk) >= chunk_size:
+                            yield chunk, [channel_id, index, f.tell()]
+                            chunk = []
+                    here = [channel_id, index, f.tell()]
+        if chunk:
+            yield chunk, here
+
+    def load_channel(self, channel_id):
+        messages = []
+        for segment in self._segments(channel_id):
+            with open(segment, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        messages.append(json.loads(line))
+                    except ValueError:
+                        pass  # Torn write at the end of a segment
+        messages.sort(key=lambda r: r.get("created_at") or 0)  # Backfilled history is appended out of order
+        return messages
+
+    def iter_chunks(self, channel_id, since=None, until=None, chunk_size=5000):
+        # Streams the segments line by line. Sorting would need the whole channel in memory,
+        # so records come in the order they were written (backfilled history last).
+        chunk = []
+        for segment in self._segments(channel_id):
+            with open(segment, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write at the end of a segment
+                    if in_range(record.get("created_at"), since, until):
+                        chunk.append(record)
+                        if len(chunk) >= chunk_size:
+                            yield chunk
+                            chunk = []
+        if chunk:
+            yield chunk
+
+
+class ChannelHistoryCache:
+    # In-memory view of message history that loads one channel at a time from the
+    # store and evicts the least recently used channels once max_bytes is exceeded.
+    # Channels are read from disk without holding the lock, so a slow load (on the Tk
+    # thread) never holds up append() for other channels on the bot loop.
+    RECORD_OVERHEAD = 120  # Rough per-message cost of the dict, ints and list slot
+
+    def __init__(self, store, max_bytes=64 * 1024 * 1024):
+        self.store = store
+        self.max_bytes = max_bytes
+        self._channels = OrderedDict()
+        self._sizes = {}
+        self._loading = {}  # channel_id -> records appended while it is read from disk
+        self._lock = threading.RLock()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _record_size(self, record):
+        return self.RECORD_OVERHEAD + len(record.get("content") or "")
+
+    def _load(self, channel_id):
+        with self._lock:
+            history = self._channels.get(channel_id)
+            if history is not None:
+                self.hits += 1
+                self._channels.move_to_end(channel_id)
+                return history
+            self.misses += 1
+            self._loading.setdefault(channel_id, [])
+        flushed = self.store.flush()
+        history = self.store.load_channel(channel_id)
+        with self._lock:
+            resident = self._channels.get(channel_id)
+            if resident is not None:  # Another thread loaded it meanwhile
+                return resident
+            if not flushed:
+                # The writer is stuck: serve what is on disk, but don't keep it, so the next
+                # access tries again instead of caching history with a gap
+                self._loading.pop(channel_id, None)
+                print(f"Channel {channel_id} loaded without its {self.store.backlog()} unwritten messages")
+                return history
+            # Records appended during the read may or may not have been committed before it;
+            # they are the newest, so the ones it already has are at the end
+            appended = self._loading.pop(channel_id, [])
+            tail = history[-len(appended):] if appended else []
+            history.extend(record for record in appended if record not in tail)
+            self._channels[channel_id] = history
+            self._sizes[channel_id] = sum(self._record_size(r) for r in history)
+            self.resident_bytes += self._sizes[channel_id]
+            self._evict()
+            return history
+
+    def _evict(self):
+        # The most recently used channel always stays resident, even if it alone is over budget
+        while self.resident_bytes > self.max_bytes and len(self._channels) > 1:
+            channel_id, _ = self._channels.popitem(last=False)
+            self.resident_bytes -= self._sizes.pop(channel_id)
+            self.evictions += 1
+
+    def get(self, channel_id, default=None):
+        history = self._load(str(channel_id))
+        return history if history else default
+
+    def __getitem__(self, channel_id):
+        return self._load(str(channel_id))
+
+    def invalidate(self, channel_id):
+        # Drops a channel so the next access reloads it from the store
+        with self._lock:
+            channel_id = str(channel_id)
+            if channel_id in self._channels:
+                del self._channels[channel_id]
+                self.resident_bytes -= self._sizes.pop(channel_id)
+
+    def __contains__(self, channel_id):
+        return bool(self._load(str(channel_id)))
+
+    def append(self, channel_id, record):
+        with self._lock:
+            channel_id = str(channel_id)
+            history = self._channels.get(channel_id)
+            if history is None:
+                if channel_id in self._loading:
+                    self._loading[channel_id].append(record)
+                return  # Not resident: the record is in the store and comes back with the next load
+            self._channels.move_to_end(channel_id)
+            history.append(record)
+            size = self._record_size(record)
+            self._sizes[channel_id] += size
+            self.resident_bytes += size
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "resident_channels": len(self._channels),
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+UNIDENTIFIED_TOLERANCE = 120  # Seconds; rows without a message ID were stamped when received, not when sent
+
+
+def pair_unidentified(rows, records, first_timed):
+    # History stored before message IDs were (live messages, messages.json imports) has rows
+    # (key, user_id, content, created_at) without one. A fetched record is the same message as
+    # such a row if author and content match and the row was stamped within UNIDENTIFIED_TOLERANCE
+    # of it, or, for rows imported without a time, if the record is older than the first timed
+    # row without an ID (the bot only stamped messages after those imports). Each row pairs with
+    # one record at most. Returns {message_id: row key}.
+    candidates = {}
+    for key, user_id, content, created_at in sorted(rows, key=lambda row: row[3] or 0):
+        candidates.setdefault((str(user_id), content), []).append((key, created_at))
+    claimed = {}
+    for record in records:
+        created_at = record.get("created_at") or 0
+        found = candidates.get((str(record.get("user_id")), record.get("content")))
+        if not found or record.get("message_id") is None:
+            continue
+        for i, (key, stored_at) in enumerate(found):
+            if stored_at and stored_at > 0:
+                same = abs(stored_at - created_at) <= UNIDENTIFIED_TOLERANCE
+            else:
+                same = first_timed is None or created_at < first_timed
+            if same:
+                claimed[record["message_id"]] = key
+                del found[i]
+                break
+    return claimed
+
+
+def in_range(created_at, since, until):
+    created_at = created_at or 0
+    return (since is None or created_at >= since) and (until is None or created_at < until)
+
+
+STORAGE_BACKENDS = {
+    "sqlite": lambda folder: SQLiteMessageStore(os.path.join(folder, "messages.db")),
+    "log": lambda folder: SegmentedLogStore(os.path.join(folder, "messages")),
+}
+
+
+def open_message_store(folder, backend="sqlite", migrate=True):
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    store = STORAGE_BACKENDS[backend](folder)
+    if migrate:
+        migrate_legacy_messages(store, os.path.join(folder, "messages.json"))
+    return store
+
+
+def migrate_legacy_messages(store, legacy_file):
+    # Imports an old whole-file messages.json dump once, then renames it so it is not imported again
+    if not os.path.exists(legacy_file):
+        return 0
+    with open(legacy_file, "r") as f:
+        legacy = json.load(f)
+    count = 0
+    for channel_id, messages in legacy.items():
+        store.append_many(
+            {"channel_id": channel_id, "user_id": msg.get("user_id"), "content": msg.get("content"), "created_at": msg.get("created_at", 0)}
+            for msg in messages
+        )
+        count += len(messages)
+    store.flush_or_raise()  # Renamed only once it is all on disk
+    os.replace(legacy_file, legacy_file + ".migrated")
+    return count
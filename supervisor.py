@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+
+from metrics import monitor_loop_lag
+
+
+def submit(loop, coro, timeout=None):
+    # Schedules coro on loop from any thread and returns a concurrent Future. Cancelling the
+    # future cancels the coroutine; with a timeout it is cancelled on the loop when time runs out.
+    if timeout is not None:
+        coro = asyncio.wait_for(coro, timeout)
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+class BotHandle:
+    def __init__(self, name, bot):
+        self.name = name
+        self.bot = bot
+        self.task = None
+        self.started_at = time.time()
+        self.error = None
+
+    def status(self):
+        if self.error:
+            return "failed"
+        if self.task is None:
+            return "starting"
+        if self.task.done():
+            return "stopped"
+        if self.bot.is_closed():
+            return "stopping"
+        if self.bot.is_ready():
+            return "ready"
+        return "starting"
+
+    def health(self):
+        status = self.status()
+        ready = status == "ready"
+        return {
+            "name": self.name,
+            "status": status,
+            "error": self.error,
+            "latency_ms": round(self.bot.latency * 1000) if ready and self.bot.latency == self.bot.latency else None,  # NaN before the first heartbeat
+            "guilds": len(self.bot.guilds) if ready else 0,
+            "uptime": time.time() - self.started_at,
+            "shards": self.bot.shard_status() if status in ("starting", "ready") else [],
+        }
+
+
+class BotSupervisor:
+    # Runs any number of FriendBot instances as tasks on one event loop in a background
+    # thread, so each extra bot costs a client and its caches rather than a whole process.
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.new_event_loop()
+        self.handles = {}  # name -> BotHandle
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run_loop, name="bot-loop", daemon=True)
+            self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.create_task(monitor_loop_lag())
+        self.loop.run_forever()
+
+    def start_bot(self, name, bot):
+        if self.is_running(name):
+            raise ValueError(f"Bot {name} is already running")
+        self.start()
+        handle = BotHandle(name, bot)
+        self.handles[name] = handle
+        self.submit(self._launch(handle))
+        return handle
+
+    def submit(self, coro, timeout=None):
+        self.start()
+        return submit(self.loop, coro, timeout)
+
+    async def _launch(self, handle):
+        import discord  # Not at module level: the GUI imports this before any bot is started
+        handle.task = asyncio.current_task()
+        bot = handle.bot
+        try:
+            await bot.start(bot.token)
+        except discord.LoginFailure:
+            handle.error = "Invalid token"
+            bot.log_message("Invalid token provided.")
+        except Exception as e:
+            handle.error = str(e)
+            bot.log_message(f"Error running bot: {e}")
+        finally:
+            if not bot.is_closed():
+                await bot.close()
+
+    def stop_bot(self, name):
+        handle = self.handles.get(name)
+        if handle is None:
+            return None
+        return self.submit(handle.bot.close())
+
+    def is_running(self, name):
+        handle = self.handles.get(name)
+        return handle is not None and handle.status() in ("starting", "ready")
+
+    def get(self, name):
+        handle = self.handles.get(name)
+        return handle.bot if handle else None
+
+    def health(self):
+        return [handle.health() for handle in self.handles.values()]
+
+    def stop_all(self, timeout=10):
+        futures = [self.stop_bot(name) for name in list(self.handles) if self.is_running(name)]
+        for future in futures:
+            try:
+                future.result(timeout)
+            except Exception as e:
+                print(f"Error stopping bot: {e}")
+
+    def shutdown(self, timeout=10):
+        # Closes every bot, cancels whatever else is still running on the loop, then stops the
+        # loop and joins its thread. Safe to call more than once.
+        if self.thread is None:
+            return
+        self.stop_all(timeout)
+        try:
+            self.submit(self._cancel_tasks()).result(timeout)
+        except Exception as e:
+            print(f"Error cancelling tasks: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.loop.close()
+        self.thread = None
+
+    async def _cancel_tasks(self):
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.loop.shutdown_asyncgens()
+        await self.loop.shutdown_default_executor()
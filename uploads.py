@@ -0,0 +1,162 @@
+import asyncio
+import io
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import discord
+
+from ratelimit import retry_after_from, is_global_limit
+
+DEFAULT_FILESIZE_LIMIT = 10 * 1024 * 1024  # Discord's limit outside boosted guilds
+
+
+class AttachmentError(Exception):
+    pass
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def prepare_file(path):
+    return PreparedFile(path, read_file(path))
+
+
+class PreparedFile:
+    # File contents read once off the event loop. Every send attempt wraps the same bytes in a
+    # fresh discord.File, so retries and sends to several channels never go back to the disk.
+    def __init__(self, path, data):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.data = data
+
+    def to_discord_file(self):
+        return discord.File(io.BytesIO(self.data), filename=self.filename)
+
+
+class AttachmentUploader:
+    def __init__(self, max_files=10, max_concurrent_uploads=3, max_workers=4, retries=3, cache_bytes=64 * 1024 * 1024):
+        self.max_files = max_files
+        self.retries = retries
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="attachment-reader")
+        self.upload_slots = None
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()  # (path, size, mtime) -> PreparedFile
+        self._reading = {}  # (path, size, mtime) -> Future of a read in progress, shared by concurrent sends
+        self._cached_bytes = 0
+
+    def size_limit(self, channel):
+        guild = getattr(channel, "guild", None)
+        return getattr(guild, "filesize_limit", None) or DEFAULT_FILESIZE_LIMIT
+
+    def validate(self, paths, limit):
+        # Fails fast, before anything is read or sent. Returns the stat of every file.
+        if len(paths) > self.max_files:
+            raise AttachmentError(f"Cannot attach more than {self.max_files} files.")
+        stats = []
+        total = 0
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                raise AttachmentError(f"Cannot read {path}: {e.strerror}")
+            if stat.st_size > limit:
+                raise AttachmentError(f"{os.path.basename(path)} is {stat.st_size // 1024} KiB, over the {limit // 1024} KiB limit.")
+            total += stat.st_size
+            stats.append(stat)
+        if total > limit:
+            raise AttachmentError(f"Attachments total {total // 1024} KiB, over the {limit // 1024} KiB limit.")
+        return stats
+
+    async def prepare(self, paths, stats, progress=None):
+        loop = asyncio.get_running_loop()
+
+        async def prepare_one(path, stat):
+            key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+            prepared = self._cache.get(key)
+            if prepared is not None:
+                self._cache.move_to_end(key)
+                self.report(progress, path, "ready", stat.st_size)
+                return prepared
+            reading = self._reading.get(key)
+            if reading is None:
+                self.report(progress, path, "reading", stat.st_size)
+                reading = self._reading[key] = loop.run_in_executor(self.executor, prepare_file, path)
+                reading.add_done_callback(lambda future: self.finish_read(key, future))
+            prepared = await asyncio.shield(reading)  # One cancelled send must not cancel the others' read
+            self.report(progress, path, "ready", len(prepared.data))
+            return prepared
+
+        return await asyncio.gather(*(prepare_one(path, stat) for path, stat in zip(paths, stats)))
+
+    def finish_read(self, key, future):
+        self._reading.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self.remember(key, future.result())
+
+    def remember(self, key, prepared):
+        self._cache[key] = prepared
+        self._cached_bytes += len(prepared.data)
+        while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted.data)
+
+    def report(self, progress, path, state, detail=None):
+        if progress:
+            try:
+                progress(path, state, detail)
+            except Exception as e:
+                print(f"Error reporting upload progress: {e}")
+
+    async def send(self, channel, content, paths=None, progress=None, limiter=None, route=None):
+        # With a limiter, every attempt takes a token for route first and a 429 blocks that bucket
+        # for as long as Discord asks, so concurrent senders back off together.
+        paths = list(paths or [])
+        stats = self.validate(paths, self.size_limit(channel))
+        if self.upload_slots is None:
+            self.upload_slots = asyncio.Semaphore(self.max_concurrent_uploads)
+        prepared = await self.prepare(paths, stats, progress)
+
+        for attempt in range(self.retries + 1):
+            if limiter:
+                await limiter.acquire(route)  # Waited for outside the upload slots, so text-only sends are not held up
+            files = [p.to_discord_file() for p in prepared]
+            for path in paths:
+                self.report(progress, path, "uploading", attempt + 1)
+            try:
+                started = time.monotonic()
+                if files:
+                    async with self.upload_slots:
+                        message = await channel.send(content=content, files=files)
+                else:
+                    message = await channel.send(content=content, files=files)
+                for path in paths:
+                    self.report(progress, path, "sent", time.monotonic() - started)
+                return message
+            except discord.HTTPException as e:
+                if e.status < 500 and e.status != 429 or attempt == self.retries:
+                    raise
+                error = e
+                if limiter and e.status == 429:
+                    limiter.block(route, retry_after_from(e), is_global=is_global_limit(e))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                error = e
+            finally:
+                for f in files:
+                    f.close()
+            for path in paths:
+                self.report(progress, path, "retrying", str(error))
+            if not (limiter and getattr(error, "status", None) == 429):  # The blocked bucket already waits
+                await asyncio.sleep(2 ** attempt)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self._cache.clear()
+        self._cached_bytes = 0
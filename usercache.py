@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+import discord
+
+
+class UserCache:
+    # Shared user lookup for the GUI and the bot. Entries expire after ttl seconds and the
+    # least recently used ones are dropped past max_size. Users that don't exist are
+    # remembered for missing_ttl seconds so they aren't fetched again on every render.
+    MISSING = object()
+
+    def __init__(self, bot, max_size=10000, ttl=600, missing_ttl=60, concurrency=8):
+        self.bot = bot
+        self.max_size = max_size
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.concurrency = concurrency
+        self._entries = OrderedDict()  # user_id -> (user or MISSING, expires_at)
+        self._lock = threading.Lock()
+        self._in_flight = {}  # user_id -> Future, only touched on the bot loop
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def _lookup(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+    def _store(self, user_id, user, ttl):
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, user_id):
+        # Non-blocking lookup from any thread: cache, then the gateway's user cache. Never hits REST.
+        user_id = int(user_id)
+        user = self._lookup(user_id)
+        if user is not None:
+            self.hits += 1
+            return None if user is self.MISSING else user
+        self.misses += 1
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            self._store(user_id, user, self.ttl)
+        return user
+
+    def known(self, user_id):
+        return self._lookup(int(user_id)) is not None or self.bot.get_user(int(user_id)) is not None
+
+    async def fetch(self, user_id, limiter=None):
+        # Like get(), but falls back to fetch_user. Concurrent calls for the same ID share one request.
+        # Returns None if the user doesn't exist.
+        user_id = int(user_id)
+        user = self.get(user_id)
+        if user is not None or self._lookup(user_id) is self.MISSING:
+            return user
+        future = self._in_flight.get(user_id)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[user_id] = future
+        try:
+            if limiter:
+                await limiter.acquire("fetch_user")
+            self.fetches += 1
+            try:
+                user = await self.bot.fetch_user(user_id)
+                self._store(user_id, user, self.ttl)
+            except discord.NotFound:
+                user = None
+                self._store(user_id, self.MISSING, self.missing_ttl)
+            future.set_result(user)
+            return user
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._in_flight[user_id]
+
+    async def prefetch(self, user_ids, limiter=None):
+        # Resolves every unknown ID in one pass with bounded concurrency; returns how many were fetched
+        unknown = [user_id for user_id in dict.fromkeys(int(u) for u in user_ids) if not self.known(user_id)]
+        if not unknown:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_one(user_id):
+            async with semaphore:
+                try:
+                    await self.fetch(user_id, limiter)
+                except discord.HTTPException as e:
+                    print(f"Error fetching user {user_id}: {e}")
+
+        await asyncio.gather(*(fetch_one(user_id) for user_id in unknown))
+        return len(unknown)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "fetches": self.fetches,
+            "in_flight": len(self._in_flight),
+        }